@@ -0,0 +1,126 @@
+"""
+벤치마크 스크립트 공용 도우미 (bench_cpu.py / bench_precision.py / bench_pose_parity.py)
+- prepare_env: server 임포트 전 환경 설정 (사전 로드/컴파일 없음)
+- load_images / timed / compare: 샘플 로드, 워밍업 + 중앙값 측정, 기준 ↔ 최적화 실행 비교
+- optimized_copy / reset_text_cache: fp32 기준 모델은 그대로 두고 복제본에만 최적화 적용
+- mask_iou / keypoint_delta / box_match: 정확도 지표
+torch는 server가 먼저 임포트하도록 (컴파일 캐시 환경변수) 여기서는 필요할 때만 임포트
+"""
+import copy
+import os
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_IMAGES = "ryan_test_images"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def prepare_env(**overrides):
+    """server 임포트 전 호출: 사전 로드/컴파일 끔 + 스크립트별 환경변수 덮어쓰기"""
+    os.environ["PRELOAD_MODELS"] = ""
+    os.environ["TORCH_COMPILE"] = "0"
+    os.environ.setdefault("SERVER_LOG", os.devnull)
+    for key, value in overrides.items():
+        os.environ[key] = value
+
+
+def load_images(paths, limit: int):
+    """파일/폴더 목록 → [(이름, RGB 이미지)] (최대 limit장)"""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files += sorted(f for f in p.iterdir() if f.suffix.lower() in IMAGE_SUFFIXES)
+        else:
+            files.append(p)
+    return [(f.name, Image.open(f).convert("RGB")) for f in files[:limit]]
+
+
+def timed(fn, runs: int, device: str = "cpu"):
+    """워밍업 1회 + runs회 실행 → (마지막 결과, 중앙값 초, CUDA면 추가 최대 할당 MB)"""
+    cuda = device == "cuda"
+    if cuda:
+        import torch
+    out = fn()
+    times = []
+    peak = 0.0
+    for _ in range(runs):
+        if cuda:
+            base = torch.cuda.memory_allocated()
+            torch.cuda.reset_peak_memory_stats()
+            torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        out = fn()
+        if cuda:
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - t0)
+        if cuda:
+            peak = max(peak, (torch.cuda.max_memory_allocated() - base) / 1e6)
+    return out, statistics.median(times), peak
+
+
+def compare(ref_fn, opt_fn, runs: int, device: str = "cpu"):
+    """기준 / 최적화 실행을 같은 조건으로 측정 → (기준 결과, 최적화 결과, {fp32_s, opt_s, fp32_peak, opt_peak})"""
+    ref, t_ref, p_ref = timed(ref_fn, runs, device)
+    out, t_opt, p_opt = timed(opt_fn, runs, device)
+    return ref, out, {"fp32_s": t_ref, "opt_s": t_opt, "fp32_peak": p_ref, "opt_peak": p_opt}
+
+
+def optimized_copy(model, apply):
+    """fp32 모델 복제본에 apply 적용 → apply 반환값 (기준 모델은 변경 없음)"""
+    return apply(copy.deepcopy(model))
+
+
+def reset_text_cache(model):
+    """DINO 텍스트 인코더 캐시 비우기 — 다른 모델이 채운 텍스트 특징 재사용 / 반복 실행 캐시 적중 방지"""
+    import server
+
+    backbone = getattr(getattr(model, "model", model), "text_backbone", None)
+    if isinstance(backbone, server.CachedTextBackbone):
+        backbone.cache = server.LRUCache(maxsize=server.DINO_TEXT_CACHE_SIZE)
+
+
+def speedup(ref_s: float, opt_s: float) -> str:
+    return f"{ref_s / max(opt_s, 1e-9):.2f}배"
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def keypoint_delta(kp_ref, sc_ref, kp, sc):
+    """→ (키포인트 평균 거리 px, 점수 최대 차이)"""
+    return float(np.linalg.norm(kp_ref - kp, axis=-1).mean()), float(np.abs(sc_ref - sc).max())
+
+
+def box_match(bx_ref, sc_ref, bx_opt, sc_opt):
+    """기준 박스마다 IoU 최대 박스 매칭 → (IoU 목록, 점수 차이 목록)"""
+    import server
+
+    ious, deltas = [], []
+    for box, score in zip(bx_ref, sc_ref):
+        if len(bx_opt) == 0:
+            ious.append(0.0)
+            continue
+        candidates = server._box_iou(box, bx_opt)
+        j = int(np.argmax(candidates))
+        ious.append(float(candidates[j]))
+        deltas.append(abs(float(score) - float(sc_opt[j])))
+    return ious, deltas
+
+
+def format_accuracy(acc: dict) -> str:
+    return ", ".join(f"{k} {v:.4f}" if isinstance(v, float) else f"{k} {v}" for k, v in acc.items())
+
+
+def selected(benches: dict, spec: str):
+    """콤마 구분 모델 목록 중 알려진 이름만 (모르는 이름은 경고)"""
+    for name in [m.strip() for m in spec.split(",") if m.strip()]:
+        if name in benches:
+            yield name
+        else:
+            print(f"⚠️ 알 수 없는 모델: {name}")
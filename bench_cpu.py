@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+CPU 추론 프로파일 벤치마크
+BiRefNet / ViTPose / Grounding DINO 를 CPU fp32(기준)와 CPU 프로파일(bf16 autocast, 동적 int8, channels_last)로
+각각 실행해 지연 시간과 fp32 대비 정확도 차이를 비교.
+
+사용법:
+    python bench_cpu.py                                   # 전체 모델, 기본 테스트 이미지
+    python bench_cpu.py --models birefnet,vitpose --runs 10 --image photo.jpg
+    CPU_THREADS=8 python bench_cpu.py                     # 스레드 수 지정
+
+정확도 지표:
+    birefnet: 마스크 평균 절대 오차(MAE, 0~1) / 0.5 이진화 IoU
+    vitpose:  키포인트 평균 거리(px) / 점수 최대 차이
+    gdino:    박스 매칭 IoU 평균 / 점수 최대 차이 / 감지 수
+"""
+import argparse
+import os
+import sys
+
+import bench_common as bench
+
+# server 임포트 전 설정: CPU 고정, 로더는 fp32 그대로 (프로파일은 아래에서 복제본에만 적용)
+bench.prepare_env(FORCE_CPU="1", CPU_PROFILE="0")
+os.environ.setdefault("CPU_INT8", "1")     # 서버 기본은 OFF — 벤치에서는 켜고 fp32 대비 차이를 측정
+os.environ.setdefault("CPU_BF16", "auto")
+
+import numpy as np
+import torch
+from PIL import Image
+
+import server
+
+DEFAULT_IMAGE = f"{bench.DEFAULT_IMAGES}/2_토마토.jpeg"
+
+
+def set_profile(enabled: bool):
+    """server 전역 CPU 프로파일 토글 (run_birefnet 등 실행 경로에서 참조)"""
+    server.CPU_PROFILE = enabled
+
+
+def optimized_copy(model, profile_fn):
+    set_profile(True)
+    try:
+        return bench.optimized_copy(model, profile_fn)
+    finally:
+        set_profile(False)
+
+
+def bench_birefnet(image: Image.Image, runs: int) -> dict:
+    model = server.get_birefnet_model("portrait")
+    opt = optimized_copy(model, server.cpu_profile_birefnet)
+    w, h = image.size
+    scale = 1024 / max(w, h)
+    resized = image.resize(((int(w * scale) // 32) * 32, (int(h * scale) // 32) * 32), Image.Resampling.LANCZOS)
+    x = server.transform_normalize(resized).unsqueeze(0)
+
+    def run(m, profile):
+        set_profile(profile)
+        try:
+            return server.run_birefnet(m, x)[0, 0].float().numpy()
+        finally:
+            set_profile(False)
+
+    ref, out, stats = bench.compare(lambda: run(model, False), lambda: run(opt, True), runs)
+    return {**stats, "accuracy": {"mae": float(np.abs(ref - out).mean()),
+                                  "iou@0.5": bench.mask_iou(ref > 0.5, out > 0.5)}}
+
+
+def bench_vitpose(image: Image.Image, runs: int) -> dict:
+    model, processor = server.load_vitpose_model("vitpose")
+    opt = optimized_copy(model, server.cpu_profile_vitpose)
+    boxes = [[[0, 0, image.width, image.height]]]
+    inputs = processor(images=image, boxes=boxes, return_tensors="pt")
+    if "dataset_index" not in inputs:
+        inputs["dataset_index"] = torch.zeros(inputs["pixel_values"].shape[0], dtype=torch.long)
+
+    def run(m):
+        with torch.no_grad():
+            outputs = m(**inputs)
+        res = processor.post_process_pose_estimation(outputs, boxes=boxes)[0][0]
+        return res["keypoints"].numpy(), res["scores"].numpy()
+
+    (kp_ref, sc_ref), (kp_opt, sc_opt), stats = bench.compare(lambda: run(model), lambda: run(opt), runs)
+    keypoint_px, score_delta = bench.keypoint_delta(kp_ref, sc_ref, kp_opt, sc_opt)
+    return {**stats, "accuracy": {"keypoint_px": keypoint_px, "score_max_delta": score_delta}}
+
+
+def bench_gdino(image: Image.Image, runs: int, prompt: str = "a child.") -> dict:
+    model, processor = server.get_gdino_model()
+    opt = optimized_copy(model, server.cpu_profile_dino)
+    inputs = processor(images=image, text=prompt, return_tensors="pt")
+
+    def run(m):
+        # 텍스트 인코더 캐시를 비워 매 실행 텍스트 인코딩 포함 (양자화 대상이므로)
+        bench.reset_text_cache(m)
+        with torch.no_grad():
+            outputs = m(**inputs)
+        res = processor.post_process_grounded_object_detection(
+            outputs, inputs.input_ids, threshold=0.25, text_threshold=0.25,
+            target_sizes=[image.size[::-1]])[0]
+        return res["boxes"].numpy(), res["scores"].numpy()
+
+    (bx_ref, sc_ref), (bx_opt, sc_opt), stats = bench.compare(lambda: run(model), lambda: run(opt), runs)
+    ious, deltas = bench.box_match(bx_ref, sc_ref, bx_opt, sc_opt)
+    return {
+        **stats,
+        "accuracy": {"box_iou": float(np.mean(ious)) if ious else 1.0,
+                     "score_max_delta": max(deltas) if deltas else 0.0,
+                     "detections": f"{len(bx_ref)} → {len(bx_opt)}"},
+    }
+
+
+BENCHES = {"birefnet": bench_birefnet, "vitpose": bench_vitpose, "gdino": bench_gdino}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU 추론 프로파일 벤치마크 (fp32 대비)")
+    parser.add_argument("--image", default=DEFAULT_IMAGE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--models", default=",".join(BENCHES), help=f"콤마 구분 — {', '.join(BENCHES)}")
+    args = parser.parse_args()
+
+    server.apply_cpu_threads()
+    image = Image.open(args.image).convert("RGB")
+    print(f"🖼️ {args.image} ({image.width}x{image.height}), runs={args.runs}, "
+          f"threads={torch.get_num_threads()}, bf16={'ON' if server.CPU_BF16 else 'OFF'}")
+    failed = False
+    for name in bench.selected(BENCHES, args.models):
+        try:
+            r = BENCHES[name](image, args.runs)
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            failed = True
+            continue
+        print(f"📊 {name:9s} fp32 {r['fp32_s'] * 1000:8.1f}ms → profile {r['opt_s'] * 1000:8.1f}ms "
+              f"({bench.speedup(r['fp32_s'], r['opt_s'])}) | {bench.format_accuracy(r['accuracy'])}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+ViTPose 배치 파이프라인(VITPOSE_PIPELINE=batched) ↔ transformers processor 경로 parity 검사
+같은 모델·같은 박스로 두 경로를 실행해 키포인트 거리(px)와 점수 차이, 지연 시간을 비교.
+batched 경로는 크롭 전 평균 풀링 축소(VITPOSE_PRESHRINK) 켬/끔 두 가지로 실행 → 축소 단계의 영향 분리.
+
+사용법:
+    python bench_pose_parity.py                                  # 기본 샘플 폴더, 전체 프레임 박스
+    python bench_pose_parity.py --images photo1.jpg --runs 5 --model vitpose-huge
+
+허용치 초과 시 종료 코드 1 (키포인트 평균 거리 --tolerance px, 기본 2.0)
+"""
+import argparse
+import statistics
+import sys
+
+import bench_common as bench
+
+# server 임포트 전 설정: 두 경로 모두 fp32
+bench.prepare_env(MODEL_PRECISION="")
+
+import server
+
+
+def run_pipeline(model, processor, image, boxes, pipeline: str, preshrink: bool, runs: int):
+    """지정 파이프라인으로 estimate_poses 실행 → (keypoints, scores, 중앙값 초)"""
+    server.VITPOSE_PIPELINE = pipeline
+    server.VITPOSE_PRESHRINK = preshrink
+    out, t, _ = bench.timed(lambda: server.estimate_poses(model, processor, image, boxes), runs, server.device)
+    return out[0], out[1], t
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ViTPose 배치 파이프라인 ↔ processor parity 검사")
+    parser.add_argument("--images", nargs="+", default=[bench.DEFAULT_IMAGES], help="이미지 파일 또는 폴더")
+    parser.add_argument("--limit", type=int, default=8, help="최대 이미지 수")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default="vitpose", help="vitpose | vitpose-huge")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="키포인트 평균 거리 허용치 (px)")
+    args = parser.parse_args()
+
+    images = bench.load_images(args.images, args.limit)
+    if not images:
+        print(f"❌ 이미지 없음: {' '.join(args.images)}")
+        sys.exit(1)
+    model, processor = server.load_vitpose_model(args.model, "torch")
+    print(f"🖼️ 샘플 {len(images)}장, runs={args.runs}, model={args.model}, device={server.device}")
+
+    results = {True: [], False: []}  # preshrink → [(거리 px, 점수 차이, batched 초, processor 초)]
+    for name, image in images:
+        boxes = [[0, 0, image.width, image.height]]
+        kp_ref, sc_ref, t_ref = run_pipeline(model, processor, image, boxes, "processor", False, args.runs)
+        for preshrink in (False, True):
+            kp, sc, t = run_pipeline(model, processor, image, boxes, "batched", preshrink, args.runs)
+            dist, delta = bench.keypoint_delta(kp_ref, sc_ref, kp, sc)
+            results[preshrink].append((dist, delta, t, t_ref))
+            print(f"   {name:30s} preshrink={'on ' if preshrink else 'off'} 거리 {dist:6.3f}px | "
+                  f"{t_ref * 1000:7.1f}ms → {t * 1000:7.1f}ms")
+
+    failed = False
+    for preshrink, rows in results.items():
+        dist = statistics.mean(r[0] for r in rows)
+        passed = dist <= args.tolerance
+        failed |= not passed
+        print(f"{'✅' if passed else '❌'} batched (preshrink {'on' if preshrink else 'off'}) vs processor: "
+              f"키포인트 평균 {dist:.3f}px, 최대 {max(r[0] for r in rows):.3f}px, "
+              f"점수 최대 차이 {max(r[1] for r in rows):.4f}, "
+              f"processor {statistics.mean(r[3] for r in rows) * 1000:.1f}ms → batched {statistics.mean(r[2] for r in rows) * 1000:.1f}ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+모델별 정밀도 정책(MODEL_PRECISION) 오프라인 parity 검사
+SAM2 / Grounding DINO(tiny, base) / MM-DINO / ViTPose 를 fp32(기준)와 지정 정책(fp16, bf16, autocast)으로
+샘플 이미지 세트에 실행해 박스·키포인트·마스크 차이, 지연 시간, 메모리를 비교.
+
+사용법:
+    python bench_precision.py                                        # 전체 모델 autocast, 기본 샘플 폴더
+    python bench_precision.py --precision "sam2=autocast,gdino=fp16,vitpose=fp16" --runs 5
+    python bench_precision.py --models gdino,vitpose --images photo1.jpg photo2.jpg
+
+정확도 지표 (이미지 평균, 허용치 초과 시 종료 코드 1):
+    gdino/mmdino/gdino-base: 박스 매칭 IoU 평균 / 점수 최대 차이 / 감지 수
+    vitpose:                 키포인트 평균 거리(px) / 점수 최대 차이
+    sam2:                    중앙 포인트 프롬프트 마스크 IoU / 점수 최대 차이
+메모리: 가중치 MB, CUDA면 추론 중 추가 최대 할당(activation peak) MB
+"""
+import argparse
+import statistics
+import sys
+
+import bench_common as bench
+
+# server 임포트 전 설정: 로더는 fp32 그대로 (정책은 아래에서 복제본에만 적용)
+bench.prepare_env(MODEL_PRECISION="", CPU_PROFILE="0")
+
+import numpy as np
+import torch
+
+import server
+
+# 허용치: 박스/마스크 IoU 하한, 키포인트 거리 상한(px)
+TOLERANCE = {"box_iou": 0.9, "mask_iou": 0.95, "keypoint_px": 4.0}
+
+
+def weights_mb(model) -> float:
+    return server._tensor_bytes(list(model.parameters()) + list(model.buffers())) / 1e6
+
+
+def precision_copy(model, name: str, policy: str, **kwargs):
+    """fp32 모델 복제본에 정책 적용 → (복제본, 적용된 정책)"""
+    return bench.optimized_copy(model, lambda m: (m, server.apply_model_precision(m, name, policy, **kwargs)))
+
+
+def summarize(model, opt, per_image: list, accuracy: dict) -> dict:
+    return {
+        "fp32_s": statistics.mean(r["fp32_s"] for r in per_image),
+        "opt_s": statistics.mean(r["opt_s"] for r in per_image),
+        "fp32_mb": weights_mb(model), "opt_mb": weights_mb(opt),
+        "fp32_peak_mb": max(r["fp32_peak"] for r in per_image),
+        "opt_peak_mb": max(r["opt_peak"] for r in per_image),
+        "accuracy": accuracy,
+    }
+
+
+def bench_dino(name: str, loader, images, runs: int, policy: str, prompt: str = "a child. a person."):
+    model, processor = loader()
+    opt, applied = precision_copy(model, name, policy)
+    if applied == "fp32":
+        return applied, None
+    # 복제본 텍스트 캐시 비우기 (fp32 모델이 채운 텍스트 특징을 재사용하지 않도록)
+    bench.reset_text_cache(opt)
+
+    per_image, ious, deltas, counts = [], [], [], []
+    for image in images:
+        inputs = {k: v.to(server.device) for k, v in processor(images=image, text=prompt, return_tensors="pt").items()}
+
+        def run(m):
+            with torch.no_grad():
+                outputs = m(**inputs)
+            res = processor.post_process_grounded_object_detection(
+                outputs, inputs["input_ids"], threshold=0.25, text_threshold=0.25,
+                target_sizes=[image.size[::-1]])[0]
+            return res["boxes"].cpu().numpy(), res["scores"].cpu().numpy()
+
+        (bx_ref, sc_ref), (bx_opt, sc_opt), stats = bench.compare(
+            lambda: run(model), lambda: run(opt), runs, server.device)
+        per_image.append(stats)
+        counts.append(f"{len(bx_ref)}→{len(bx_opt)}")
+        image_ious, image_deltas = bench.box_match(bx_ref, sc_ref, bx_opt, sc_opt)
+        ious += image_ious
+        deltas += image_deltas
+
+    box_iou = float(np.mean(ious)) if ious else 1.0
+    return applied, summarize(model, opt, per_image, {
+        "box_iou": box_iou, "score_max_delta": max(deltas) if deltas else 0.0,
+        "detections": " ".join(counts), "pass": box_iou >= TOLERANCE["box_iou"],
+    })
+
+
+def bench_vitpose(images, runs: int, policy: str):
+    model, processor = server.load_vitpose_model("vitpose", "torch")
+    opt, applied = precision_copy(model, "vitpose", policy)
+    if applied == "fp32":
+        return applied, None
+
+    def run(m, image):
+        param = next(m.parameters())
+        pixel_values, centers, sizes = server.crop_person_batch(
+            image, [[0, 0, image.width, image.height]], processor, param.device, param.dtype)
+        dataset_index = torch.zeros(pixel_values.shape[0], dtype=torch.long, device=pixel_values.device)
+        with torch.no_grad():
+            heatmaps = m(pixel_values=pixel_values, dataset_index=dataset_index).heatmaps
+        kps, scores = server.decode_heatmaps(heatmaps, centers, sizes)
+        return kps[0], scores[0]
+
+    per_image, dists, deltas = [], [], []
+    for image in images:
+        (kp_ref, sc_ref), (kp_opt, sc_opt), stats = bench.compare(
+            lambda: run(model, image), lambda: run(opt, image), runs, server.device)
+        per_image.append(stats)
+        dist, delta = bench.keypoint_delta(kp_ref, sc_ref, kp_opt, sc_opt)
+        dists.append(dist)
+        deltas.append(delta)
+
+    keypoint_px = float(np.mean(dists))
+    return applied, summarize(model, opt, per_image, {
+        "keypoint_px": keypoint_px, "score_max_delta": max(deltas),
+        "pass": keypoint_px <= TOLERANCE["keypoint_px"],
+    })
+
+
+def bench_sam2(images, runs: int, policy: str):
+    sam2 = server.load_stack("sam2")
+    # 임베딩 캐시 없는 predictor (매 실행 이미지 인코더 포함)
+    ref = sam2.SAM2ImagePredictor(server.get_sam2_predictor().model)
+    opt_model, applied = precision_copy(ref.model, "sam2", policy,
+                                        modules=server.SAM2_PRECISION_MODULES, keep_outputs=server.SAM2_HALF_OUTPUTS)
+    if applied == "fp32":
+        return applied, None
+    opt = sam2.SAM2ImagePredictor(opt_model)
+
+    def run(predictor, arr):
+        h, w = arr.shape[:2]
+        with torch.no_grad():
+            predictor.set_image(arr)
+            masks, scores, _ = predictor.predict(
+                point_coords=np.array([[w / 2, h / 2]]), point_labels=np.array([1]), multimask_output=False)
+        return masks[0] > 0, float(scores[0])
+
+    per_image, ious, deltas = [], [], []
+    for image in images:
+        arr = np.asarray(image)
+        (m_ref, s_ref), (m_opt, s_opt), stats = bench.compare(
+            lambda: run(ref, arr), lambda: run(opt, arr), runs, server.device)
+        per_image.append(stats)
+        ious.append(bench.mask_iou(m_ref, m_opt))
+        deltas.append(abs(s_ref - s_opt))
+
+    mask_iou = float(np.mean(ious))
+    return applied, summarize(ref.model, opt_model, per_image, {
+        "mask_iou": mask_iou, "score_max_delta": max(deltas), "pass": mask_iou >= TOLERANCE["mask_iou"],
+    })
+
+
+BENCHES = {
+    "gdino": lambda images, runs, policy: bench_dino("gdino", server.get_gdino_model, images, runs, policy),
+    "gdino-base": lambda images, runs, policy: bench_dino("gdino-base", server.get_gdino_base_model, images, runs, policy),
+    "mmdino": lambda images, runs, policy: bench_dino("mmdino", server.get_mmdino_model, images, runs, policy),
+    "vitpose": bench_vitpose,
+    "sam2": bench_sam2,
+}
+
+
+def parse_precision(spec: str) -> dict:
+    """'autocast' (전체) 또는 'sam2=autocast,gdino=fp16' (모델별)"""
+    if "=" not in spec:
+        return {name: spec.strip() for name in BENCHES}
+    return {k.strip(): v.strip() for k, _, v in (p.partition("=") for p in spec.split(",")) if k.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="모델별 정밀도 정책 parity 검사 (fp32 대비 정확도/속도/메모리)")
+    parser.add_argument("--images", nargs="+", default=[bench.DEFAULT_IMAGES], help="이미지 파일 또는 폴더")
+    parser.add_argument("--limit", type=int, default=8, help="최대 이미지 수")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--models", default=",".join(BENCHES), help=f"콤마 구분 — {', '.join(BENCHES)}")
+    parser.add_argument("--precision", default="autocast", help="정책 (fp16|bf16|autocast) 또는 모델별 'sam2=autocast,gdino=fp16'")
+    args = parser.parse_args()
+
+    images = bench.load_images(args.images, args.limit)
+    if not images:
+        print(f"❌ 이미지 없음: {' '.join(args.images)}")
+        sys.exit(1)
+    policies = parse_precision(args.precision)
+    print(f"🖼️ 샘플 {len(images)}장 ({', '.join(n for n, _ in images)}), runs={args.runs}, device={server.device}")
+    samples = [img for _, img in images]
+
+    failed = False
+    for name in bench.selected(BENCHES, args.models):
+        policy = policies.get(name, "fp32")
+        if policy not in server.PRECISION_POLICIES:
+            print(f"⚠️ {name}: 알 수 없는 정책 {policy}")
+            continue
+        if policy == "fp32":
+            print(f"⏭️ {name}: fp32 — 비교 생략")
+            continue
+        try:
+            applied, r = BENCHES[name](samples, args.runs, policy)
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            failed = True
+            continue
+        finally:
+            server.clear_gpu_memory()
+        if r is None:
+            print(f"⏭️ {name}: {policy} → {server.device}에서 fp32로 대체 — 비교 생략")
+            continue
+        acc = r["accuracy"]
+        passed = acc.pop("pass")
+        failed |= not passed
+        peak = f" | peak {r['fp32_peak_mb']:.0f}→{r['opt_peak_mb']:.0f}MB" if server.device == "cuda" else ""
+        print(f"{'✅' if passed else '❌'} {name:10s} {applied:8s} "
+              f"fp32 {r['fp32_s'] * 1000:8.1f}ms → {r['opt_s'] * 1000:8.1f}ms ({bench.speedup(r['fp32_s'], r['opt_s'])}) | "
+              f"가중치 {r['fp32_mb']:.0f}→{r['opt_mb']:.0f}MB{peak} | {bench.format_accuracy(acc)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
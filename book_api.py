@@ -0,0 +1,256 @@
+"""
+Ryan Book 자동화 API (책 스펙 생성 / 조사 미리보기 / 인쇄 요청)
+torch·모델 스택을 임포트하지 않는 라우터 — server.py가 include_router로 포함하고,
+책 전용 CPU 노드는 SERVER_PROFILE=book 으로 이 모듈만 띄워 1초 이내에 시작.
+
+사용법:
+    SERVER_PROFILE=book python server.py      # 또는 python book_api.py
+"""
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import List, Optional
+
+_boot_start = time.perf_counter()
+import_profile = {}  # 컴포넌트 -> 임포트 소요 시간(초)
+
+_t = time.perf_counter()
+from fastapi import APIRouter, FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import_profile["fastapi"] = time.perf_counter() - _t
+
+# Ryan Engine 임포트
+sys.path.insert(0, str(Path(__file__).parent))
+try:
+    _t = time.perf_counter()
+    from ryan_engine import JosaUtils, BookGenerator
+    import_profile["ryan_engine"] = time.perf_counter() - _t
+    RYAN_ENGINE_AVAILABLE = True
+    print("✅ Ryan Engine 로드 완료")
+except ImportError as e:
+    RYAN_ENGINE_AVAILABLE = False
+    print(f"⚠️ Ryan Engine 로드 실패: {e}")
+
+router = APIRouter()
+
+class ChildData(BaseModel):
+    firstName: str
+    lastName: str = ""
+    fullName: str = ""
+    gender: str = "boy"
+    birthday: Optional[str] = None
+    photo: Optional[str] = None
+    photoNoBg: Optional[str] = None
+
+class FavoriteObject(BaseModel):
+    name: str
+    photo: Optional[str] = None
+    photoNoBg: Optional[str] = None
+    emoji: str = "❓"
+    josaMode: str = "friend"
+
+class FamilyMember(BaseModel):
+    id: str
+    relation: str
+    emoji: str
+    photo: Optional[str] = None
+    customName: Optional[str] = None
+
+class BookRequest(BaseModel):
+    child: ChildData
+    objects: List[FavoriteObject] = []
+    familyMembers: List[FamilyMember] = []
+
+@router.get("/josa-preview")
+async def josa_preview(name: str = Query(..., min_length=1, description="조사를 적용할 이름")):
+    """
+    한글 조사 미리보기 API
+
+    이름을 입력하면 9가지 조사 형태의 예시를 반환합니다.
+    프론트엔드에서 실시간 조사 미리보기에 사용됩니다.
+    """
+    if not RYAN_ENGINE_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Ryan Engine을 사용할 수 없습니다.")
+
+    josa = JosaUtils()
+    demo = josa.generate_josa_demo(name)
+
+    return JSONResponse(content={
+        "success": True,
+        "name": demo['name'],
+        "hasBatchim": demo['has_batchim'],
+        "examples": demo['examples']
+    })
+
+@router.post("/generate-book")
+async def generate_book(request: BookRequest):
+    """
+    Ryan Book 자동 생성 API
+
+    사용자 데이터를 받아 완전한 책 스펙(final_book_spec.json)을 생성합니다.
+
+    요청 예시:
+    {
+        "child": {
+            "firstName": "도현",
+            "lastName": "김",
+            "gender": "boy"
+        },
+        "objects": [
+            {"name": "토끼", "emoji": "🐰", "josaMode": "friend"},
+            {"name": "토마토", "emoji": "🍅", "josaMode": "object"}
+        ],
+        "familyMembers": [
+            {"id": "mom", "relation": "엄마", "emoji": "👩"}
+        ]
+    }
+    """
+    if not RYAN_ENGINE_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Ryan Engine을 사용할 수 없습니다.")
+
+    print("-" * 40)
+    print(f"📚 책 생성 요청: {request.child.firstName}")
+    start_time = time.time()
+
+    try:
+        # 테마 파일 경로
+        theme_path = Path(__file__).parent / "ryan_engine" / "themes" / "theme_ryan.json"
+
+        if not theme_path.exists():
+            raise HTTPException(status_code=500, detail="테마 파일을 찾을 수 없습니다.")
+
+        # BookGenerator 생성
+        generator = BookGenerator(str(theme_path))
+
+        # 요청 데이터를 딕셔너리로 변환
+        user_data = {
+            'child': request.child.model_dump(),
+            'objects': [obj.model_dump() for obj in request.objects],
+            'familyMembers': [fam.model_dump() for fam in request.familyMembers],
+        }
+
+        # 책 생성
+        book_spec = generator.generate_from_dict(user_data)
+
+        # JSON 변환
+        book_json = generator.to_json(book_spec)
+
+        # 파일로 저장 (선택적)
+        output_dir = Path(__file__).parent / "output"
+        output_dir.mkdir(exist_ok=True)
+        safe_name = re.sub(r'[^a-zA-Z0-9가-힣_\-]', '_', request.child.firstName)
+        output_path = output_dir / f"book_{safe_name}_{int(time.time())}.json"
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(book_json)
+
+        print(f"✅ 책 생성 완료! 파일: {output_path}")
+        print(f"⚡ 소요시간: {time.time() - start_time:.2f}초")
+        print("-" * 40)
+
+        return JSONResponse(content={
+            "success": True,
+            "bookSpec": json.loads(book_json),
+            "savedTo": str(output_path)
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ 책 생성 오류: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"책 생성 중 오류가 발생했습니다: {str(e)}"
+        )
+
+# ========== 인쇄 요청 API ==========
+
+class PrintRequest(BaseModel):
+    firstName: str
+    parentNames: str = ""
+    version: str = "A"
+    bookId: str = ""
+    timestamp: str = ""
+
+@router.post("/request-print")
+async def request_print(request: PrintRequest):
+    """인쇄 요청 접수 (북토리 연동은 추후)"""
+    print("-" * 40)
+    print(f"🖨️ 인쇄 요청 접수: {request.firstName} (버전: {request.version}, bookId: {request.bookId})")
+    print(f"   시각: {request.timestamp}")
+    print("-" * 40)
+
+    return JSONResponse(content={
+        "success": True,
+        "message": "인쇄 요청이 접수되었습니다.",
+        "bookId": request.bookId,
+    })
+
+
+# ========== 책 전용 노드 (SERVER_PROFILE=book) ==========
+
+def create_book_app() -> FastAPI:
+    """책 API만 제공하는 앱 (torch/모델 없음). /health는 라우터 폴링 형식과 호환"""
+    from fastapi.middleware.cors import CORSMiddleware
+
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["Content-Type"],
+    )
+    app.include_router(router)
+    stats = {"in_flight": 0, "requests_served": 0}
+
+    @app.middleware("http")
+    async def count_requests(request, call_next):
+        if request.url.path == "/health":
+            return await call_next(request)
+        stats["in_flight"] += 1
+        try:
+            return await call_next(request)
+        finally:
+            stats["in_flight"] -= 1
+            stats["requests_served"] += 1
+
+    boot_seconds = time.perf_counter() - _boot_start
+    print(f"⏱️ 부팅 프로파일 (book, 총 {boot_seconds:.2f}초):")
+    for name, seconds in sorted(import_profile.items(), key=lambda kv: -kv[1]):
+        print(f"   {name:<22} {seconds:6.2f}초")
+
+    @app.get("/health")
+    async def health_check():
+        return JSONResponse(content={
+            "status": "ok",
+            "role": "book",
+            "device": None,
+            "ryan_engine": RYAN_ENGINE_AVAILABLE,
+            "loaded_models": [],
+            "warm_detectors": [],
+            "in_flight": stats["in_flight"],
+            "requests_served": stats["requests_served"],
+            "boot_seconds": round(boot_seconds, 3),
+            "import_profile": {k: round(v, 3) for k, v in import_profile.items()},
+        })
+
+    return app
+
+
+def main():
+    import uvicorn
+    port = int(os.environ.get("PORT", 5001))
+    workers = int(os.environ.get("WORKERS", 1))
+    print(f"📚 책 전용 서버 시작 (torch 미사용, 포트 {port})")
+    uvicorn.run("book_api:create_book_app", factory=True, host="0.0.0.0", port=port, workers=workers,
+                timeout_keep_alive=120)
+
+
+if __name__ == "__main__":
+    main()
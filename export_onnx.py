@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+ONNX 내보내기 + 출력 일치(parity) 검사 도구
+server.py 의 ONNX Runtime 백엔드(MODEL_BACKENDS / ?backend=onnx)용 모델 파일 생성.
+
+- BiRefNet (portrait, hr-matting): 입력 높이/너비 동적 축으로 내보내기
+  → 서버에서 BIREFNET_BUCKETING=1이면 요청을 shape 버킷으로 패딩해 ORT 세션이 버킷 shape만 보게 됨
+- ViTPose-base: 배치 동적 축 (pixel_values, dataset_index → heatmaps)
+- --int8: onnxruntime 동적 int8 양자화본(<이름>.int8.onnx) 추가 생성 (서버에서 ONNX_INT8=1로 사용)
+- --check: torch(CPU fp32) 대비 ORT 출력 차이 검사, 허용치 초과 시 종료 코드 1
+  그래프 최적화(ORT_ENABLE_ALL)는 서버 세션 생성 시 적용되며, 검사도 같은 설정으로 실행
+
+사용법:
+    python export_onnx.py                        # 전체 내보내기 + 검사
+    python export_onnx.py birefnet:portrait --int8
+    python export_onnx.py --check-only           # 기존 파일 검사만
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from prepare_models import MODEL_SOURCES, load_source_model
+
+ONNX_DIR = Path("./models/_onnx")
+EXPORT_TARGETS = ["birefnet:portrait", "birefnet:hr-matting", "vitpose:vitpose"]
+
+# parity 허용치: (평균 절대 오차, 최대 절대 오차) — BiRefNet은 sigmoid 마스크, ViTPose는 heatmap 기준
+TOLERANCE = {"fp32": (1e-3, 5e-2), "int8": (2e-2, 0.5)}
+
+# BiRefNet 검사 shape (server.py 기본 버킷 일부: 가로/세로/정사각)
+BIREFNET_CHECK_SHAPES = [(1024, 1024), (1024, 768), (768, 1024)]
+
+
+def onnx_path(name: str, int8: bool = False) -> Path:
+    return ONNX_DIR / f"{name.replace(':', '__')}{'.int8' if int8 else ''}.onnx"
+
+
+def load_torch_model(name: str):
+    import torch
+    loader, source, _ = MODEL_SOURCES[name]
+    model = load_source_model(loader, source).float().eval()
+
+    if loader == "birefnet":
+        class BiRefNetLogits(torch.nn.Module):
+            """마지막 예측 logits만 출력 (server.birefnet_forward 와 동일)"""
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, pixel_values):
+                return self.inner(pixel_values)[-1]
+        return BiRefNetLogits(model)
+
+    class VitPoseHeatmaps(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, pixel_values, dataset_index):
+            return self.inner(pixel_values=pixel_values, dataset_index=dataset_index).heatmaps
+    return VitPoseHeatmaps(model)
+
+
+def sample_inputs(name: str, shape=None):
+    """검사/트레이싱 입력 (고정 시드)"""
+    import torch
+    g = torch.Generator().manual_seed(0)
+    if name.startswith("birefnet"):
+        w, h = shape or (1024, 1024)
+        return {"pixel_values": torch.randn(1, 3, h, w, generator=g)}
+    return {"pixel_values": torch.randn(2, 3, 256, 192, generator=g),
+            "dataset_index": torch.zeros(2, dtype=torch.long)}
+
+
+def export(name: str, model, opset: int):
+    import torch
+    inputs = sample_inputs(name)
+    out = onnx_path(name)
+    if name.startswith("birefnet"):
+        dynamic_axes = {"pixel_values": {2: "height", 3: "width"}, "logits": {2: "height", 3: "width"}}
+        output_names = ["logits"]
+    else:
+        dynamic_axes = {"pixel_values": {0: "batch"}, "dataset_index": {0: "batch"}, "heatmaps": {0: "batch"}}
+        output_names = ["heatmaps"]
+    t0 = time.time()
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(inputs.values()), str(out),
+            input_names=list(inputs), output_names=output_names,
+            dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True,
+        )
+    print(f"   ✅ {out} ({out.stat().st_size / 1e6:.1f}MB, opset {opset}, {time.time() - t0:.1f}초)")
+
+
+def quantize_int8(name: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    src, dst = onnx_path(name), onnx_path(name, int8=True)
+    quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+    print(f"   ✅ {dst} ({dst.stat().st_size / 1e6:.1f}MB, int8)")
+
+
+def ort_session(path: Path):
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(str(path), sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+def check(name: str, model, int8: bool) -> bool:
+    """torch vs ORT 출력 비교 (BiRefNet: 버킷 shape별 sigmoid 마스크, ViTPose: heatmap)"""
+    import torch
+    path = onnx_path(name, int8)
+    if not path.exists():
+        print(f"   ⚠️ {path.name} 없음 — 검사 생략")
+        return True
+    session = ort_session(path)
+    mean_tol, max_tol = TOLERANCE["int8" if int8 else "fp32"]
+    shapes = BIREFNET_CHECK_SHAPES if name.startswith("birefnet") else [None]
+    ok = True
+    for shape in shapes:
+        inputs = sample_inputs(name, shape)
+        with torch.no_grad():
+            ref = model(*inputs.values()).numpy()
+        out = session.run(None, {k: v.numpy() for k, v in inputs.items()})[0]
+        if name.startswith("birefnet"):
+            ref, out = 1 / (1 + np.exp(-ref)), 1 / (1 + np.exp(-out))
+        diff = np.abs(ref - out)
+        passed = diff.mean() <= mean_tol and diff.max() <= max_tol
+        ok &= passed
+        label = f"{shape[0]}x{shape[1]}" if shape else "batch 2"
+        print(f"   {'✅' if passed else '❌'} {path.name} [{label}] 평균 오차 {diff.mean():.2e} (허용 {mean_tol:.0e}), "
+              f"최대 {diff.max():.2e} (허용 {max_tol:.0e})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX 내보내기 + torch 대비 parity 검사")
+    parser.add_argument("models", nargs="*", help=f"대상 (기본: 전체) — {', '.join(EXPORT_TARGETS)}")
+    parser.add_argument("--int8", action="store_true", help="동적 int8 양자화본도 생성/검사")
+    parser.add_argument("--opset", type=int, default=19, help="ONNX opset (BiRefNet deform_conv2d는 19 이상 필요)")
+    parser.add_argument("--check-only", action="store_true", help="내보내기 없이 기존 파일 검사만")
+    parser.add_argument("--no-check", action="store_true", help="parity 검사 생략")
+    args = parser.parse_args()
+
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    ok = True
+    for name in args.models or EXPORT_TARGETS:
+        if name not in EXPORT_TARGETS:
+            print(f"⚠️ 지원하지 않는 모델: {name}")
+            continue
+        print(f"📂 {name} 로딩 중...")
+        model = load_torch_model(name)
+        try:
+            if not args.check_only:
+                export(name, model, args.opset)
+                if args.int8:
+                    quantize_int8(name)
+            if not args.no_check:
+                ok &= check(name, model, int8=False)
+                if args.int8:
+                    ok &= check(name, model, int8=True)
+        except Exception as e:
+            print(f"   ❌ {name} 실패: {e}")
+            ok = False
+
+    print(f"\n{'✅ 완료' if ok else '❌ 일부 실패'} — {ONNX_DIR}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
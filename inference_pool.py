@@ -0,0 +1,285 @@
+"""
+추론 워커 프로세스 풀
+API 프로세스(업로드 파싱/디코드/WebP 인코드)와 추론 프로세스(모델 보유)를 분리.
+
+- 워커는 spawn으로 시작, SERVER_ROLE=worker 로 server.py 를 임포트해 모델 사전 로드
+- 이미지/마스크 픽셀은 multiprocessing.shared_memory 로 전달 (파이프에는 메타데이터만 → pickle 복사 없음)
+- 워커가 죽으면 자동 재시작, 진행 중 요청은 새 워커에서 1회 재시도 → API 연결은 유지
+- 워커별 intra-op 스레드 = 물리 코어 수 / 워커 수 (CPU_THREADS 전달, 직접 지정 시 그 값) → 코어 과다 구독 방지
+- /remove-bg 외 모델 엔드포인트는 HTTP 요청을 그대로 워커에 전달 → 워커가 자기 app(ASGI)으로 처리 후 응답 반환
+- 워커 사망/시간 초과는 RuntimeError (API → 503), 요청 처리 중 예외는 JobError (단일 프로세스와 같은 500)
+
+사용법:
+    INFERENCE_PROCS=2 python server.py
+"""
+import os
+import sys
+import asyncio
+import queue
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+# 워커 응답 대기 최대 시간 (초) — 초과 시 워커를 죽이고 재시작
+JOB_TIMEOUT = float(os.environ.get("INFERENCE_JOB_TIMEOUT", 300))
+
+
+# 워커 spawn 시 환경변수 임시 변경 보호 (자식은 start() 시점의 os.environ 을 상속)
+_spawn_lock = threading.Lock()
+
+
+def _server_module():
+    """
+    server 모듈 반환 (임포트 시 PRELOAD_MODELS 로드/워밍업).
+    spawn 자식은 부모의 메인 스크립트를 __mp_main__ 으로 이미 실행하므로 server.py 면 재사용 (모델 이중 로드 방지)
+    """
+    main = sys.modules.get("__mp_main__")
+    if main is not None and hasattr(main, "segment_mask"):
+        return main
+    import server
+    return server
+
+
+def _physical_cores() -> int:
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    except ImportError:
+        return os.cpu_count() or 1
+
+
+class JobError(Exception):
+    """워커는 정상이지만 요청 처리 중 예외 (잘못된 입력 등) — 재시도/재시작 대상 아님"""
+
+
+async def _asgi_request(app, job: dict, body: bytes) -> dict:
+    """API 프로세스가 받은 HTTP 요청을 워커의 app에 그대로 실행 → 상태/헤더/본문"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": job["method"], "scheme": "http", "path": job["path"], "raw_path": job["path"].encode(),
+        "query_string": job["query"], "root_path": "", "headers": job["headers"],
+        "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 0),
+    }
+    received = False
+    reply = {}
+    chunks = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Future()  # 연결 유지 (끊김 감지는 API 프로세스 몫)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            reply["status"] = message["status"]
+            reply["headers"] = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # Starlette는 500 응답을 보낸 뒤 예외를 다시 던짐 → 응답이 나갔으면 그대로 전달
+        if "status" not in reply:
+            raise
+    reply["body"] = b"".join(chunks)
+    return reply
+
+
+def _worker_main(conn, slot: int):
+    """워커 프로세스 진입점: 모델 로드 후 작업 루프"""
+    server = _server_module()
+    threads = int(os.environ.get("CPU_THREADS", 0))
+    if threads:
+        server.torch.set_num_threads(threads)
+    loop = asyncio.new_event_loop()  # HTTP 전달 작업용 (워커당 1개 재사용)
+
+    print(f"🔧 추론 워커 {slot} 준비 (pid {os.getpid()}, 스레드 {threads or server.torch.get_num_threads()})")
+    conn.send({"ready": True, "pid": os.getpid()})
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        shm_in = shm_out = None
+        try:
+            shm_in = shared_memory.SharedMemory(name=job["in"])
+            if job.get("kind") == "http":
+                start = time.time()
+                reply = loop.run_until_complete(_asgi_request(server.app, job, bytes(shm_in.buf[:job["size"]])))
+                conn.send({"ok": True, "seconds": time.time() - start, **reply})
+                continue
+            shm_out = shared_memory.SharedMemory(name=job["out"])
+            h, w = job["shape"]
+            image = Image.fromarray(np.ndarray((h, w, 3), dtype=np.uint8, buffer=shm_in.buf).copy(), "RGB")
+            start = time.time()
+            mask = server.segment_mask(image, job["model"], job["max_size"], job["roi"], job.get("backend", "torch"))
+            out = np.ndarray((h, w), dtype=np.uint8, buffer=shm_out.buf)
+            out[:] = np.asarray(mask.convert("L"))
+            conn.send({"ok": True, "seconds": time.time() - start})
+        except Exception as e:
+            conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            for shm in (shm_in, shm_out):
+                if shm is not None:
+                    shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, slot: int, threads: int):
+        self.slot = slot
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, slot), daemon=True,
+                                   name=f"inference-{slot}")
+        overrides = {"SERVER_ROLE": "worker", "CPU_THREADS": str(threads)}
+        with _spawn_lock:
+            saved = {k: os.environ.get(k) for k in overrides}
+            os.environ.update(overrides)
+            try:
+                self.process.start()
+            finally:
+                for k, v in saved.items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+        child_conn.close()
+        self.ready = False
+        self.jobs = 0
+        self.started = time.time()
+
+    def wait_ready(self, timeout=None) -> bool:
+        if self.ready:
+            return True
+        if self.conn.poll(timeout):
+            msg = self.conn.recv()
+            self.ready = bool(msg.get("ready"))
+        return self.ready
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class InferencePool:
+    """고정 크기 추론 워커 풀 (스레드 안전, asyncio.to_thread 에서 호출)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.threads = int(os.environ.get("CPU_THREADS", 0)) or max(1, _physical_cores() // size)
+        self._ctx = mp.get_context("spawn")
+        self._workers = {}
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def start(self):
+        print(f"🏭 추론 워커 {self.size}개 시작 중... (워커당 스레드 {self.threads})")
+        for slot in range(self.size):
+            self._workers[slot] = _Worker(self._ctx, slot, self.threads)
+        for slot, worker in self._workers.items():
+            if worker.wait_ready(JOB_TIMEOUT):
+                print(f"   ↳ 워커 {slot} 준비 완료 (pid {worker.process.pid}, {time.time() - worker.started:.1f}초)")
+            else:
+                print(f"   ⚠️ 워커 {slot} 준비 지연 — 첫 요청 시 재확인")
+            self._idle.put(slot)
+
+    def shutdown(self):
+        for worker in self._workers.values():
+            worker.stop()
+        self._workers.clear()
+
+    def _respawn(self, slot: int):
+        with self._lock:
+            old = self._workers.get(slot)
+            if old is not None:
+                if old.process.is_alive():
+                    old.process.kill()
+                old.conn.close()
+            self._workers[slot] = _Worker(self._ctx, slot, self.threads)
+            self.restarts += 1
+        print(f"♻️ 추론 워커 {slot} 재시작 (누적 {self.restarts}회)")
+
+    def _run(self, slot: int, job: dict) -> dict:
+        worker = self._workers[slot]
+        if not worker.wait_ready(JOB_TIMEOUT):
+            raise RuntimeError(f"워커 {slot} 준비 시간 초과")
+        worker.conn.send(job)
+        if not worker.conn.poll(JOB_TIMEOUT):
+            raise TimeoutError(f"워커 {slot} 응답 시간 초과 ({JOB_TIMEOUT:.0f}초)")
+        worker.jobs += 1
+        return worker.conn.recv()
+
+    def _submit(self, job: dict) -> dict:
+        """유휴 워커에서 작업 실행. 워커 사망/행 → 재시작 후 1회 재시도 (RuntimeError), 처리 예외 → JobError"""
+        for attempt in range(2):
+            slot = self._idle.get()
+            try:
+                reply = self._run(slot, job)
+            except (EOFError, OSError, TimeoutError, RuntimeError) as e:
+                print(f"⚠️ 추론 워커 {slot} 실패: {e}")
+                self._respawn(slot)
+                if attempt == 1:
+                    raise RuntimeError(f"추론 워커 실패: {e}")
+                continue
+            finally:
+                self._idle.put(slot)
+            if not reply.get("ok"):
+                raise JobError(reply.get("error", "추론 실패"))
+            return reply
+
+    def segment(self, image: Image.Image, model: str, max_size: int, roi=None, backend: str = "torch") -> Image.Image:
+        """워커에서 배경 제거 마스크 계산 → 원본 크기 L 마스크 반환"""
+        rgb = np.asarray(image.convert("RGB"))
+        h, w = rgb.shape[:2]
+        shm_in = shared_memory.SharedMemory(create=True, size=rgb.nbytes)
+        shm_out = shared_memory.SharedMemory(create=True, size=h * w)
+        try:
+            np.ndarray(rgb.shape, dtype=np.uint8, buffer=shm_in.buf)[:] = rgb
+            self._submit({"in": shm_in.name, "out": shm_out.name, "shape": (h, w),
+                          "model": model, "max_size": max_size, "roi": tuple(roi) if roi else None,
+                          "backend": backend})
+            mask = np.ndarray((h, w), dtype=np.uint8, buffer=shm_out.buf).copy()
+            return Image.fromarray(mask, "L")
+        finally:
+            for shm in (shm_in, shm_out):
+                shm.close()
+                shm.unlink()
+
+    def forward(self, method: str, path: str, query: bytes, headers: list, body: bytes) -> dict:
+        """HTTP 요청을 워커의 app에서 실행 → {"status", "headers": [(bytes, bytes)], "body"}. 업로드 본문은 공유 메모리로 전달"""
+        shm_in = shared_memory.SharedMemory(create=True, size=max(len(body), 1))
+        try:
+            shm_in.buf[:len(body)] = body
+            return self._submit({"kind": "http", "in": shm_in.name, "size": len(body),
+                                 "method": method, "path": path, "query": query, "headers": headers})
+        finally:
+            shm_in.close()
+            shm_in.unlink()
+
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "threads_per_worker": self.threads,
+            "idle": self._idle.qsize(),
+            "restarts": self.restarts,
+            "workers": [
+                {"slot": s, "pid": w.process.pid, "alive": w.process.is_alive(),
+                 "ready": w.ready, "jobs": w.jobs}
+                for s, w in sorted(self._workers.items())
+            ],
+        }
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+모델 가중치 스냅샷 준비 스크립트
+from_pretrained 대신 mmap 가능한 safetensors 스냅샷으로 빠르게 로드하기 위한 변환 도구.
+
+- 각 모델을 런타임 정밀도(fp16/fp32)로 변환해 models/_prepared/<이름>.safetensors 로 저장
+- BiRefNet은 CPU 복제본/CPU 노드용 float32 스냅샷(<이름>@float32)도 저장 → CPU에서도 형변환 없이 mmap 공유
+- 체크섬(sha256)/크기/dtype/원본 경로를 manifest.json 에 기록
+- server.py 는 manifest 에 있는 모델을 스냅샷에서 zero-copy 로드 (GPU: 디바이스로 직접, CPU: 공유 페이지 mmap)
+
+사용법:
+    python prepare_models.py                     # 전체 모델 변환
+    python prepare_models.py birefnet:portrait   # 특정 모델만
+    python prepare_models.py --verify            # manifest 체크섬 검증
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+
+PREPARED_DIR = Path("./models/_prepared")
+MANIFEST_PATH = PREPARED_DIR / "manifest.json"
+
+# 이름 -> (로더 종류, 원본 경로/HF repo, 저장 dtype)
+# 저장 dtype은 server.py 런타임 정밀도와 맞춰야 로드 시 형변환 없이 zero-copy
+MODEL_SOURCES = {
+    "birefnet:portrait": ("birefnet", "./models/birefnet-portrait", "float16"),
+    "birefnet:hr": ("birefnet", "./models/birefnet-hr", "float16"),
+    "birefnet:hr-matting": ("birefnet", "./models/birefnet-hr-matting", "float16"),
+    "birefnet:dynamic": ("birefnet", "./models/birefnet-dynamic", "float16"),
+    "birefnet:rmbg2": ("birefnet", "./models/rmbg2", "float16"),
+    "ben2": ("ben2", "PramaLLC/BEN2", "float32"),
+    "vitpose:vitpose": ("vitpose", "usyd-community/vitpose-plus-base", "float32"),
+    "vitpose:vitpose-huge": ("vitpose", "usyd-community/vitpose-plus-huge", "float32"),
+    "gdino": ("dino", "IDEA-Research/grounding-dino-tiny", "float32"),
+    "mmdino": ("dino", "openmmlab-community/mm_grounding_dino_tiny_o365v1_goldg_v3det", "float32"),
+    "gdino-base": ("dino", "IDEA-Research/grounding-dino-base", "float32"),
+}
+
+# 로더별 추가 dtype 스냅샷 (manifest 키 "<이름>@<dtype>") — 런타임 dtype이 디바이스마다 다른 모델
+VARIANT_DTYPES = {"birefnet": ("float32",)}
+
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_source_model(loader: str, source: str):
+    """원본 모델 로드 (server.py와 동일한 클래스)"""
+    if loader == "birefnet":
+        from transformers import AutoModelForImageSegmentation
+        return AutoModelForImageSegmentation.from_pretrained(source, trust_remote_code=True, local_files_only=True)
+    if loader == "ben2":
+        from ben2 import BEN_Base
+        return BEN_Base.from_pretrained(source)
+    if loader == "vitpose":
+        from transformers import VitPoseForPoseEstimation
+        return VitPoseForPoseEstimation.from_pretrained(source)
+    if loader == "dino":
+        from transformers import AutoModelForZeroShotObjectDetection
+        return AutoModelForZeroShotObjectDetection.from_pretrained(source)
+    raise ValueError(f"알 수 없는 로더: {loader}")
+
+
+def prepare(name: str, manifest: dict):
+    loader, source, dtype_name = MODEL_SOURCES[name]
+    print(f"📂 {name} 로딩 중... ({source})")
+    t0 = time.time()
+    model = load_source_model(loader, source)
+    save_snapshot(name, model, loader, source, dtype_name, manifest, t0)
+    for variant in VARIANT_DTYPES.get(loader, ()):
+        if variant != dtype_name:
+            save_snapshot(f"{name}@{variant}", model, loader, source, variant, manifest, time.time())
+
+
+def save_snapshot(name: str, model, loader: str, source: str, dtype_name: str, manifest: dict, t0: float):
+    import torch
+    from safetensors.torch import save_file
+
+    dtype = getattr(torch, dtype_name)
+    # 부동소수 텐서만 변환, 공유 텐서는 분리 (safetensors는 공유 저장 불가 → 로드 후 tie_weights로 복원)
+    state = {}
+    for key, tensor in sorted(model.state_dict().items()):
+        t = tensor.detach()
+        if t.is_floating_point():
+            t = t.to(dtype)
+        state[key] = t.contiguous().clone()
+
+    out_path = PREPARED_DIR / f"{name.replace(':', '__').replace('@', '.')}.safetensors"
+    save_file(state, str(out_path), metadata={"name": name, "source": source, "dtype": dtype_name})
+    manifest[name] = {
+        "file": out_path.name,
+        "loader": loader,
+        "source": source,
+        "dtype": dtype_name,
+        "bytes": out_path.stat().st_size,
+        "sha256": sha256_file(out_path),
+        "tensors": len(state),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    print(f"   ✅ {out_path} ({out_path.stat().st_size / 1e6:.1f}MB, {dtype_name}, {time.time() - t0:.1f}초)")
+
+
+def verify(manifest: dict) -> bool:
+    ok = True
+    for name, entry in manifest.items():
+        path = PREPARED_DIR / entry["file"]
+        if not path.exists():
+            print(f"❌ {name}: 파일 없음 ({path})")
+            ok = False
+            continue
+        digest = sha256_file(path)
+        if digest != entry["sha256"]:
+            print(f"❌ {name}: 체크섬 불일치")
+            ok = False
+        else:
+            print(f"✅ {name}: OK ({entry['bytes'] / 1e6:.1f}MB)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mmap safetensors 모델 스냅샷 준비")
+    parser.add_argument("models", nargs="*", help=f"변환할 모델 (기본: 전체) — {', '.join(MODEL_SOURCES)}")
+    parser.add_argument("--verify", action="store_true", help="manifest 체크섬만 검증")
+    args = parser.parse_args()
+
+    PREPARED_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8")) if MANIFEST_PATH.exists() else {}
+
+    if args.verify:
+        sys.exit(0 if verify(manifest) else 1)
+
+    targets = args.models or list(MODEL_SOURCES)
+    for name in targets:
+        if name not in MODEL_SOURCES:
+            print(f"⚠️ 알 수 없는 모델: {name}")
+            continue
+        try:
+            prepare(name, manifest)
+        except Exception as e:
+            print(f"   ❌ {name} 변환 실패: {e}")
+        # 모델마다 manifest 갱신 (중간 실패해도 완료분 유지)
+        MANIFEST_PATH.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"\n📋 manifest: {MANIFEST_PATH} ({len(manifest)}개 모델)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+멀티 노드 추론 라우터
+여러 server.py 노드 앞단에서 요청을 분배하는 경량 FastAPI 프록시.
+
+- 노드 레지스트리: 각 노드의 /health 를 주기적으로 폴링 (로드된 모델, 처리 중 요청 수)
+- 모델 친화: 요청 모델이 이미 로드(warm)된 노드 우선
+- 캐시 친화: 업로드 이미지 해시로 consistent hashing → 같은 이미지는 같은 노드
+  (SAM2 임베딩/ROI/감지 캐시가 노드 로컬에 유지)
+- 장애 조치: 연결 실패 노드는 down 처리 후 링의 다음 노드로 재시도 (502/503/504 응답도 재시도)
+  요청 전송 후 실패(읽기 타임아웃 등)는 중복 추론을 막기 위해 재시도하지 않음
+
+사용법:
+    ROUTER_NODES=http://127.0.0.1:5101,http://127.0.0.1:5102 python router.py
+    ./start-local-cluster.sh 3     # CPU 전용 로컬 노드 3개 + 라우터
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+ROUTER_NODES = [n.strip().rstrip("/") for n in os.environ.get("ROUTER_NODES", "http://127.0.0.1:5101").split(",") if n.strip()]
+POLL_INTERVAL = float(os.environ.get("ROUTER_POLL_SEC", 2.0))
+REQUEST_TIMEOUT = float(os.environ.get("ROUTER_TIMEOUT", 300.0))
+# 친화 노드의 대기 요청이 최소 대기 노드보다 이만큼 많으면 링의 다음 노드로 넘김
+MAX_QUEUE_SKEW = int(os.environ.get("ROUTER_MAX_QUEUE_SKEW", 4))
+VIRTUAL_NODES = 64
+
+# 엔드포인트별 기본 모델 (쿼리 model 파라미터가 없을 때)
+DEFAULT_MODELS = {
+    "/remove-bg": "portrait",
+    "/smart-crop": "portrait",
+    "/detect-child": "gdino",
+    "/detect-pose": "vitpose",
+    "/detect-pose-batch": "vitpose",
+    "/segment-child": "sam2",
+    "/segment-all": "sam2_amg",
+    "/mematte": "mematte",
+}
+
+# 프록시 시 전달하지 않는 hop-by-hop 헤더
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade",
+               "proxy-authorization", "proxy-authenticate", "host", "content-length"}
+
+
+class Node:
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = False
+        self.models = set()
+        self.in_flight = 0      # 노드가 보고한 처리 중 요청 수
+        self.pending = 0        # 라우터가 보낸 후 응답 대기 중인 요청 수
+        self.failures = 0
+        self.last_seen = 0.0
+        self.routed = 0
+
+    @property
+    def load(self) -> int:
+        return max(self.in_flight, self.pending)
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "models": sorted(self.models),
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "routed": self.routed,
+            "failures": self.failures,
+            "last_seen": round(time.time() - self.last_seen, 1) if self.last_seen else None,
+        }
+
+
+class HashRing:
+    """가상 노드 기반 consistent hash 링 — 노드 추가/제거 시 키 이동 최소화"""
+
+    def __init__(self, urls, replicas: int = VIRTUAL_NODES):
+        self._ring = sorted(
+            (self._hash(f"{url}#{i}"), url) for url in urls for i in range(replicas)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+    def walk(self, key: str):
+        """key 위치부터 시계 방향으로 중복 없는 노드 순서 반환"""
+        if not self._ring:
+            return []
+        start = bisect.bisect(self._keys, self._hash(key))
+        order = []
+        for i in range(len(self._ring)):
+            url = self._ring[(start + i) % len(self._ring)][1]
+            if url not in order:
+                order.append(url)
+        return order
+
+
+nodes = {url: Node(url) for url in ROUTER_NODES}
+ring = HashRing(ROUTER_NODES)
+client: httpx.AsyncClient = None
+
+# CORS 헤더/프리플라이트는 노드 응답을 그대로 전달 (라우터에서 중복 추가하지 않음)
+app = FastAPI()
+
+
+async def poll_node(node: Node):
+    try:
+        r = await client.get(f"{node.url}/health", timeout=5.0)
+        r.raise_for_status()
+        info = r.json()
+        node.models = set(info.get("loaded_models", [])) | set(info.get("warm_detectors", []))
+        node.in_flight = int(info.get("in_flight", 0))
+        node.last_seen = time.time()
+        if not node.healthy:
+            print(f"🟢 노드 온라인: {node.url} (모델: {', '.join(sorted(node.models)) or '-'})")
+        node.healthy = True
+        node.failures = 0
+    except (httpx.HTTPError, ValueError) as e:
+        if node.healthy:
+            print(f"🔴 노드 응답 없음: {node.url} ({type(e).__name__})")
+        node.healthy = False
+
+
+async def poll_loop():
+    while True:
+        await asyncio.gather(*(poll_node(n) for n in nodes.values()))
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+@app.on_event("startup")
+async def startup():
+    global client
+    client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+    await asyncio.gather(*(poll_node(n) for n in nodes.values()))
+    asyncio.create_task(poll_loop())
+    print(f"🧭 라우터 시작: 노드 {len(nodes)}개 ({sum(n.healthy for n in nodes.values())}개 정상)")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await client.aclose()
+
+
+def candidate_nodes(affinity_key: str, model: str):
+    """
+    라우팅 순서 결정:
+    1. 링 순서 중 모델이 warm 인 정상 노드 → 2. 나머지 정상 노드 (링 순서)
+    친화 노드가 과부하(최소 부하 + MAX_QUEUE_SKEW 이상)면 뒤로 미룸. down 노드는 마지막 수단.
+    """
+    order = [nodes[u] for u in ring.walk(affinity_key)]
+    healthy = [n for n in order if n.healthy]
+    warm = [n for n in healthy if model in n.models]
+    cold = [n for n in healthy if model not in n.models]
+    preferred = warm + cold
+    if preferred:
+        least = min(n.load for n in preferred)
+        preferred = [n for n in preferred if n.load < least + MAX_QUEUE_SKEW] + \
+                    [n for n in preferred if n.load >= least + MAX_QUEUE_SKEW]
+    return preferred + [n for n in order if not n.healthy]
+
+
+def affinity_key_for(request: Request, body: bytes) -> str:
+    """
+    요청 본문 해시 (이미 메모리에 있는 원본 바이트 — multipart 파싱 없음). 본문이 없으면 경로+쿼리
+    multipart 경계 문자열은 요청마다 무작위 → 제거 후 해시해 같은 업로드는 같은 키
+    """
+    if body:
+        _, _, boundary = request.headers.get("content-type", "").partition("boundary=")
+        boundary = boundary.split(";")[0].strip().strip('"')
+        if boundary:
+            body = body.replace(boundary.encode(), b"")
+        return hashlib.sha1(body).hexdigest()
+    return f"{request.url.path}?{request.url.query}"
+
+
+@app.get("/router/status")
+async def router_status():
+    return JSONResponse(content={"nodes": [n.status() for n in nodes.values()]})
+
+
+@app.get("/health")
+async def health():
+    """라우터 상태 + 노드 요약 (정상 노드가 하나도 없으면 503)"""
+    healthy = [n for n in nodes.values() if n.healthy]
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "ok" if healthy else "no_nodes",
+            "role": "router",
+            "nodes": [n.status() for n in nodes.values()],
+            "loaded_models": sorted(set().union(*(n.models for n in healthy))) if healthy else [],
+            "in_flight": sum(n.pending for n in nodes.values()),
+        },
+    )
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+async def proxy(path: str, request: Request):
+    body = await request.body()
+    route = "/" + path
+    model = request.query_params.get("model") or DEFAULT_MODELS.get(route, "*")
+    key = affinity_key_for(request, body)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+
+    last_error = None
+    for node in candidate_nodes(key, model):
+        node.pending += 1
+        start = time.time()
+        try:
+            r = await client.request(request.method, f"{node.url}{route}", params=request.query_params,
+                                     content=body, headers=headers)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # 연결 단계 실패 → 노드가 요청을 받지 못했으므로 down 처리 후 다음 노드로 재시도
+            node.healthy = False
+            node.failures += 1
+            last_error = f"{node.url}: {type(e).__name__}"
+            print(f"⚠️ {route} → {node.url} 연결 실패 ({type(e).__name__}), 다음 노드로 재시도")
+            continue
+        except httpx.HTTPError as e:
+            # 전송 후 실패 (읽기 타임아웃/프로토콜 오류) → 노드가 이미 추론했을 수 있어 재전송하지 않음
+            node.failures += 1
+            print(f"⚠️ {route} → {node.url} 응답 실패 ({type(e).__name__}) — 재시도 없음")
+            return JSONResponse(status_code=504, content={"detail": f"노드 응답 실패 ({node.url}: {type(e).__name__})"})
+        finally:
+            node.pending -= 1
+        if r.status_code in (502, 503, 504):
+            node.failures += 1
+            last_error = f"{node.url}: HTTP {r.status_code}"
+            print(f"⚠️ {route} → {node.url} HTTP {r.status_code}, 다음 노드로 재시도")
+            continue
+        node.routed += 1
+        if model != "*":
+            node.models.add(model)  # 요청 처리로 모델이 로드됨 (다음 폴링 전까지 warm 으로 간주)
+        print(f"🧭 {request.method} {route} [{model}] → {node.url} ({time.time() - start:.2f}초)")
+        out_headers = {k: v for k, v in r.headers.items() if k.lower() not in HOP_HEADERS | {"content-encoding"}}
+        out_headers["X-Routed-Node"] = node.url
+        return Response(content=r.content, status_code=r.status_code, headers=out_headers)
+
+    return JSONResponse(status_code=503, content={"detail": f"가용 노드 없음 ({last_error or '노드 미등록'})"})
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5001))
+    uvicorn.run(app, host="0.0.0.0", port=port, timeout_keep_alive=120)
@@ -1,6 +1,8 @@
 # server.py (최적화 버전: FP16 + Warmup + 보안 강화)
 import sys
 import os
+import time
+_boot_start = time.perf_counter()
 
 # === 로그 파일 설정 (stdout/stderr → 파일에 기록) ===
 LOG_PATH = os.environ.get("SERVER_LOG", r"C:\Users\taeho\server.log")
@@ -54,84 +56,161 @@ except Exception as e:
     except Exception:
         pass
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Form, Body
+# === 책 전용 노드 (SERVER_PROFILE=book): torch/모델 스택을 임포트하지 않고 book_api만 실행 ===
+# /generate-book, /josa-preview 전용 CPU 노드용 — 부팅 프로파일은 book_api /health의 import_profile
+if __name__ == "__main__" and os.environ.get("SERVER_PROFILE") == "book":
+    import book_api
+    book_api.main()
+    sys.exit(0)
+
+# === torch.compile 영속 캐시 (torch 임포트 전에 설정해야 inductor가 인식) ===
+# 재시작마다 반복되는 그래프 생성/오토튠 결과를 torch 버전별 디렉토리에 보관
+from pathlib import Path
+try:
+    from importlib.metadata import version as _pkg_version
+    TORCH_VERSION = _pkg_version("torch")
+except Exception:
+    TORCH_VERSION = "unknown"
+COMPILE_CACHE_ENABLED = os.environ.get("COMPILE_CACHE", "1") == "1"
+COMPILE_CACHE_DIR = Path(os.environ.get("COMPILE_CACHE_DIR", Path(__file__).parent / ".compile_cache")) / f"torch-{TORCH_VERSION}"
+if COMPILE_CACHE_ENABLED:
+    try:
+        COMPILE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(COMPILE_CACHE_DIR / "inductor"))
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+        os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+        os.environ.setdefault("TRITON_CACHE_DIR", str(COMPILE_CACHE_DIR / "triton"))
+    except OSError as e:
+        COMPILE_CACHE_ENABLED = False
+        print(f"⚠️ 컴파일 캐시 디렉토리 생성 실패: {e}")
+
+# === 임포트 프로파일 (부팅 시 컴포넌트별 임포트 비용) ===
+import_profile = {}  # 컴포넌트 -> 임포트 소요 시간(초)
+_t = time.perf_counter()
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Form, Body, Request
 from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from transformers import AutoModelForImageSegmentation
-from torchvision import transforms
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any, Literal
+import_profile["fastapi"] = time.perf_counter() - _t
+from typing import List, Dict, Any, Literal
+_t = time.perf_counter()
 from PIL import Image, ImageOps
-from pillow_heif import register_heif_opener
-register_heif_opener()
+import numpy as np
+import_profile["pillow+numpy"] = time.perf_counter() - _t
+_t = time.perf_counter()
 import torch
+import_profile["torch"] = time.perf_counter() - _t
 import gc
 import io
-import time
 import asyncio
 import threading
-import numpy as np
-import os
+import functools
 import json
-import re
 import traceback
-import httpx
 import base64
-from pathlib import Path
+import contextlib
+import hashlib
+import importlib
+import importlib.util
+import mmap
+import struct
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+_t = time.perf_counter()
+import httpx
+import_profile["httpx"] = time.perf_counter() - _t
 
-# Ryan Engine 임포트
+# 책 API (Ryan Engine 포함, torch 미사용)
 sys.path.insert(0, str(Path(__file__).parent))
-try:
-    from ryan_engine import JosaUtils, BookGenerator
-    RYAN_ENGINE_AVAILABLE = True
-    print("✅ Ryan Engine 로드 완료")
-except ImportError as e:
-    RYAN_ENGINE_AVAILABLE = False
-    print(f"⚠️ Ryan Engine 로드 실패: {e}")
-
-# BGQA (배경 제거 품질 평가) 임포트
-try:
-    from bgqa import evaluate as bgqa_evaluate
-    BGQA_AVAILABLE = True
-    print("✅ BGQA 로드 완료")
-except ImportError as e:
-    BGQA_AVAILABLE = False
-    print(f"⚠️ BGQA 로드 실패: {e}")
-
-# SAM2 임포트
-try:
-    from sam2.sam2_image_predictor import SAM2ImagePredictor
-    from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
-    SAM2_AVAILABLE = True
-    print("✅ SAM2 모듈 로드 완료")
-except ImportError as e:
-    SAM2_AVAILABLE = False
-    print(f"⚠️ SAM2 모듈 없음: {e}")
-
-# Grounding DINO 임포트
-try:
-    from transformers import AutoProcessor as GDinoProcessor, AutoModelForZeroShotObjectDetection
-    GDINO_AVAILABLE = True
-    print("✅ Grounding DINO 모듈 로드 완료")
-except ImportError as e:
-    GDINO_AVAILABLE = False
-    print(f"⚠️ Grounding DINO 모듈 없음: {e}")
-
-# Florence-2 임포트
-try:
-    from transformers import AutoModelForCausalLM as Florence2Model, AutoProcessor as Florence2Processor
-    FLORENCE2_AVAILABLE = True
-    print("✅ Florence-2 모듈 로드 완료")
-except ImportError as e:
-    FLORENCE2_AVAILABLE = False
-    print(f"⚠️ Florence-2 모듈 없음: {e}")
+_t = time.perf_counter()
+from book_api import router as book_router, RYAN_ENGINE_AVAILABLE
+import_profile["book_api+ryan_engine"] = time.perf_counter() - _t
+
+# ========== 선택적 무거운 스택 지연 임포트 레지스트리 ==========
+# 엔드포인트가 처음 호출될 때 임포트. 가용성은 패키지 존재 여부만 확인 (find_spec — 임포트 안 함)
+# 스택 이름 -> (프로브 패키지, [(모듈, 속성), ...])
+LAZY_STACKS = {
+    "heif": ("pillow_heif", [("pillow_heif", "register_heif_opener")]),
+    "torchvision": ("torchvision", [("torchvision", "transforms")]),
+    "birefnet": ("transformers", [("transformers", "AutoModelForImageSegmentation"), ("transformers", "AutoConfig")]),
+    "sam2": ("sam2", [("sam2.sam2_image_predictor", "SAM2ImagePredictor"), ("sam2.automatic_mask_generator", "SAM2AutomaticMaskGenerator")]),
+    "gdino": ("transformers", [("transformers", "AutoProcessor"), ("transformers", "AutoModelForZeroShotObjectDetection"), ("transformers", "AutoConfig")]),
+    "florence2": ("transformers", [("transformers", "AutoModelForCausalLM"), ("transformers", "AutoProcessor")]),
+    "vitmatte": ("transformers", [("transformers", "VitMatteForImageMatting"), ("transformers", "VitMatteImageProcessor")]),
+    "vitpose": ("transformers", [("transformers", "AutoProcessor"), ("transformers", "VitPoseForPoseEstimation"), ("transformers", "AutoConfig")]),
+    "ben2": ("ben2", [("ben2", "BEN_Base")]),
+    "bgqa": ("bgqa", [("bgqa", "evaluate")]),
+    "onnxruntime": ("onnxruntime", [("onnxruntime", "InferenceSession"), ("onnxruntime", "SessionOptions"), ("onnxruntime", "GraphOptimizationLevel")]),
+    "msgpack": ("msgpack", [("msgpack", "packb")]),
+}
+_loaded_stacks = {}
+_stack_lock = threading.Lock()
+
+def stack_available(name: str) -> bool:
+    """스택 패키지 설치 여부 (임포트하지 않음)"""
+    probe = LAZY_STACKS[name][0]
+    try:
+        return importlib.util.find_spec(probe) is not None
+    except (ImportError, ValueError):
+        return False
+
+def load_stack(name: str) -> SimpleNamespace:
+    """스택 임포트 (최초 1회, 소요 시간은 import_profile에 기록) → 속성 네임스페이스"""
+    stack = _loaded_stacks.get(name)
+    if stack is not None:
+        return stack
+    with _stack_lock:
+        if name in _loaded_stacks:
+            return _loaded_stacks[name]
+        t0 = time.perf_counter()
+        attrs = {}
+        for module_name, attr in LAZY_STACKS[name][1]:
+            attrs[attr] = getattr(importlib.import_module(module_name), attr)
+        stack = SimpleNamespace(**attrs)
+        hook = _STACK_HOOKS.get(name)
+        if hook:
+            hook(stack)
+        import_profile[f"lazy:{name}"] = time.perf_counter() - t0
+        print(f"📦 {name} 스택 임포트 ({import_profile[f'lazy:{name}']:.2f}초)")
+        _loaded_stacks[name] = stack
+        return stack
+
+def _heif_hook(stack):
+    stack.register_heif_opener()
+
+def _vitpose_hook(stack):
+    """ViTPose transformers 버그 패치 (inv 함수 누락 문제)"""
+    try:
+        import transformers.models.vitpose.image_processing_vitpose as vitpose_module
+        import numpy.linalg
+        # 모듈의 글로벌 네임스페이스에 inv 함수 주입
+        vitpose_module.__dict__['inv'] = numpy.linalg.inv
+        # scipy_warp_affine 함수의 글로벌에도 주입
+        if hasattr(vitpose_module, 'scipy_warp_affine'):
+            vitpose_module.scipy_warp_affine.__globals__['inv'] = numpy.linalg.inv
+        print("✅ ViTPose 패치 적용 완료 (inv 함수 주입)")
+    except Exception as e:
+        print(f"⚠️ ViTPose 패치 스킵: {e}")
+
+def _florence2_hook(stack):
+    """flash_attn 패치용 원본 get_imports 캡처 (mock.patch 후 재임포트 시 자기 자신 참조 방지)"""
+    global _original_get_imports
+    try:
+        from transformers.dynamic_module_utils import get_imports
+        _original_get_imports = get_imports
+    except ImportError:
+        _original_get_imports = None
+
+_STACK_HOOKS = {"heif": _heif_hook, "vitpose": _vitpose_hook, "florence2": _florence2_hook}
+
+def ensure_heif():
+    """HEIC/HEIF 디코더 등록 (업로드 요청 첫 처리 시)"""
+    if "heif" not in _loaded_stacks and HEIF_AVAILABLE:
+        load_stack("heif")
 
 # flash_attn 미설치 대응 패치 (Windows 등)
-# 패치 전에 원본 함수 참조를 캡처 (mock.patch 후 재임포트 시 자기 자신 참조 방지)
-try:
-    from transformers.dynamic_module_utils import get_imports as _original_get_imports
-except ImportError:
-    _original_get_imports = None
+_original_get_imports = None
 
 def _fixed_get_imports(filename):
     """flash_attn 임포트를 제거하는 패치 — transformers.dynamic_module_utils.get_imports 대체"""
@@ -142,44 +221,44 @@ def _fixed_get_imports(filename):
         imports.remove("flash_attn")
     return imports
 
-# ViTMatte 임포트
-try:
-    from transformers import VitMatteForImageMatting, VitMatteImageProcessor
-    VITMATTE_AVAILABLE = True
-    print("✅ ViTMatte 모듈 로드 완료")
-except ImportError as e:
-    VITMATTE_AVAILABLE = False
-    print(f"⚠️ ViTMatte 모듈 없음: {e}")
+_t = time.perf_counter()
+HEIF_AVAILABLE = stack_available("heif")
+BGQA_AVAILABLE = stack_available("bgqa")
+SAM2_AVAILABLE = stack_available("sam2")
+GDINO_AVAILABLE = stack_available("gdino")
+FLORENCE2_AVAILABLE = stack_available("florence2")
+VITMATTE_AVAILABLE = stack_available("vitmatte")
+import_profile["availability probes"] = time.perf_counter() - _t
+print(f"🔎 선택 스택: sam2={SAM2_AVAILABLE}, transformers={GDINO_AVAILABLE}, heif={HEIF_AVAILABLE}, bgqa={BGQA_AVAILABLE}")
 
 # PNG 저장 폴더 설정
 PNG_OUTPUT_DIR = Path("./png")
 PNG_OUTPUT_DIR.mkdir(exist_ok=True)
 
-# ViTPose transformers 버그 패치 (inv 함수 누락 문제)
-try:
-    import transformers.models.vitpose.image_processing_vitpose as vitpose_module
-    import numpy.linalg
-    # 모듈의 글로벌 네임스페이스에 inv 함수 주입
-    vitpose_module.__dict__['inv'] = numpy.linalg.inv
-    # scipy_warp_affine 함수의 글로벌에도 주입
-    if hasattr(vitpose_module, 'scipy_warp_affine'):
-        vitpose_module.scipy_warp_affine.__globals__['inv'] = numpy.linalg.inv
-    print("✅ ViTPose 패치 적용 완료 (inv 함수 주입)")
-except Exception as e:
-    print(f"⚠️ ViTPose 패치 스킵: {e}")
-
 from starlette.requests import Request as StarletteRequest
 from starlette.middleware.base import BaseHTTPMiddleware
 
 app = FastAPI()
 
+# 처리 중 요청 수 (라우터가 /health로 큐 깊이 판단)
+in_flight = 0
+requests_served = 0
+
 class RequestLogMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: StarletteRequest, call_next):
+        global in_flight, requests_served
         client = request.client.host if request.client else "unknown"
         path = request.url.path
         qs = str(request.url.query)
         cl = request.headers.get("content-length", "?")
         print(f"🔵 [{client}] {request.method} {path}{'?' + qs if qs else ''} (body: {cl} bytes)")
+        if request.headers.get("content-type", "").startswith("multipart/") and HEIF_AVAILABLE and "heif" not in _loaded_stacks:
+            await asyncio.to_thread(ensure_heif)  # 업로드 요청에서만 HEIC 디코더 지연 등록 (임포트는 이벤트 루프 밖에서)
+        if SERVER_ROLE == "api" and path in API_ROLE_WORKER_PATHS and inference_pool is not None:
+            return await forward_to_worker(request, client)
+        counted = path != "/health"
+        if counted:
+            in_flight += 1
         try:
             response = await call_next(request)
             print(f"🟢 [{client}] {request.method} {path} → {response.status_code}")
@@ -187,6 +266,34 @@ class RequestLogMiddleware(BaseHTTPMiddleware):
         except Exception as e:
             print(f"🔴 [{client}] {request.method} {path} → ERROR: {e}")
             raise
+        finally:
+            if counted:
+                in_flight -= 1
+                requests_served += 1
+
+async def forward_to_worker(request: StarletteRequest, client: str) -> Response:
+    """API 모드: 요청 전체(본문 포함)를 추론 워커 app에서 실행 → 응답 그대로 반환"""
+    global in_flight, requests_served
+    from inference_pool import JobError
+    path = request.url.path
+    in_flight += 1
+    try:
+        body = await request.body()
+        reply = await asyncio.to_thread(
+            inference_pool.forward, request.method, path, request.url.query.encode(), request.headers.raw, body)
+    except RuntimeError as e:
+        print(f"🔴 [{client}] {request.method} {path} → 503 (추론 워커: {e})")
+        return JSONResponse(status_code=503, content={"detail": f"추론 워커 오류: {e}"})
+    except JobError as e:
+        print(f"🔴 [{client}] {request.method} {path} → 500 (워커 처리 오류: {e})")
+        return JSONResponse(status_code=500, content={"detail": f"처리 중 오류: {e}"})
+    finally:
+        in_flight -= 1
+        requests_served += 1
+    print(f"🟢 [{client}] {request.method} {path} → {reply['status']} (워커 {reply['seconds']:.2f}초)")
+    headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in reply["headers"]
+               if k.lower() not in (b"content-length", b"transfer-encoding")}
+    return Response(content=reply["body"], status_code=reply["status"], headers=headers)
 
 app.add_middleware(RequestLogMiddleware)
 
@@ -209,7 +316,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST"],  # GET 추가 (헬스체크 등)
     allow_headers=["Content-Type"],  # 필요한 헤더만 허용
-    expose_headers=["X-Original-Width", "X-Original-Height", "X-Crop-X", "X-Crop-Y", "X-Crop-Width", "X-Crop-Height", "X-BGQA-Score", "X-BGQA-Passed", "X-BGQA-Issues", "X-BGQA-CaseType", "X-SAM2-Score", "X-Mask-Width", "X-Mask-Height"],  # 클라이언트에서 읽을 수 있는 커스텀 헤더
+    expose_headers=["X-Original-Width", "X-Original-Height", "X-Crop-X", "X-Crop-Y", "X-Crop-Width", "X-Crop-Height", "X-BGQA-Score", "X-BGQA-Passed", "X-BGQA-Issues", "X-BGQA-CaseType", "X-SAM2-Score", "X-Mask-Width", "X-Mask-Height", "X-ROI", "X-Backend"],  # 클라이언트에서 읽을 수 있는 커스텀 헤더
 )
 
 # 파일 검증 상수
@@ -227,8 +334,265 @@ def is_allowed_image(file) -> bool:
             return True
     return False
 
-# 1. 디바이스 설정
-if torch.backends.mps.is_available():
+def image_hash(data: bytes) -> str:
+    """업로드 원본 바이트의 해시 (결과/캐시 키용)"""
+    return hashlib.sha1(data).hexdigest()
+
+class LRUCache:
+    """스레드 안전한 간단 LRU 캐시 (엔드포인트 간 결과 재사용용)"""
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+# ROI 레지스트리: /smart-crop, /detect-child 결과 박스를 /remove-bg에서 roi_id로 참조
+roi_results = LRUCache(maxsize=256)
+
+# ========== 공용 추론 실행기 ==========
+# 무거운 텐서 준비/추론을 이벤트 루프 밖 전용 스레드 풀에서 실행
+# (asyncio.to_thread 기본 풀과 분리 → 업로드 디코드/WebP 인코딩과 스레드를 다투지 않고, 동시 추론 수가 INFERENCE_THREADS로 제한됨)
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 2))
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+
+def _reset_inference_executor():
+    """fork 자식: 부모 실행기는 스레드 없이 유휴 세마포어만 복사됨 → 새 스레드를 만들지 않아 작업이 영원히 대기. 새로 생성"""
+    global inference_executor
+    inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_inference_executor)
+
+async def run_inference(fn, *args, **kwargs):
+    """fn(*args, **kwargs)를 추론 실행기에서 실행하고 결과 대기"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, functools.partial(fn, *args, **kwargs))
+
+async def watch_disconnect(request: Request, cancel: threading.Event, interval: float = 0.5):
+    """클라이언트 연결 종료 시 cancel 설정 (추론 스레드가 단계 사이에 확인)"""
+    while not cancel.is_set():
+        if await request.is_disconnected():
+            cancel.set()
+            return
+        await asyncio.sleep(interval)
+
+def register_roi(image_key: str, image_size, boxes, source: str) -> str:
+    """감지/크롭 결과 박스를 등록하고 roi_id 반환"""
+    roi_id = uuid.uuid4().hex[:16]
+    roi_results.put(roi_id, {
+        "image_hash": image_key,
+        "image_size": tuple(image_size),
+        "boxes": [[float(v) for v in b] for b in boxes],
+        "source": source,
+    })
+    return roi_id
+
+def pad_roi(box, image_size, padding: float = 0.1):
+    """박스에 비율 패딩을 더해 정수 좌표로 클램핑. 원본의 90% 이상이거나 이미지 밖(빈 영역)이면 None (전체 처리)"""
+    w, h = image_size
+    x1, y1, x2, y2 = box
+    bw, bh = x2 - x1, y2 - y1
+    if bw <= 1 or bh <= 1:
+        return None
+    x1 = max(0, int(x1 - bw * padding))
+    y1 = max(0, int(y1 - bh * padding))
+    x2 = min(w, int(np.ceil(x2 + bw * padding)))
+    y2 = min(h, int(np.ceil(y2 + bh * padding)))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    if (x2 - x1) * (y2 - y1) >= w * h * 0.9:
+        return None
+    return (x1, y1, x2, y2)
+
+def paste_roi_mask(mask_roi: Image.Image, roi, image_size) -> Image.Image:
+    """ROI 마스크를 전체 프레임 좌표의 빈(배경) 마스크에 붙여넣기"""
+    full = Image.new("L", image_size, 0)
+    full.paste(mask_roi, (roi[0], roi[1]))
+    return full
+
+# ========== 마스크 인코딩 (label map / COCO RLE) ==========
+def label_map_from_masks(masks, shape) -> np.ndarray:
+    """
+    bool 마스크 목록 → uint8 label map (1-based, 0=배경). 겹치면 뒤쪽 마스크 우선
+    (면적 내림차순으로 넘기면 작은 오브젝트가 큰 오브젝트 위에 그려짐)
+    """
+    if not masks:
+        return np.zeros(shape, dtype=np.uint8)
+    stack = np.stack(masks)[::-1]  # [N, H, W], 뒤쪽 마스크부터
+    last = len(masks) - np.argmax(stack, axis=0)  # 픽셀별 마지막으로 덮은 마스크 (1-based)
+    return np.where(stack.any(axis=0), last, 0).astype(np.uint8)
+
+def mask_to_rle(mask: np.ndarray) -> dict:
+    """bool 마스크 → COCO 압축 RLE ({"size": [h, w], "counts": str}, pycocotools.mask.decode 호환)"""
+    h, w = mask.shape
+    flat = np.asarray(mask, dtype=bool).ravel(order="F")  # COCO: column-major
+    if flat.size == 0:
+        return {"size": [h, w], "counts": ""}
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], change, [flat.size]))).tolist()
+    if flat[0]:
+        counts = [0] + counts  # 0(배경) 길이부터 시작
+    # LEB128 유사 6비트 문자 인코딩 (maskApi.c rleToString), i>2는 2칸 앞 길이와의 차분
+    out = []
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            out.append(chr(c + 48))
+    return {"size": [h, w], "counts": "".join(out)}
+
+# ========== 응답 포맷 협상 (JSON / MessagePack / float32 바이너리) ==========
+# Accept 헤더로 선택, 기본 JSON (기존 클라이언트 그대로)
+#   application/msgpack      : {"meta": {...}, "arrays": {이름: {"shape": [...], "data": float32 LE bytes}}}
+#   application/x-monvie-f32 : "MVF1" + uint32 LE 헤더 길이 + JSON 헤더 {"meta", "arrays": [{name, shape, offset}]}
+#                              + float32 LE 배열 블록 (offset은 블록 시작 기준, 블록은 4바이트 정렬 → Float32Array 뷰)
+# 키포인트/박스/점수는 숫자 배열, 마스크는 COCO RLE(meta)로 전달
+MSGPACK_AVAILABLE = stack_available("msgpack")
+MSGPACK_MEDIA = "application/msgpack"
+F32_MEDIA = "application/x-monvie-f32"
+F32_MAGIC = b"MVF1"
+
+def response_format(request: Request) -> str:
+    """요청 Accept 헤더 → "json" | "msgpack" | "f32" (추론 전에 호출해 미지원 포맷은 바로 406)"""
+    accept = (request.headers.get("accept") or "").lower()
+    if MSGPACK_MEDIA in accept or "application/x-msgpack" in accept:
+        if not MSGPACK_AVAILABLE:
+            raise HTTPException(status_code=406, detail=f"MessagePack 미지원 (pip install msgpack) — {F32_MEDIA} 또는 JSON 사용")
+        return "msgpack"
+    if F32_MEDIA in accept:
+        return "f32"
+    return "json"
+
+def encode_f32(meta: dict, arrays: dict) -> bytes:
+    """고정 레이아웃 바이너리: 매직 + 헤더 길이 + JSON 헤더(4바이트 정렬 패딩) + float32 LE 배열"""
+    table, blobs, offset = [], [], 0
+    for name, arr in arrays.items():
+        data = np.ascontiguousarray(arr, dtype="<f4")
+        table.append({"name": name, "shape": list(data.shape), "offset": offset})
+        blobs.append(data.tobytes())
+        offset += data.nbytes
+    header = json.dumps({"meta": meta, "arrays": table}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    header += b" " * (-(len(F32_MAGIC) + 4 + len(header)) % 4)
+    return F32_MAGIC + struct.pack("<I", len(header)) + header + b"".join(blobs)
+
+def negotiated_response(fmt: str, content: dict, arrays: dict = None, meta: dict = None, headers: dict = None) -> Response:
+    """
+    fmt=json → content 그대로 JSONResponse.
+    바이너리 포맷 → meta(기본: content) + arrays(숫자 배열, float32) 직렬화
+    """
+    headers = {"Vary": "Accept", **(headers or {})}  # 같은 URL이 Accept에 따라 다른 표현 → 캐시 분리
+    if fmt == "json":
+        return JSONResponse(content=content, headers=headers)
+    meta = content if meta is None else meta
+    arrays = {k: np.asarray(v, dtype=np.float32) for k, v in (arrays or {}).items()}
+    if fmt == "msgpack":
+        body = load_stack("msgpack").packb({
+            "meta": meta,
+            "arrays": {k: {"shape": list(a.shape), "data": a.astype("<f4").tobytes()} for k, a in arrays.items()},
+        }, use_bin_type=True)
+        media_type = MSGPACK_MEDIA
+    else:
+        body = encode_f32(meta, arrays)
+        media_type = F32_MEDIA
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def detections_compact(detections: list, prefix: str = "") -> tuple:
+    """감지 결과 dict 목록 → (meta 필드, 배열) — 박스 [N,4] / 점수 [N], 라벨 등 나머지는 meta"""
+    meta = {f"{prefix}labels": [d["label"] for d in detections]}
+    if any("models" in d for d in detections):
+        meta[f"{prefix}models"] = [d.get("models", []) for d in detections]
+    arrays = {
+        f"{prefix}boxes": np.array([d["box"] for d in detections], dtype=np.float32).reshape(-1, 4),
+        f"{prefix}scores": np.array([d["score"] for d in detections], dtype=np.float32),
+    }
+    return meta, arrays
+
+def keypoints_compact(content: dict) -> tuple:
+    """keypoints [{name?, x, y, score}, ...] → (meta: 나머지 + keypoint_names, 배열 keypoints [K,3] = x, y, score)"""
+    kps = content.get("keypoints") or []
+    meta = {k: v for k, v in content.items() if k != "keypoints"}
+    if kps and "name" in kps[0]:
+        meta["keypoint_names"] = [kp["name"] for kp in kps]
+    return meta, {"keypoints": np.array([[kp["x"], kp["y"], kp["score"]] for kp in kps], dtype=np.float32).reshape(-1, 3)}
+
+# ========== Trimap (ViTMatte / MEMatte / DiffMatte 공용) ==========
+def build_trimap(mask_np: np.ndarray, erode_size: int, dilate_size: int, scale: float = 1.0) -> SimpleNamespace:
+    """
+    rough 마스크 → trimap (255=전경, 128=경계 unknown, 0=배경)
+    scale < 1: 축소 해상도에서 erode/dilate 후 NEAREST 확대 (커널 비용 ∝ scale²)
+    반환: trimap, fg(0/255 확정 전경), unknown_bbox(x1, y1, x2, y2 | None), counts
+    """
+    import cv2
+    h, w = mask_np.shape[:2]
+    binary = cv2.threshold(mask_np, 128, 255, cv2.THRESH_BINARY)[1]
+    if scale < 1.0:
+        small = cv2.resize(binary, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        binary = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY)[1]
+        erode_size = max(1, round(erode_size * scale))
+        dilate_size = max(1, round(dilate_size * scale))
+    # 정사각 커널은 분리 가능 → cv2가 행/열 1D 패스로 처리
+    fg = cv2.erode(binary, cv2.getStructuringElement(cv2.MORPH_RECT, (erode_size, erode_size)))
+    dilated = cv2.dilate(binary, cv2.getStructuringElement(cv2.MORPH_RECT, (dilate_size, dilate_size)))
+    if scale < 1.0:
+        fg = cv2.resize(fg, (w, h), interpolation=cv2.INTER_NEAREST)
+        dilated = cv2.resize(dilated, (w, h), interpolation=cv2.INTER_NEAREST)
+    # fg ⊆ dilated 이므로 비트 연산 한 번으로 0/128/255
+    trimap = (dilated & 128) | fg
+    x, y, bw, bh = cv2.boundingRect(cv2.bitwise_xor(dilated, fg))
+    n_fg, n_dilated = cv2.countNonZero(fg), cv2.countNonZero(dilated)
+    return SimpleNamespace(
+        trimap=trimap,
+        fg=fg,
+        unknown_bbox=(x, y, x + bw, y + bh) if bw and bh else None,
+        counts={"fg": n_fg, "unknown": n_dilated - n_fg, "bg": h * w - n_dilated},
+    )
+
+def matte_with_trimap(image: Image.Image, tri: SimpleNamespace, run_fn, padding: float = 0.1) -> np.ndarray:
+    """
+    unknown 영역 bbox(+패딩) ROI만 매팅 모델로 계산하고 나머지는 trimap 확정값(전경 255 / 배경 0)으로 채움
+    run_fn(image_crop: PIL, trimap_crop: np.uint8) → crop 크기 알파 (np.uint8)
+    """
+    if tri.unknown_bbox is None:
+        print("   ↳ unknown 영역 없음 — 매팅 생략")
+        return tri.fg.copy()
+    roi = pad_roi(tri.unknown_bbox, image.size, padding)
+    if roi is None:
+        return run_fn(image, tri.trimap)
+    x1, y1, x2, y2 = roi
+    print(f"   🎯 매팅 ROI: ({x1},{y1})→({x2},{y2}) [{(x2 - x1) * (y2 - y1) / (image.width * image.height) * 100:.0f}%]")
+    alpha = tri.fg.copy()
+    alpha[y1:y2, x1:x2] = run_fn(image.crop(roi), tri.trimap[y1:y2, x1:x2])
+    return alpha
+
+# 1. 디바이스 설정 (FORCE_CPU=1: 로컬 멀티 노드 테스트 등 CPU 전용 실행)
+FORCE_CPU = os.environ.get("FORCE_CPU", "0") == "1"
+if FORCE_CPU:
+    device = "cpu"
+    dtype = torch.float32
+elif torch.backends.mps.is_available():
     device = "mps"
     dtype = torch.float16  # [최적화] 맥북은 float16이 훨씬 빠름
 elif torch.cuda.is_available():
@@ -238,13 +602,182 @@ else:
     device = "cpu"
     dtype = torch.float32
 
-# Portrait 모델을 CPU로 돌려 BEN2(GPU)와 병렬 처리
-PORTRAIT_ON_CPU = False
+# Portrait 모델을 CPU로 돌려 BEN2(GPU)와 병렬 처리 (BIREFNET_REPLICAS="portrait=cpu" 와 동일)
+PORTRAIT_ON_CPU = os.environ.get("PORTRAIT_ON_CPU", "0") == "1"
 
 print(f"\n🚀 초고속 AI 서버 대기 중... (Device: {device}, Type: {dtype})")
 if PORTRAIT_ON_CPU:
     print(f"   ↳ Portrait 모델: CPU (float32) — BEN2와 병렬 처리 가능")
 
+# ========== CPU 추론 프로파일 ==========
+# CPU에서 실행되는 모델에만 적용 (CPU 노드, CPU 복제본):
+#   BiRefNet: channels_last + bf16 autocast (bf16 지원 CPU) / ViTPose, DINO 텍스트·퓨전: Linear 동적 int8 양자화
+# 정확도 영향은 bench_cpu.py 로 fp32 대비 측정 — 수치가 바뀌는 int8 / bf16 은 측정 후 명시적으로 켬 (기본 OFF)
+CPU_PROFILE = os.environ.get("CPU_PROFILE", "1") == "1"
+CPU_INT8 = os.environ.get("CPU_INT8", "0") == "1"
+CPU_CHANNELS_LAST = os.environ.get("CPU_CHANNELS_LAST", "1") == "1"
+
+def _cpu_supports_bf16() -> bool:
+    """bf16 연산 가속 지원 여부 (AVX512-BF16 / AMX) — 미지원 CPU에서는 bf16이 fp32보다 느림"""
+    if not torch.backends.mkldnn.is_available():
+        return False
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        return False
+
+_cpu_bf16_env = os.environ.get("CPU_BF16", "0")
+CPU_BF16 = _cpu_supports_bf16() if _cpu_bf16_env == "auto" else _cpu_bf16_env == "1"
+
+def apply_cpu_threads():
+    """intra-op(연산 내부) / inter-op(연산 간) 스레드 수 명시 설정 — 기본: 물리 코어 수 / 1"""
+    intra = int(os.environ.get("CPU_THREADS", 0))
+    if not intra:
+        try:
+            import psutil
+            intra = psutil.cpu_count(logical=False) or os.cpu_count() or 1
+        except ImportError:
+            intra = os.cpu_count() or 1
+    inter = int(os.environ.get("CPU_INTEROP_THREADS", 1))
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(inter)
+    except RuntimeError:
+        pass  # 병렬 작업 시작 후에는 변경 불가
+    # 동적 양자화 엔진: x86=fbgemm, ARM=qnnpack
+    engines = torch.backends.quantized.supported_engines
+    if "fbgemm" not in engines and "qnnpack" in engines:
+        torch.backends.quantized.engine = "qnnpack"
+    print(f"🧵 CPU 스레드: intra {intra} / inter {torch.get_num_interop_threads()}, bf16 {'ON' if CPU_BF16 else 'OFF'}, int8 {'ON' if CPU_INT8 else 'OFF'}")
+
+def _on_cpu(model) -> bool:
+    p = next(model.parameters(), None)
+    return p is None or p.device.type == "cpu"
+
+def quantize_linear_int8(module):
+    """nn.Linear → 동적 int8 (가중치 int8, 활성값은 실행 시 양자화)"""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def cpu_profile_birefnet(model):
+    """CPU BiRefNet: conv 백본/디코더 channels_last (bf16 autocast는 run_birefnet에서)"""
+    if CPU_PROFILE and CPU_CHANNELS_LAST and _on_cpu(model):
+        model.to(memory_format=torch.channels_last)
+    return model
+
+def cpu_profile_vitpose(model):
+    """CPU ViTPose: ViT 백본 Linear 동적 int8"""
+    if CPU_PROFILE and CPU_INT8 and _on_cpu(model):
+        quantize_linear_int8(model)
+        print("   ↳ ViTPose: 동적 int8 양자화 (CPU)")
+    return model
+
+def cpu_profile_dino(model):
+    """CPU DINO 계열: 텍스트 인코더(BERT) + 인코더 퓨전 레이어 Linear 동적 int8 (비전 백본은 fp32 유지)"""
+    if not (CPU_PROFILE and CPU_INT8 and _on_cpu(model)):
+        return model
+    base = getattr(model, "model", model)
+    text = getattr(base, "text_backbone", None)
+    if isinstance(text, CachedTextBackbone):
+        text = text.inner
+    targets = [text] if text is not None else []
+    encoder = getattr(base, "encoder", None)
+    targets += [layer.fusion_layer for layer in getattr(encoder, "layers", []) if hasattr(layer, "fusion_layer")]
+    for module in targets:
+        quantize_linear_int8(module)
+    print(f"   ↳ DINO: 텍스트/퓨전 {len(targets)}개 모듈 동적 int8 양자화 (CPU)")
+    return model
+
+# ========== 모델별 정밀도 정책 ==========
+# MODEL_PRECISION="sam2=autocast,gdino=fp16,vitpose=bf16" — 로더가 적용 (미지정 모델은 fp32 = 기존 동작)
+#   fp16/bf16: 가중치 형변환 + 입력 부동소수 텐서 자동 형변환 / autocast: 가중치 fp32 유지, 연산만 반정밀도
+# 대상: sam2, gdino, gdino-base, mmdino, vitpose, vitpose-huge (BiRefNet/ViTMatte/Florence-2는 기존 fp16 고정)
+# fp32 대비 정확도/속도/메모리는 bench_precision.py 로 측정 후 설정
+PRECISION_POLICIES = ("fp32", "fp16", "bf16", "autocast")
+PRECISION_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+MODEL_PRECISION = {
+    k.strip(): v.strip()
+    for k, _, v in (part.partition("=") for part in os.environ.get("MODEL_PRECISION", "").split(","))
+    if k.strip() and v.strip() in PRECISION_POLICIES
+}
+model_precision_applied = {}  # 모델 이름 -> 실제 적용된 정책 (/health)
+# 가중치 형변환(fp16/bf16) 불가 모델 → autocast만 허용, 나머지는 fp32
+# SAM2: PositionEmbeddingRandom이 좌표를 항상 fp32로 만들어 가우시안 행렬 버퍼와 곱함 (버퍼가 반정밀도면 dtype 오류)
+PRECISION_AUTOCAST_ONLY = {"sam2"}
+
+def resolve_precision(name: str, policy: str = None) -> str:
+    """
+    설정 정책 → 현재 디바이스에서 실행 가능한 정책. CPU: fp16 → fp32, autocast는 bf16 지원 CPU만 / MPS: autocast·bf16 → fp16
+    PRECISION_AUTOCAST_ONLY 모델은 가중치 형변환 정책이 되면 fp32
+    """
+    policy = policy or MODEL_PRECISION.get(name, "fp32")
+    if device == "cpu" and (policy == "fp16" or (policy == "autocast" and not CPU_BF16)):
+        policy = "fp32"
+    elif device == "mps" and policy in ("autocast", "bf16"):
+        policy = "fp16"
+    if name in PRECISION_AUTOCAST_ONLY and policy in ("fp16", "bf16"):
+        return "fp32"
+    return policy
+
+def precision_dtype(policy: str):
+    """정책의 연산 dtype (autocast: CUDA fp16, CPU bf16)"""
+    if policy == "autocast":
+        return torch.bfloat16 if device == "cpu" else torch.float16
+    return PRECISION_DTYPES[policy]
+
+def precision_load_dtype(name: str):
+    """스냅샷 로드 dtype — 가중치 형변환 정책이면 로드 시점에 바로 변환"""
+    policy = resolve_precision(name)
+    return PRECISION_DTYPES[policy] if policy in PRECISION_DTYPES else torch.float32
+
+def _cast_floating(obj, dtype):
+    """중첩 구조(tuple/list/dict/ModelOutput)의 부동소수 텐서만 dtype 변환"""
+    if isinstance(obj, torch.Tensor):
+        return obj.to(dtype) if obj.is_floating_point() and obj.dtype != dtype else obj
+    if isinstance(obj, dict):
+        # ModelOutput 포함 — 제자리 갱신으로 타입/속성 접근 유지
+        for k in list(obj.keys()):
+            obj[k] = _cast_floating(obj[k], dtype)
+        return obj
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+        return type(obj)(_cast_floating(v, dtype) for v in obj)
+    return obj
+
+def _precision_forward(inner, policy: str, compute, cast_output: bool):
+    autocast_device = "cuda" if str(device).startswith("cuda") else "cpu"
+
+    @functools.wraps(inner)
+    def forward(*args, **kwargs):
+        if policy != "autocast":
+            args, kwargs = _cast_floating(args, compute), _cast_floating(kwargs, compute)
+        with torch.autocast(autocast_device, dtype=compute, enabled=policy == "autocast"):
+            out = inner(*args, **kwargs)
+        return _cast_floating(out, torch.float32) if cast_output else out
+    return forward
+
+def apply_model_precision(model, name: str, policy: str = None, modules=None, keep_outputs=()) -> str:
+    """
+    정밀도 정책 적용 → 적용된 정책 반환 (fp32면 변경 없음, 호출측은 fp32일 때만 CPU int8 프로파일 적용)
+    modules: 감쌀 하위 모듈(forward) 또는 메서드 이름 (SAM2처럼 predictor가 하위 모듈/메서드를 직접 호출하는 경우), 기본은 모델 자신
+    출력 부동소수 텐서는 fp32로 되돌림 (기존 후처리 코드 그대로 사용) — keep_outputs에 든 이름만 반정밀도 출력 유지
+    """
+    policy = resolve_precision(name, policy)
+    model_precision_applied[name] = policy
+    if policy == "fp32":
+        return policy
+    compute = precision_dtype(policy)
+    if policy != "autocast":
+        model.to(compute)
+    for attr in modules or [None]:
+        target = model if attr is None else getattr(model, attr)
+        if isinstance(target, torch.nn.Module):
+            target.forward = _precision_forward(target.forward, policy, compute, attr not in keep_outputs)
+        else:
+            setattr(model, attr, _precision_forward(target, policy, compute, attr not in keep_outputs))
+    print(f"   ↳ {name}: 정밀도 {policy} ({str(compute).replace('torch.', '')})")
+    return policy
+
 def clear_gpu_memory():
     """GPU 메모리 캐시 해제"""
     gc.collect()
@@ -253,18 +786,257 @@ def clear_gpu_memory():
     elif device == "cuda":
         torch.cuda.empty_cache()
 
-# BEN2 임포트
-try:
-    from ben2 import BEN_Base
-    BEN2_AVAILABLE = True
-    print("✅ BEN2 모듈 로드 완료")
-except ImportError:
-    BEN2_AVAILABLE = False
+# ========== mmap safetensors 스냅샷 로더 ==========
+# prepare_models.py가 만든 스냅샷(models/_prepared)이 있으면 from_pretrained 대신 사용
+# GPU: safetensors에서 디바이스로 직접 로드, CPU: copy-on-write mmap 뷰 (프로세스 간 페이지 캐시 공유)
+PREPARED_MODELS_DIR = Path(os.environ.get("PREPARED_MODELS_DIR", "./models/_prepared"))
+PREPARED_VERIFY = os.environ.get("PREPARED_VERIFY", "0") == "1"  # 1이면 로드 시 sha256 전체 검증
+_SAFETENSORS_DTYPES = {
+    "F16": torch.float16, "BF16": torch.bfloat16, "F32": torch.float32, "F64": torch.float64,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+_prepared_manifest = None
+
+def get_prepared_manifest() -> dict:
+    """models/_prepared/manifest.json (없으면 빈 dict)"""
+    global _prepared_manifest
+    if _prepared_manifest is None:
+        try:
+            _prepared_manifest = json.loads((PREPARED_MODELS_DIR / "manifest.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _prepared_manifest = {}
+    return _prepared_manifest
+
+def mmap_safetensors(path) -> dict:
+    """safetensors 파일을 mmap(copy-on-write)으로 열어 복사 없는 텐서 뷰 dict 반환"""
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    base = 8 + header_len
+    tensors = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dt = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dt).element_size()
+        if count == 0:
+            tensors[key] = torch.empty(info["shape"], dtype=dt)
+        else:
+            tensors[key] = torch.frombuffer(mm, dtype=dt, count=count, offset=base + start).reshape(info["shape"])
+    return tensors
+
+def _sha256_file(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_prepared_model(name: str, build_empty, target_device: str, dtype=None):
+    """
+    스냅샷에서 모델 로드. 스냅샷이 없거나 실패하면 None (호출측은 from_pretrained로 fallback)
+    build_empty: 가중치 없는 모델 생성 함수 (accelerate 있으면 파라미터는 meta 디바이스에 생성)
+    dtype: 런타임 dtype — "<이름>@<dtype>" 스냅샷(예: CPU용 float32)이 있으면 우선 사용, 없으면 기본 스냅샷을 형변환 (zero-copy 아님)
+    """
+    manifest = get_prepared_manifest()
+    entry = manifest.get(f"{name}@{str(dtype).replace('torch.', '')}") if dtype is not None else None
+    entry = entry or manifest.get(name)
+    if not entry:
+        return None
+    path = PREPARED_MODELS_DIR / entry["file"]
+    if not path.exists() or path.stat().st_size != entry["bytes"]:
+        print(f"⚠️ {name} 스냅샷 손상/없음 — from_pretrained 사용")
+        return None
+    if PREPARED_VERIFY and _sha256_file(path) != entry["sha256"]:
+        print(f"⚠️ {name} 스냅샷 체크섬 불일치 — from_pretrained 사용")
+        return None
+
+    t0 = time.time()
+    try:
+        try:
+            from accelerate import init_empty_weights
+            with init_empty_weights(include_buffers=False):
+                model = build_empty()
+        except ImportError:
+            model = build_empty()
+
+        if str(target_device).startswith("cuda"):
+            from safetensors.torch import load_file
+            state = load_file(str(path), device=str(target_device))
+        else:
+            state = mmap_safetensors(path)
+
+        zero_copy = True
+        if dtype is not None and entry["dtype"] != str(dtype).replace("torch.", ""):
+            state = {k: v.to(dtype) if v.is_floating_point() else v for k, v in state.items()}
+            zero_copy = False
+
+        result = model.load_state_dict(state, strict=False, assign=True)
+        if result.missing_keys or result.unexpected_keys:
+            raise RuntimeError(f"키 불일치 (누락 {len(result.missing_keys)}개: {result.missing_keys[:3]}, "
+                               f"불필요 {len(result.unexpected_keys)}개: {result.unexpected_keys[:3]})")
+        if hasattr(model, "tie_weights"):
+            model.tie_weights()
+        if any(p.is_meta for p in model.parameters()):
+            raise RuntimeError("스냅샷에 없는 파라미터가 있습니다")
+        model.eval()
+    except Exception as e:
+        print(f"⚠️ {name} 스냅샷 로드 실패 ({e}) — from_pretrained 사용")
+        return None
+
+    mode = "zero-copy" if zero_copy else "형변환"
+    print(f"   ⚡ {name} 스냅샷 로드 ({entry['bytes'] / 1e6:.0f}MB, {entry['dtype']}, {mode}, {time.time() - t0:.2f}초)")
+    return model
+
+# BEN2 (지연 임포트 — 가용성만 확인)
+BEN2_AVAILABLE = stack_available("ben2")
+
+# ========== ONNX Runtime 백엔드 (선택) ==========
+# export_onnx.py 가 만든 models/_onnx/<이름>.onnx 를 ONNX Runtime CPU EP로 실행 (portrait, hr-matting, vitpose)
+# 모델별 기본 백엔드: MODEL_BACKENDS="portrait=onnx,vitpose=onnx" / 요청별: ?backend=torch|onnx (A/B 비교)
+ONNX_DIR = Path(os.environ.get("ONNX_DIR", "./models/_onnx"))
+ONNX_INT8 = os.environ.get("ONNX_INT8", "0") == "1"  # export_onnx.py --int8 결과(.int8.onnx) 우선 사용
+ORT_AVAILABLE = stack_available("onnxruntime")
+ONNX_MODEL_NAMES = {"portrait": "birefnet:portrait", "hr-matting": "birefnet:hr-matting", "vitpose": "vitpose:vitpose"}
+MODEL_BACKENDS = {
+    k.strip(): v.strip()
+    for k, _, v in (part.partition("=") for part in os.environ.get("MODEL_BACKENDS", "").split(","))
+    if k.strip() and v.strip() in ("torch", "onnx")
+}
+onnx_models = {}
+onnx_lock = threading.Lock()
+
+def onnx_model_path(name: str):
+    """모델의 ONNX 파일 경로 (int8 우선 옵션). 없으면 None"""
+    stem = ONNX_MODEL_NAMES.get(name)
+    if stem is None:
+        return None
+    stem = stem.replace(":", "__")
+    candidates = ([ONNX_DIR / f"{stem}.int8.onnx"] if ONNX_INT8 else []) + [ONNX_DIR / f"{stem}.onnx"]
+    return next((p for p in candidates if p.exists()), None)
+
+class OnnxModel:
+    """
+    ONNX Runtime 세션 래퍼 (CPU EP, 그래프 최적화 ORT_ENABLE_ALL)
+    BiRefNet: birefnet_forward 에서 run() 호출 / ViTPose: torch 모델처럼 model(**inputs) → outputs.heatmaps
+    """
+    def __init__(self, name: str, path: Path):
+        ort = load_stack("onnxruntime")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = torch.get_num_threads()
+        self.name = name
+        self.path = path
+        self.session = ort.InferenceSession(str(path), sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def run(self, **arrays):
+        return self.session.run(None, {k: v for k, v in arrays.items() if k in self.input_names})
+
+    def __call__(self, **inputs):
+        arrays = {k: v.detach().cpu().numpy() for k, v in inputs.items() if isinstance(v, torch.Tensor)}
+        return SimpleNamespace(heatmaps=torch.from_numpy(self.run(**arrays)[0]))
+
+def get_onnx_model(name: str) -> OnnxModel:
+    """ONNX 세션 로드 (Lazy Loading)"""
+    model = onnx_models.get(name)
+    if model is not None:
+        return model
+    with onnx_lock:
+        if name in onnx_models:
+            return onnx_models[name]
+        path = onnx_model_path(name)
+        if path is None:
+            raise ValueError(f"ONNX 모델 없음: {name} (python export_onnx.py {ONNX_MODEL_NAMES.get(name, name)})")
+        t0 = time.time()
+        onnx_models[name] = OnnxModel(name, path)
+        print(f"✅ ONNX 세션 로드: {name} ({path.name}, {time.time() - t0:.1f}초)")
+        return onnx_models[name]
+
+def resolve_backend(name: str, requested: str = None) -> str:
+    """요청 백엔드 > MODEL_BACKENDS 설정 > torch. 설정상 onnx인데 파일/런타임이 없으면 torch로 대체"""
+    backend = requested or MODEL_BACKENDS.get(name, "torch")
+    if backend != "onnx":
+        return "torch"
+    if ORT_AVAILABLE and onnx_model_path(name) is not None:
+        return "onnx"
+    if requested:
+        raise HTTPException(status_code=400, detail=f"{name}: ONNX 백엔드 사용 불가 (onnxruntime 설치 및 export_onnx.py 실행 필요)")
+    return "torch"
+if not BEN2_AVAILABLE:
     print("⚠️ BEN2 모듈 없음 (pip install ben2)")
 
 # SAM2 모델 (Lazy Loading)
+# Hiera-Large 백본 1개를 프롬프트 predictor와 AutomaticMaskGenerator가 공유.
+# predictor 상태(set_image 결과)는 인스턴스별이므로 각자 락 → 두 엔드포인트가 같은 가중치로 동시 실행 가능
 sam2_predictor = None
-sam2_lock = threading.Lock()  # set_image → predict 원자성 보장
+sam2_lock = threading.Lock()      # /segment-child: set_image → predict 원자성 보장
+sam2_amg_lock = threading.Lock()  # /segment-all: generate 동안 AMG 내부 predictor 상태 보호
+
+# SAM2 이미지 임베딩 캐시: 입력 픽셀 sha1 → set_image 특징 (image_embed + high_res_feats)
+# SAM2는 내부에서 1024×1024로 리사이즈 → 긴 변 SAM2_INPUT_SIDE로 미리 축소한 같은 입력을 두 엔드포인트가 공유
+SAM2_INPUT_SIDE = 1024
+SAM2_EMBED_CACHE_SIZE = int(os.environ.get("SAM2_EMBED_CACHE_SIZE", 8))
+sam2_embed_cache = LRUCache(maxsize=SAM2_EMBED_CACHE_SIZE)
+sam2_embed_stats = {"hits": 0, "misses": 0}
+sam2_embed_stats_lock = threading.Lock()  # /segment-child, /segment-all 추론 스레드가 동시에 갱신
+# 캐시 적중 시 SAM2ImagePredictor 내부 속성(_features, _orig_hw, _is_image_set, _is_batch)을 직접 설정
+# → 검증한 sam2 버전에서만 설치 (다른 버전은 캐시 없이 원래 set_image 사용)
+SAM2_EMBED_CACHE_VERSIONS = ("1.0", "1.1")
+_SAM2_PREDICTOR_STATE = ("_features", "_orig_hw", "_is_image_set", "_is_batch")
+
+def sam2_input_image(image: Image.Image) -> np.ndarray:
+    """SAM2 공용 입력 (긴 변 SAM2_INPUT_SIDE 이하 RGB 배열) — 엔드포인트 간 임베딩 캐시 키 일치"""
+    w, h = image.size
+    if max(w, h) > SAM2_INPUT_SIDE:
+        scale = SAM2_INPUT_SIDE / max(w, h)
+        image = image.resize((int(w * scale), int(h * scale)), Image.Resampling.LANCZOS)
+    return np.ascontiguousarray(np.array(image.convert("RGB")))
+
+def install_sam2_embed_cache(predictor):
+    """predictor.set_image를 임베딩 캐시 버전으로 교체 (AMG 내부의 크롭별 set_image 호출 포함)"""
+    if getattr(predictor, "_embed_cache_installed", False):
+        return
+    try:
+        from importlib.metadata import version as _pkg_version
+        sam2_version = _pkg_version("sam2")
+    except Exception:
+        sam2_version = "unknown"
+    missing = [a for a in _SAM2_PREDICTOR_STATE if not hasattr(predictor, a)]
+    if not sam2_version.startswith(SAM2_EMBED_CACHE_VERSIONS) or missing:
+        print(f"⚠️ SAM2 임베딩 캐시 비활성: sam2 {sam2_version} (검증: {', '.join(SAM2_EMBED_CACHE_VERSIONS)}.x)"
+              + (f", predictor 속성 없음: {missing}" if missing else ""))
+        return
+    original = predictor.set_image
+
+    def set_image(image):
+        arr = np.ascontiguousarray(np.asarray(image))
+        key = (arr.shape, hashlib.sha1(arr.data).hexdigest())
+        features = sam2_embed_cache.get(key)
+        if features is None:
+            with sam2_embed_stats_lock:
+                sam2_embed_stats["misses"] += 1
+            original(image)
+            sam2_embed_cache.put(key, predictor._features)
+            return
+        with sam2_embed_stats_lock:
+            sam2_embed_stats["hits"] += 1
+        predictor.reset_predictor()
+        predictor._features = features
+        predictor._orig_hw = [arr.shape[:2]]
+        predictor._is_image_set = True
+        predictor._is_batch = False
+
+    predictor.set_image = set_image
+    predictor._embed_cache_installed = True
+
+# forward_image: image_encoder + sam_mask_decoder.conv_s0/s1 (predictor가 모듈 밖에서 직접 호출) 를 함께 감쌈
+SAM2_PRECISION_MODULES = ("forward_image", "sam_prompt_encoder", "sam_mask_decoder")
+# 이미지 특징만 반정밀도 유지 (임베딩 캐시 메모리 절감) — 디코더 출력(마스크/IoU 점수)은 fp32 (AMG NMS가 박스와 같은 dtype 요구)
+SAM2_HALF_OUTPUTS = ("forward_image",)
 
 def get_sam2_predictor():
     """SAM2 모델 로드 (Lazy Loading)"""
@@ -274,7 +1046,11 @@ def get_sam2_predictor():
     if not SAM2_AVAILABLE:
         raise ValueError("SAM2 모듈이 설치되지 않았습니다. pip install sam2")
     print("📂 SAM2 모델 로딩 중 (sam2.1-hiera-large)...")
-    sam2_predictor = SAM2ImagePredictor.from_pretrained("facebook/sam2.1-hiera-large", device=device)
+    predictor = load_stack("sam2").SAM2ImagePredictor.from_pretrained("facebook/sam2.1-hiera-large", device=device)
+    # predictor가 하위 모듈/forward_image를 직접 호출 → 모듈별 적용 (autocast만, 이미지 특징은 반정밀도로 캐시)
+    apply_model_precision(predictor.model, "sam2", modules=SAM2_PRECISION_MODULES, keep_outputs=SAM2_HALF_OUTPUTS)
+    install_sam2_embed_cache(predictor)
+    sam2_predictor = predictor
     print(f"✅ SAM2 모델 로드 완료 (device: {device})")
     return sam2_predictor
 
@@ -282,22 +1058,61 @@ def get_sam2_predictor():
 sam2_mask_generator = None
 
 def get_sam2_mask_generator():
-    """SAM2 AutomaticMaskGenerator 로드 (기존 predictor의 model 공유)"""
+    """SAM2 AutomaticMaskGenerator 생성 (기존 predictor의 model 인스턴스 공유 — 가중치 추가 로드 없음)"""
     global sam2_mask_generator
     if sam2_mask_generator is not None:
         return sam2_mask_generator
     predictor = get_sam2_predictor()  # 모델 공유
     print("📂 SAM2 AutomaticMaskGenerator 초기화 중...")
-    sam2_mask_generator = SAM2AutomaticMaskGenerator.from_pretrained(
-        "facebook/sam2.1-hiera-large",
+    generator = load_stack("sam2").SAM2AutomaticMaskGenerator(
+        predictor.model,
         points_per_side=32,
         pred_iou_thresh=0.7,
         stability_score_thresh=0.85,
         min_mask_region_area=100,
     )
-    print("✅ SAM2 AutomaticMaskGenerator 준비 완료")
+    install_sam2_embed_cache(generator.predictor)
+    sam2_mask_generator = generator
+    print("✅ SAM2 AutomaticMaskGenerator 준비 완료 (백본 공유)")
     return sam2_mask_generator
 
+def _tensor_bytes(obj) -> int:
+    if isinstance(obj, torch.Tensor):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, dict):
+        return sum(_tensor_bytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_tensor_bytes(v) for v in obj)
+    return 0
+
+def sam2_memory_report() -> dict:
+    """SAM2 메모리 (/health): 공유 백본 가중치 + 임베딩 캐시 (MB)"""
+    if sam2_predictor is None:
+        return {"loaded": False}
+    model = sam2_predictor.model
+    with sam2_embed_cache._lock:
+        cached = list(sam2_embed_cache._data.values())
+    with sam2_embed_stats_lock:
+        stats = dict(sam2_embed_stats)
+    backbones = {id(model)} | ({id(sam2_mask_generator.predictor.model)} if sam2_mask_generator is not None else set())
+    return {
+        "loaded": True,
+        "weights_mb": round(sum(_tensor_bytes(t) for t in list(model.parameters()) + list(model.buffers())) / 1e6, 1),
+        "backbone_instances": len(backbones),
+        "amg_loaded": sam2_mask_generator is not None,
+        "embed_cache": {
+            "entries": len(cached),
+            "maxsize": SAM2_EMBED_CACHE_SIZE,
+            "mb": round(sum(_tensor_bytes(f) for f in cached) / 1e6, 1),
+            **stats,
+        },
+    }
+
+def _empty_dino_model(repo_id: str):
+    """가중치 없는 DINO 계열 모델 (스냅샷 로드용)"""
+    gd = load_stack("gdino")
+    return gd.AutoModelForZeroShotObjectDetection.from_config(gd.AutoConfig.from_pretrained(repo_id))
+
 # Grounding DINO 모델 (Lazy Loading)
 gdino_model = None
 gdino_processor = None
@@ -310,10 +1125,15 @@ def get_gdino_model():
     if not GDINO_AVAILABLE:
         raise ValueError("Grounding DINO가 설치되지 않았습니다.")
     print("📂 Grounding DINO 모델 로딩 중 (grounding-dino-tiny)...")
-    gdino_processor = GDinoProcessor.from_pretrained("IDEA-Research/grounding-dino-tiny")
-    gdino_model = AutoModelForZeroShotObjectDetection.from_pretrained("IDEA-Research/grounding-dino-tiny")
+    gdino_processor = load_stack("gdino").AutoProcessor.from_pretrained("IDEA-Research/grounding-dino-tiny")
+    gdino_model = load_prepared_model("gdino", lambda: _empty_dino_model("IDEA-Research/grounding-dino-tiny"), device, precision_load_dtype("gdino"))
+    if gdino_model is None:
+        gdino_model = load_stack("gdino").AutoModelForZeroShotObjectDetection.from_pretrained("IDEA-Research/grounding-dino-tiny")
     gdino_model.to(device)
     gdino_model.eval()
+    if apply_model_precision(gdino_model, "gdino") == "fp32":
+        cpu_profile_dino(gdino_model)
+    install_dino_text_cache(gdino_model, "gdino")
     print(f"✅ Grounding DINO 모델 로드 완료 (device: {device})")
     return gdino_model, gdino_processor
 
@@ -329,10 +1149,15 @@ def get_mmdino_model():
     if not GDINO_AVAILABLE:
         raise ValueError("Grounding DINO가 설치되지 않았습니다.")
     print("📂 MM-DINO 모델 로딩 중 (mm_grounding_dino_tiny)...")
-    mmdino_processor = GDinoProcessor.from_pretrained("openmmlab-community/mm_grounding_dino_tiny_o365v1_goldg_v3det")
-    mmdino_model = AutoModelForZeroShotObjectDetection.from_pretrained("openmmlab-community/mm_grounding_dino_tiny_o365v1_goldg_v3det")
+    mmdino_processor = load_stack("gdino").AutoProcessor.from_pretrained("openmmlab-community/mm_grounding_dino_tiny_o365v1_goldg_v3det")
+    mmdino_model = load_prepared_model("mmdino", lambda: _empty_dino_model("openmmlab-community/mm_grounding_dino_tiny_o365v1_goldg_v3det"), device, precision_load_dtype("mmdino"))
+    if mmdino_model is None:
+        mmdino_model = load_stack("gdino").AutoModelForZeroShotObjectDetection.from_pretrained("openmmlab-community/mm_grounding_dino_tiny_o365v1_goldg_v3det")
     mmdino_model.to(device)
     mmdino_model.eval()
+    if apply_model_precision(mmdino_model, "mmdino") == "fp32":
+        cpu_profile_dino(mmdino_model)
+    install_dino_text_cache(mmdino_model, "mmdino")
     print(f"✅ MM-DINO 모델 로드 완료 (device: {device})")
     return mmdino_model, mmdino_processor
 
@@ -348,13 +1173,115 @@ def get_gdino_base_model():
     if not GDINO_AVAILABLE:
         raise ValueError("Grounding DINO가 설치되지 않았습니다.")
     print("📂 Grounding DINO Base 모델 로딩 중 (grounding-dino-base)...")
-    gdino_base_processor = GDinoProcessor.from_pretrained("IDEA-Research/grounding-dino-base")
-    gdino_base_model = AutoModelForZeroShotObjectDetection.from_pretrained("IDEA-Research/grounding-dino-base")
+    gdino_base_processor = load_stack("gdino").AutoProcessor.from_pretrained("IDEA-Research/grounding-dino-base")
+    gdino_base_model = load_prepared_model("gdino-base", lambda: _empty_dino_model("IDEA-Research/grounding-dino-base"), device, precision_load_dtype("gdino-base"))
+    if gdino_base_model is None:
+        gdino_base_model = load_stack("gdino").AutoModelForZeroShotObjectDetection.from_pretrained("IDEA-Research/grounding-dino-base")
     gdino_base_model.to(device)
     gdino_base_model.eval()
+    if apply_model_precision(gdino_base_model, "gdino-base") == "fp32":
+        cpu_profile_dino(gdino_base_model)
+    install_dino_text_cache(gdino_base_model, "gdino-base")
     print(f"✅ Grounding DINO Base 모델 로드 완료 (device: {device})")
     return gdino_base_model, gdino_base_processor
 
+# Grounding DINO 계열 텍스트 프롬프트 캐시 (모델별)
+# 대부분 기본 프롬프트("child . person")로 호출되므로 토크나이즈 결과와 텍스트 인코더 출력을 재사용
+# → 요청마다 이미지 백본 + fusion 비용만 지불
+DINO_TEXT_CACHE_SIZE = int(os.environ.get("DINO_TEXT_CACHE_SIZE", 32))
+dino_text_inputs_cache = {}  # model_name -> LRUCache(normalized prompt -> tokenized BatchEncoding, CPU)
+
+def normalize_dino_prompt(prompt: str) -> str:
+    """프롬프트 정규화: 공백 정리 + 소문자 + 마침표로 끝나도록"""
+    text = " ".join(prompt.strip().lower().split())
+    if not text.endswith('.'):
+        text += '.'
+    return text
+
+class CachedTextBackbone(torch.nn.Module):
+    """
+    text_backbone 래퍼 — 동일 토큰 입력이면 텍스트 인코더 출력을 재사용 (추론 전용)
+    캐시 키는 호출측이 text_key()로 지정 (CPU 토크나이저 출력 기반 — 디바이스 텐서 읽기/GPU 동기화 없음).
+    키가 없으면 캐시 없이 실행
+    """
+    def __init__(self, inner, maxsize: int = DINO_TEXT_CACHE_SIZE):
+        super().__init__()
+        self.inner = inner
+        self.cache = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def text_key(self, key):
+        """이 스레드의 다음 forward 호출에 사용할 캐시 키"""
+        self._local.key = key
+        try:
+            yield
+        finally:
+            self._local.key = None
+
+    def forward(self, *args, **kwargs):
+        key = getattr(self._local, "key", None)
+        if key is None or torch.is_grad_enabled():
+            return self.inner(*args, **kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        out = self.inner(*args, **kwargs)
+        self.cache.put(key, out)
+        return out
+
+def install_dino_text_cache(model, name: str):
+    """DINO 계열 모델의 텍스트 인코더를 캐시 래퍼로 교체"""
+    dino_text_inputs_cache[name] = LRUCache(maxsize=DINO_TEXT_CACHE_SIZE)
+    base = getattr(model, "model", model)
+    backbone = getattr(base, "text_backbone", None)
+    if backbone is None:
+        print(f"   ⚠️ {name}: text_backbone 없음 — 텍스트 인코더 캐시 스킵")
+        return
+    if not isinstance(backbone, CachedTextBackbone):
+        base.text_backbone = CachedTextBackbone(backbone)
+        print(f"   ↳ {name}: 텍스트 인코더 캐시 활성화")
+
+def get_dino_text_inputs(name: str, proc, prompt: str):
+    """정규화된 프롬프트의 토크나이즈 결과 + 텍스트 인코더 캐시 키 (모델별 캐시, 키는 CPU input_ids 바이트)"""
+    cache = dino_text_inputs_cache.setdefault(name, LRUCache(maxsize=DINO_TEXT_CACHE_SIZE))
+    key = normalize_dino_prompt(prompt)
+    entry = cache.get(key)
+    if entry is None:
+        text_inputs = proc(text=key, return_tensors="pt")
+        ids = text_inputs["input_ids"]
+        entry = (text_inputs, (tuple(ids.shape), ids.numpy().tobytes()))
+        cache.put(key, entry)
+    return entry
+
+@contextlib.contextmanager
+def dino_text_key(model, key):
+    """DINO 모델의 텍스트 인코더 캐시 키 지정 (캐시 미설치 모델은 그대로 실행)"""
+    backbone = getattr(getattr(model, "model", model), "text_backbone", None)
+    if not isinstance(backbone, CachedTextBackbone):
+        yield
+        return
+    with backbone.text_key(key):
+        yield
+
+def dino_text_cache_stats() -> dict:
+    """/health용 모델별 텍스트 캐시 통계"""
+    stats = {}
+    for name, m in (("gdino", gdino_model), ("mmdino", mmdino_model), ("gdino-base", gdino_base_model)):
+        if m is None:
+            continue
+        backbone = getattr(getattr(m, "model", m), "text_backbone", None)
+        stats[name] = {
+            "prompts": len(dino_text_inputs_cache.get(name, ())),
+            "encoder_hits": getattr(backbone, "hits", 0),
+            "encoder_misses": getattr(backbone, "misses", 0),
+        }
+    return stats
+
 # Florence-2 모델 (Lazy Loading)
 florence2_model = None
 florence2_processor = None
@@ -367,10 +1294,11 @@ def get_florence2_model():
     if not FLORENCE2_AVAILABLE:
         raise ValueError("Florence-2가 설치되지 않았습니다.")
     print("📂 Florence-2-large-ft 모델 로딩 중...")
+    f2 = load_stack("florence2")
     import unittest.mock
     # flash_attn 미설치 환경 대응: get_imports 패치
     with unittest.mock.patch("transformers.dynamic_module_utils.get_imports", _fixed_get_imports):
-        florence2_model = Florence2Model.from_pretrained(
+        florence2_model = f2.AutoModelForCausalLM.from_pretrained(
             "microsoft/Florence-2-large-ft",
             torch_dtype=torch.float16,
             attn_implementation="sdpa",
@@ -378,7 +1306,7 @@ def get_florence2_model():
         )
     florence2_model.to(device)
     florence2_model.eval()
-    florence2_processor = Florence2Processor.from_pretrained(
+    florence2_processor = f2.AutoProcessor.from_pretrained(
         "microsoft/Florence-2-large-ft",
         trust_remote_code=True,
     )
@@ -397,8 +1325,9 @@ def get_vitmatte_model():
     if not VITMATTE_AVAILABLE:
         raise ValueError("ViTMatte가 설치되지 않았습니다.")
     print("📂 ViTMatte 모델 로딩 중 (vitmatte-small)...")
-    vitmatte_processor = VitMatteImageProcessor.from_pretrained("hustvl/vitmatte-small-composition-1k")
-    vitmatte_model = VitMatteForImageMatting.from_pretrained("hustvl/vitmatte-small-composition-1k")
+    vm = load_stack("vitmatte")
+    vitmatte_processor = vm.VitMatteImageProcessor.from_pretrained("hustvl/vitmatte-small-composition-1k")
+    vitmatte_model = vm.VitMatteForImageMatting.from_pretrained("hustvl/vitmatte-small-composition-1k")
     vitmatte_model.to(device)
     vitmatte_model.half()
     vitmatte_model.eval()
@@ -423,14 +1352,241 @@ BIREFNET_MODELS = {
     "dynamic-matting": "./models/birefnet-dynamic-matting",
 }
 
+# BiRefNet 입력 shape 버킷
+# 사진 비율마다 32배수 입력 shape가 달라 torch.compile 재컴파일이 발생 → 고정 shape 집합으로 패딩 후 마스크 언패딩
+# 버킷 = 긴 변 × 비율(짧은 변/긴 변), 가로/세로 양방향. 서버 시작 시 버킷별로 워밍업 (컴파일/그래프 캡처)
+# BIREFNET_BUCKETING=auto(기본): torch.compile 된 모델만 패딩 (미컴파일 CPU/MPS는 재컴파일 문제가 없고
+# 패딩은 픽셀 증가 + 오른쪽/아래 경계 예측 변화만 있음) / 1: 항상 / 0: 끔
+BIREFNET_BUCKETING = os.environ.get("BIREFNET_BUCKETING", "auto")
+BIREFNET_CUDA_GRAPHS = os.environ.get("BIREFNET_CUDA_GRAPHS", "1") == "1"
+BIREFNET_BUCKET_SIDES = [int(v) for v in os.environ.get("BIREFNET_BUCKET_SIDES", "512,1024,1440").split(",") if v.strip()]
+BIREFNET_BUCKET_ASPECTS = [float(v) for v in os.environ.get("BIREFNET_BUCKET_ASPECTS", "1.0,0.75,0.5625").split(",") if v.strip()]
+
+def _build_birefnet_buckets():
+    """(width, height) 버킷 목록 (면적 오름차순, 중복 제거)"""
+    buckets = set()
+    for side in BIREFNET_BUCKET_SIDES:
+        side = (side // 32) * 32
+        for aspect in BIREFNET_BUCKET_ASPECTS:
+            short = max(32, ((int(np.ceil(side * aspect)) + 31) // 32) * 32)
+            buckets.add((side, short))
+            buckets.add((short, side))
+    return sorted(buckets, key=lambda b: (b[0] * b[1], b))
+
+BIREFNET_BUCKETS = _build_birefnet_buckets() if BIREFNET_BUCKETING != "0" else []
+bucket_stats = {}  # "WxH" 또는 "miss:WxH" -> 호출 수
+bucket_stats_lock = threading.Lock()
+
+def select_birefnet_bucket(w: int, h: int):
+    """(w, h)를 담을 수 있는 가장 작은 버킷. 없으면 None (원래 shape로 실행)"""
+    for bw, bh in BIREFNET_BUCKETS:
+        if bw >= w and bh >= h:
+            return (bw, bh)
+    return None
+
+def birefnet_bucketed(model) -> bool:
+    """이 모델에 shape 버킷 패딩을 적용할지 (auto: torch.compile 된 모델만)"""
+    if not BIREFNET_BUCKETS:
+        return False
+    return BIREFNET_BUCKETING == "1" or hasattr(model, "_orig_mod")
+
+# CUDA graph(reduce-overhead) 모델 전용 실행 스레드
+# inductor cudagraph tree는 스레드별로 유지 → 워밍업/요청을 한 스레드에서 실행해야 버킷별 캡처 1회, 메모리 풀 1개
+birefnet_graph_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="birefnet-graph")
+
+def _reset_birefnet_graph_executor():
+    """fork 자식용 새 실행기 (_reset_inference_executor 참고)"""
+    global birefnet_graph_executor
+    birefnet_graph_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="birefnet-graph")
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_birefnet_graph_executor)
+
+def _graphed_forward(model, input_tensor):
+    with torch.no_grad():
+        # 다음 replay가 출력 버퍼를 덮어쓰므로 복사본 반환
+        return model(input_tensor)[-1].clone()
+
+def birefnet_forward(model, input_tensor):
+    """BiRefNet forward → 마지막 출력 logits. CPU 프로파일: channels_last 입력 + (지원 시) bf16 autocast"""
+    if getattr(model, "_birefnet_graphed", False):
+        if threading.current_thread().name.startswith("birefnet-graph"):
+            return _graphed_forward(model, input_tensor)
+        return birefnet_graph_executor.submit(_graphed_forward, model, input_tensor).result()
+    if isinstance(model, OnnxModel):
+        return torch.from_numpy(model.run(pixel_values=input_tensor.float().numpy())[0])
+    if input_tensor.device.type == "cpu" and CPU_PROFILE:
+        if CPU_CHANNELS_LAST:
+            input_tensor = input_tensor.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=CPU_BF16):
+            return model(input_tensor)[-1].float()
+    with torch.no_grad():
+        return model(input_tensor)[-1]
+
+def run_birefnet(model, input_tensor):
+    """BiRefNet 추론 (버킷 패딩 → 추론 → 언패딩). 입력 [1,3,H,W] (모델 디바이스/dtype), 출력 sigmoid [1,1,H,W] CPU"""
+    h, w = input_tensor.shape[-2:]
+    bucket = None
+    if birefnet_bucketed(model):
+        bucket = select_birefnet_bucket(w, h)
+        key = f"{bucket[0]}x{bucket[1]}" if bucket else f"miss:{w}x{h}"
+        with bucket_stats_lock:
+            bucket_stats[key] = bucket_stats.get(key, 0) + 1
+    if bucket and bucket != (w, h):
+        # 오른쪽/아래만 0 패딩 (정규화 후 0 = 평균색)
+        input_tensor = torch.nn.functional.pad(input_tensor, (0, bucket[0] - w, 0, bucket[1] - h))
+    preds = birefnet_forward(model, input_tensor).sigmoid()
+    return preds[..., :h, :w].cpu()
+
+def birefnet_tiled(model, input_tensor, tile: int, overlap: int = 128, coarse_side: int = 1024):
+    """
+    고해상도 BiRefNet 타일 추론. 입력 [1,3,H,W] (모델 디바이스/dtype), 출력 sigmoid [H,W] float CPU
+    tile <= 0 또는 tile >= 긴 변: 타일 없이 원해상도 한 번 추론 (run_birefnet과 동일)
+    그 외: 1) 긴 변 coarse_side 전역 패스 → 업샘플 (타일이 못 보는 전체 문맥)
+          2) 전역 결과에 경계(0.02~0.98)가 있는 타일만 원해상도로 재추론, 겹침 영역은 선형 가중 합성
+    타일 크기가 버킷과 같으면 (1024) 컴파일/CUDA graph 재사용
+    """
+    F = torch.nn.functional
+    h, w = input_tensor.shape[-2:]
+    if tile <= 0 or tile >= max(h, w):
+        return run_birefnet(model, input_tensor)[0, 0].float()
+    scale = min(1.0, coarse_side / max(h, w))
+    ch, cw = max(32, int(h * scale) // 32 * 32), max(32, int(w * scale) // 32 * 32)
+    coarse_in = input_tensor if (ch, cw) == (h, w) else F.interpolate(input_tensor, size=(ch, cw), mode="bilinear", align_corners=False)
+    coarse = run_birefnet(model, coarse_in).float()
+    alpha = F.interpolate(coarse, size=(h, w), mode="bilinear", align_corners=False)[0, 0]
+
+    overlap = max(0, min(overlap, tile // 2))
+    stride = tile - overlap
+
+    def _starts(length):
+        last = max(length - tile, 0)
+        return sorted(set(list(range(0, last, stride)) + [last]))
+
+    ramp = torch.minimum(torch.arange(1, tile + 1), torch.arange(tile, 0, -1)).float()
+    ramp = (ramp / max(overlap, 1)).clamp_(max=1.0)
+    window = ramp[:, None] * ramp[None, :]
+
+    acc = torch.zeros(h, w)
+    wsum = torch.zeros(h, w)
+    ran = 0
+    for y in _starts(h):
+        for x in _starts(w):
+            th, tw = min(tile, h - y), min(tile, w - x)
+            region = alpha[y:y + th, x:x + tw]
+            if not ((region > 0.02) & (region < 0.98)).any():
+                continue  # 확실한 전경/배경 타일은 전역 결과 사용
+            pred = run_birefnet(model, input_tensor[..., y:y + th, x:x + tw])[0, 0].float()
+            weight = window[:th, :tw]
+            acc[y:y + th, x:x + tw] += pred * weight
+            wsum[y:y + th, x:x + tw] += weight
+            ran += 1
+    print(f"   🧩 타일 {ran}/{len(_starts(h)) * len(_starts(w))}개 재추론 ({tile}px, overlap {overlap})")
+    return torch.where(wsum > 0, acc / wsum.clamp_min(1e-6), alpha)
+
+def birefnet_bucket_report() -> dict:
+    """버킷 적중률 리포트 (/health)"""
+    with bucket_stats_lock:
+        counts = dict(bucket_stats)
+    total = sum(counts.values())
+    misses = sum(v for k, v in counts.items() if k.startswith("miss:"))
+    return {
+        "mode": BIREFNET_BUCKETING,
+        "buckets": [f"{bw}x{bh}" for bw, bh in BIREFNET_BUCKETS],
+        "calls": total,
+        "hit_rate": round((total - misses) / total, 3) if total else None,
+        "counts": counts,
+    }
+
+# BiRefNet 디바이스별 복제본 (예: "portrait=cuda,cpu;hr-matting=cuda")
+# 한 모델을 여러 디바이스(GPU fp16 + CPU fp32)에 올려두고 요청마다 예상 완료 시간이 가장 짧은 복제본으로 분배
+# → GPU가 밀릴 때 남는 CPU가 버스트를 흡수. 첫 디바이스가 기본 복제본 (/smart-crop 등 직접 호출용)
+def _parse_birefnet_replicas():
+    replicas = {}
+    for part in os.environ.get("BIREFNET_REPLICAS", "").split(";"):
+        name, _, devs = part.partition("=")
+        if name.strip() and devs.strip():
+            replicas[name.strip()] = [d.strip() for d in devs.split(",") if d.strip()]
+    if PORTRAIT_ON_CPU and "portrait" not in replicas:
+        replicas["portrait"] = ["cpu"]
+    return replicas
+
+BIREFNET_REPLICAS = _parse_birefnet_replicas()
+
+# 스레드 설정은 프로세스 전역 → CPU 노드 또는 CPU 복제본이 있을 때만 (GPU 노드의 torch 기본값은 유지)
+if CPU_PROFILE and (device == "cpu" or any("cpu" in devs for devs in BIREFNET_REPLICAS.values())):
+    apply_cpu_threads()
+
+def birefnet_devices(model_type: str) -> list:
+    """모델 복제본 디바이스 목록 (현재 머신에서 사용 불가한 디바이스 제외)"""
+    devs = [d for d in BIREFNET_REPLICAS.get(model_type, []) if d in ("cpu", device)]
+    return devs or [device]
+
+class ReplicaScheduler:
+    """
+    복제본 스케줄러: 예상 완료 시간 = (처리 중 요청 + 1) × 디바이스·shape 버킷별 지연 EMA
+    측정값이 없는 버킷은 같은 디바이스의 다른 버킷 평균 → 모델의 가장 느린 측정값 → prior (BIREFNET_REPLICA_PRIOR_SEC)
+    (0으로 두면 미측정 복제본이 대기열 깊이와 무관하게 모든 요청을 가져감)
+    """
+    def __init__(self, alpha: float = 0.2, prior: float = 1.0):
+        self.alpha = alpha
+        self.prior = prior
+        self._lock = threading.Lock()
+        self.queue = {}    # (model, device) -> 처리 중 요청 수
+        self.latency = {}  # (model, device, bucket) -> 지연 EMA (초)
+        self.routed = {}   # (model, device) -> 누적 요청 수
+
+    def _estimate(self, model: str, dev: str, bucket: str) -> float:
+        lat = self.latency.get((model, dev, bucket))
+        if lat is None:
+            others = [v for (m, d, _), v in self.latency.items() if m == model and d == dev]
+            if others:
+                lat = sum(others) / len(others)
+            else:
+                known = [v for (m, _, _), v in self.latency.items() if m == model]
+                lat = max(known) if known else self.prior
+        return (self.queue.get((model, dev), 0) + 1) * lat
+
+    def acquire(self, model: str, devices: list, bucket: str) -> str:
+        """예상 완료 시간이 가장 짧은 디바이스 선택 + 대기열 등록"""
+        with self._lock:
+            dev = min(devices, key=lambda d: self._estimate(model, d, bucket)) if len(devices) > 1 else devices[0]
+            self.queue[(model, dev)] = self.queue.get((model, dev), 0) + 1
+            self.routed[(model, dev)] = self.routed.get((model, dev), 0) + 1
+        return dev
+
+    def release(self, model: str, dev: str, bucket: str, seconds=None):
+        with self._lock:
+            self.queue[(model, dev)] = max(0, self.queue.get((model, dev), 1) - 1)
+        if seconds is not None:
+            self.record(model, dev, bucket, seconds)
+
+    def record(self, model: str, dev: str, bucket: str, seconds: float):
+        with self._lock:
+            prev = self.latency.get((model, dev, bucket))
+            self.latency[(model, dev, bucket)] = seconds if prev is None else prev + self.alpha * (seconds - prev)
+
+    def report(self) -> dict:
+        """복제본 상태 (/health)"""
+        with self._lock:
+            out = {}
+            for (m, d, b), v in sorted(self.latency.items()):
+                out.setdefault(m, {}).setdefault(d, {"latency": {}})["latency"][b] = round(v, 3)
+            for (m, d), n in self.routed.items():
+                entry = out.setdefault(m, {}).setdefault(d, {"latency": {}})
+                entry["routed"] = n
+                entry["queue"] = self.queue.get((m, d), 0)
+            return out
+
+replica_scheduler = ReplicaScheduler(prior=float(os.environ.get("BIREFNET_REPLICA_PRIOR_SEC", 1.0)))
+
 # torch.compile 가용성 체크 (Triton 필요)
 TORCH_COMPILE_OK = False
 if os.environ.get("TORCH_COMPILE", "1") == "1":
-    try:
-        import triton
+    if importlib.util.find_spec("triton") is not None:
         TORCH_COMPILE_OK = True
         print("✅ Triton 감지 — torch.compile 활성화")
-    except ImportError:
+    else:
         print("⚠️ Triton 미설치 — torch.compile 비활성화 (Windows는 미지원)")
 
 # 로드된 모델 캐시
@@ -445,7 +1601,10 @@ def get_ben2_model():
     if not BEN2_AVAILABLE:
         raise ValueError("BEN2 모듈이 설치되지 않았습니다. pip install ben2")
     print("📂 BEN2 모델 로딩 중...")
-    ben2_model = BEN_Base.from_pretrained("PramaLLC/BEN2")
+    BEN_Base = load_stack("ben2").BEN_Base
+    ben2_model = load_prepared_model("ben2", BEN_Base, device, torch.float32)
+    if ben2_model is None:
+        ben2_model = BEN_Base.from_pretrained("PramaLLC/BEN2")
     ben2_model.to(device)
     ben2_model.eval()
     print("✅ BEN2 모델 로드 완료")
@@ -469,113 +1628,360 @@ async def call_removebg_api(image_data: bytes, size: str = "preview") -> Image.I
         raise ValueError(f"remove.bg API 오류 ({resp.status_code}): {error_detail}")
     return Image.open(io.BytesIO(resp.content)).convert("RGBA")
 
-def get_birefnet_model(model_type: str = "portrait") -> AutoModelForImageSegmentation:
-    """BiRefNet 모델 로드 (Lazy Loading)"""
+def birefnet_replica_key(model_type: str, target_device: str) -> str:
+    """loaded_models 키: 기본 복제본은 모델 이름, 추가 복제본은 '모델@디바이스'"""
+    return model_type if target_device == birefnet_devices(model_type)[0] else f"{model_type}@{target_device}"
+
+# 가중치 체크섬 → 로드된 모델 (디바이스별). 같은 체크포인트를 가리키는 모델 이름은 한 번만 로드
+_birefnet_checksums = {}   # model_type → sha256
+_birefnet_by_checksum = {}  # (sha256, 디바이스) → 모델
+_birefnet_load_lock = threading.Lock()
+
+# 폴더 해시 캐시: 모델 폴더 경로 → {지문(파일 이름/크기/수정시각), sha256} — 가중치가 바뀔 때만 재계산
+WEIGHTS_DIGEST_CACHE = COMPILE_CACHE_DIR.parent / "weights_sha256.json"
+
+def _read_weights_digests() -> dict:
+    try:
+        return json.loads(WEIGHTS_DIGEST_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def birefnet_weights_checksum(model_type: str) -> str:
+    """
+    가중치 sha256 — prepare_models 스냅샷 manifest 값 우선 (계산 없음),
+    없으면 모델 폴더 가중치 파일 해시 (WEIGHTS_DIGEST_CACHE에 지문과 함께 저장 → 파일이 바뀔 때만 재계산)
+    """
+    if model_type in _birefnet_checksums:
+        return _birefnet_checksums[model_type]
+    entry = get_prepared_manifest().get(f"birefnet:{model_type}")
+    if entry and entry.get("sha256"):
+        checksum = entry["sha256"]
+    else:
+        root = Path(BIREFNET_MODELS[model_type])
+        cache_key = str(root.resolve())
+        fingerprint = model_fingerprint(str(root))
+        digests = _read_weights_digests()
+        cached = digests.get(cache_key)
+        if cached and cached.get("fingerprint") == fingerprint:
+            checksum = cached["sha256"]
+        else:
+            h = hashlib.sha256()
+            weights = sorted(f for f in root.rglob("*") if f.is_file() and f.suffix in (".safetensors", ".bin", ".pth", ".pt"))
+            for f in weights:
+                with open(f, "rb") as fh:
+                    for chunk in iter(lambda: fh.read(16 * 1024 * 1024), b""):
+                        h.update(chunk)
+            checksum = h.hexdigest() if weights else f"path:{cache_key}"
+            digests[cache_key] = {"fingerprint": fingerprint, "sha256": checksum}
+            try:
+                WEIGHTS_DIGEST_CACHE.parent.mkdir(parents=True, exist_ok=True)
+                WEIGHTS_DIGEST_CACHE.write_text(json.dumps(digests, indent=2), encoding="utf-8")
+            except OSError as e:
+                print(f"⚠️ 가중치 해시 캐시 저장 실패: {e}")
+    _birefnet_checksums[model_type] = checksum
+    return checksum
+
+def get_birefnet_model(model_type: str = "portrait", target_device: str = None) -> torch.nn.Module:
+    """BiRefNet 모델 로드 (Lazy Loading) — target_device 미지정 시 기본 복제본"""
     global loaded_models
 
-    if model_type in loaded_models:
-        return loaded_models[model_type]
+    target_device = target_device or birefnet_devices(model_type)[0]
+    key = birefnet_replica_key(model_type, target_device)
+    if key in loaded_models:
+        return loaded_models[key]
 
     model_path = BIREFNET_MODELS.get(model_type)
     if not model_path:
         raise ValueError(f"지원하지 않는 모델: {model_type}")
 
+    with _birefnet_load_lock:
+        if key in loaded_models:
+            return loaded_models[key]
+        checksum = birefnet_weights_checksum(model_type) if Path(model_path).exists() else None
+        shared = _birefnet_by_checksum.get((checksum, target_device)) if checksum else None
+        if shared is not None:
+            # 동일 체크포인트가 다른 이름으로 이미 로드됨 → 같은 인스턴스 공유
+            loaded_models[key] = shared
+            print(f"♻️ {key}: 동일 가중치(sha256 {checksum[:12]}) 이미 로드됨 — 공유")
+            return shared
+        model = _load_birefnet(model_type, model_path, target_device)
+        loaded_models[key] = model
+        if checksum:
+            _birefnet_by_checksum[(checksum, target_device)] = model
+    print(f"✅ {key} 모델 로드 완료")
+    return model
+
+_birefnet_compiled_count = 0
+
+def raise_dynamo_recompile_limit():
+    """
+    버킷 shape마다 그래프 1개 (dynamic=False) → dynamo 재컴파일 상한(기본 8)을 버킷 수 × 컴파일 모델 수 이상으로.
+    상한에 걸리면 나머지 버킷(면적 오름차순 워밍업 → 가장 큰 1440 버킷)이 eager로 떨어짐
+    """
+    global _birefnet_compiled_count
+    _birefnet_compiled_count += 1
+    needed = len(BIREFNET_BUCKETS) * _birefnet_compiled_count + 8
+    cfg = torch._dynamo.config
+    cfg.cache_size_limit = max(cfg.cache_size_limit, needed)
+    cfg.accumulated_cache_size_limit = max(cfg.accumulated_cache_size_limit, needed)
+
+def _load_birefnet(model_type: str, model_path: str, target_device: str) -> torch.nn.Module:
+    """BiRefNet 가중치 로드 + 디바이스/dtype/CPU 프로파일/torch.compile 적용"""
     print(f"📂 {model_type} 모델 로딩 중... ({model_path})")
 
-    try:
-        model = AutoModelForImageSegmentation.from_pretrained(
-            model_path,
-            trust_remote_code=True,
-            local_files_only=True
-        )
-    except OSError as e:
-        print(f"❌ 오류: 모델 폴더가 없습니다. ({model_path})")
-        raise e
+    # CPU 복제본 → float32, GPU 복제본 → float16
+    bn = load_stack("birefnet")
 
-    # Portrait → CPU(float32), 나머지 → GPU(float16)로 병렬 처리 가능
-    target_device = device
-    if PORTRAIT_ON_CPU and model_type == "portrait":
-        target_device = "cpu"
+    def _empty_birefnet():
+        config = bn.AutoConfig.from_pretrained(model_path, trust_remote_code=True, local_files_only=True)
+        return bn.AutoModelForImageSegmentation.from_config(config, trust_remote_code=True)
+
+    model = load_prepared_model(
+        f"birefnet:{model_type}", _empty_birefnet, target_device,
+        torch.float32 if target_device == "cpu" else torch.float16,
+    )
+    if model is None:
+        try:
+            model = bn.AutoModelForImageSegmentation.from_pretrained(
+                model_path,
+                trust_remote_code=True,
+                local_files_only=True
+            )
+        except OSError as e:
+            print(f"❌ 오류: 모델 폴더가 없습니다. ({model_path})")
+            raise e
 
     model.to(target_device)
     if target_device != "cpu":
         model.half()
     model.eval()
+    cpu_profile_birefnet(model)
     print(f"   ↳ 디바이스: {target_device}")
 
     # torch.compile 최적화 (Triton 필요 — Linux/WSL만 지원)
+    # 버킷 shape 고정 → dynamic=False, CUDA면 reduce-overhead 모드로 버킷별 CUDA graph 캡처
     if TORCH_COMPILE_OK:
         try:
-            model = torch.compile(model)
-            print(f"   ↳ torch.compile 적용")
+            if BIREFNET_BUCKETS:
+                raise_dynamo_recompile_limit()
+            if BIREFNET_BUCKETS and target_device == "cuda" and BIREFNET_CUDA_GRAPHS:
+                model = torch.compile(model, mode="reduce-overhead", dynamic=False)
+                model._birefnet_graphed = True  # 캡처/실행은 birefnet_graph_executor 스레드에서만
+                print("   ↳ torch.compile 적용 (reduce-overhead, CUDA graph)")
+            else:
+                model = torch.compile(model, dynamic=False if BIREFNET_BUCKETS else None)
+                print("   ↳ torch.compile 적용")
         except Exception as e:
             print(f"   ⚠️ torch.compile 스킵: {e}")
 
-    loaded_models[model_type] = model
-    print(f"✅ {model_type} 모델 로드 완료")
     return model
 
+def model_fingerprint(model_path: str) -> str:
+    """모델 폴더 지문 (가중치 파일 이름/크기/수정시각 + config.json 내용)"""
+    h = hashlib.sha1()
+    root = Path(model_path)
+    if not root.exists():
+        return "missing"
+    for f in sorted(root.rglob("*")):
+        if not f.is_file():
+            continue
+        if f.name == "config.json":
+            h.update(f.read_bytes())
+        elif f.suffix in (".safetensors", ".bin", ".pth", ".pt"):
+            st = f.stat()
+            h.update(f"{f.relative_to(root)}:{st.st_size}:{int(st.st_mtime)}".encode())
+    return h.hexdigest()
+
+def compile_cache_key(model_types) -> str:
+    """컴파일 아티팩트 캐시 키: 모델 지문 + torch 버전 + 디바이스 + shape 버킷 + 컴파일 모드"""
+    parts = {
+        "torch": TORCH_VERSION,
+        "device": device,
+        "models": {m: model_fingerprint(BIREFNET_MODELS[m]) for m in model_types},
+        "buckets": [f"{bw}x{bh}" for bw, bh in BIREFNET_BUCKETS],
+        "cuda_graphs": BIREFNET_CUDA_GRAPHS,
+        "replicas": {m: birefnet_devices(m) for m in model_types},
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+def _compile_manifest_path() -> Path:
+    return COMPILE_CACHE_DIR / "manifest.json"
+
+def _read_compile_manifest() -> dict:
+    try:
+        return json.loads(_compile_manifest_path().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def load_compile_cache(key: str) -> bool:
+    """저장된 컴파일 아티팩트(mega-cache) 로드. 성공 시 True"""
+    if not (COMPILE_CACHE_ENABLED and TORCH_COMPILE_OK):
+        return False
+    artifact = COMPILE_CACHE_DIR / f"artifacts-{key}.bin"
+    if not artifact.exists() or not hasattr(torch.compiler, "load_cache_artifacts"):
+        return False
+    try:
+        torch.compiler.load_cache_artifacts(artifact.read_bytes())
+        print(f"♨️ 컴파일 캐시 로드: {artifact.name}")
+        return True
+    except Exception as e:
+        print(f"⚠️ 컴파일 캐시 로드 실패 (재생성): {e}")
+        return False
+
+def save_compile_cache(key: str, warm: bool, seconds: float):
+    """컴파일 아티팩트 저장 + 콜드/웜 시작 시간 기록 및 비교 로그"""
+    if not (COMPILE_CACHE_ENABLED and TORCH_COMPILE_OK):
+        return
+    manifest = _read_compile_manifest()
+    entry = manifest.setdefault(key, {})
+    if warm:
+        entry["warm_seconds"] = round(seconds, 2)
+    else:
+        entry["cold_seconds"] = round(seconds, 2)
+        if hasattr(torch.compiler, "save_cache_artifacts"):
+            try:
+                result = torch.compiler.save_cache_artifacts()
+                if result is not None:
+                    (COMPILE_CACHE_DIR / f"artifacts-{key}.bin").write_bytes(result[0])
+                    print(f"💾 컴파일 아티팩트 저장: artifacts-{key}.bin ({len(result[0]) / 1e6:.1f}MB)")
+            except Exception as e:
+                print(f"⚠️ 컴파일 아티팩트 저장 실패: {e}")
+    entry["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        _compile_manifest_path().write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    except OSError as e:
+        print(f"⚠️ 컴파일 캐시 manifest 저장 실패: {e}")
+    cold = entry.get("cold_seconds")
+    if warm and cold:
+        print(f"🧊 모델 준비 시간: 웜 캐시 {seconds:.1f}초 vs 콜드 {cold:.1f}초 ({cold / max(seconds, 1e-3):.1f}배)")
+    else:
+        print(f"🧊 모델 준비 시간: 콜드 {seconds:.1f}초 (다음 시작부터 캐시 사용)")
+
 # 3. 모든 모델 사전 로드 + 워밍업
 # 서버 시작 시 3개 모델 모두 VRAM에 올려두기 (첫 요청 지연 제거)
 
 def warmup_birefnet(model, name):
-    """BiRefNet 모델 워밍업 (torch.compile 첫 실행 그래프 생성 포함)"""
+    """
+    BiRefNet 모델 워밍업 (torch.compile 첫 실행 그래프 생성 포함) — 버킷 사용 시 모든 버킷 shape
+    preload_models가 inference_executor에서 실행, CUDA graph 모델은 birefnet_forward가 전용 스레드로 보냄
+    """
     model_device = next(model.parameters()).device
-    print(f"🔥 {name} 워밍업 중 ({model_device})...")
+    shapes = (BIREFNET_BUCKETS if birefnet_bucketed(model) else []) or [(1024, 1024)]
+    if model_device.type == "mps":
+        shapes = [s for s in shapes if max(s) <= 2560]
+    print(f"🔥 {name} 워밍업 중 ({model_device}, {len(shapes)}개 shape)...")
     with torch.no_grad():
-        dummy = torch.randn(1, 3, 1024, 1024).to(model_device)
-        if model_device.type != "cpu":
-            dummy = dummy.half()
-        model(dummy)
-        del dummy
+        for bw, bh in shapes:
+            t0 = time.time()
+            dummy = torch.randn(1, 3, bh, bw).to(model_device)
+            if model_device.type != "cpu":
+                dummy = dummy.half()
+            # CUDA graph 캡처는 첫 몇 회 실행 후 이뤄지므로 2회 실행
+            for _ in range(2 if BIREFNET_CUDA_GRAPHS and model_device.type == "cuda" else 1):
+                birefnet_forward(model, dummy)
+            # 복제본 스케줄러 초기 지연값 (컴파일/캡처 이후 1회 측정)
+            if model_device.type == "cuda":
+                torch.cuda.synchronize()
+            t1 = time.time()
+            birefnet_forward(model, dummy)
+            if model_device.type == "cuda":
+                torch.cuda.synchronize()
+            replica_scheduler.record(name, model_device.type, f"{bw}x{bh}", time.time() - t1)
+            del dummy
+            if len(shapes) > 1:
+                print(f"   ↳ {bw}x{bh}: {time.time() - t0:.2f}초")
     clear_gpu_memory()
     print(f"   ✅ {name} 워밍업 완료")
 
-# Portrait 모델
-print("📂 모든 배경 제거 모델 사전 로딩 중...")
-try:
-    portrait_model = get_birefnet_model("portrait")
-except OSError:
-    print(f"❌ 오류: portrait 모델 폴더가 없습니다.")
-    exit()
-warmup_birefnet(portrait_model, "portrait")
+# 사전 로드 대상 (콤마 구분). 빈 값이면 사전 로드 없이 첫 요청 시 로드
+# 예: 모델 엔드포인트도 쓰는 CPU 노드 → PRELOAD_MODELS="" (책 API 전용이면 SERVER_PROFILE=book — torch 미임포트)
+PRELOAD_MODELS = [m.strip() for m in os.environ.get("PRELOAD_MODELS", "portrait,hr-matting,ben2").split(",") if m.strip()]
+
+# 프로세스 역할: standalone(기본, 단일 프로세스) | api(추론은 워커 프로세스에 위임) | worker(inference_pool 워커)
+INFERENCE_PROCS = int(os.environ.get("INFERENCE_PROCS", 0))
+SERVER_ROLE = os.environ.get("SERVER_ROLE") or ("api" if INFERENCE_PROCS > 0 else "standalone")
+# API 모드에서 요청 전체를 추론 워커로 전달하는 모델 엔드포인트 (워커가 자기 app으로 처리)
+# → API 프로세스는 가중치를 로드하지 않음. /remove-bg는 디코드/인코딩을 API에 두고 마스크 추론만 위임 (공유 메모리)
+# 워커별 캐시(roi_id, 감지 결과, SAM2 임베딩)는 워커 간 공유되지 않음
+API_ROLE_WORKER_PATHS = {
+    "/detect-pose", "/detect-pose-batch", "/smart-crop", "/segment-child", "/segment-all", "/detect-child",
+    "/vitmatte", "/mematte", "/birefnet-matting", "/diffmatte",
+}
 
-# hr-matting 모델
-try:
-    hrmatting_model = get_birefnet_model("hr-matting")
-    warmup_birefnet(hrmatting_model, "hr-matting")
-except Exception as e:
-    print(f"⚠️ hr-matting 사전 로드 실패: {e}")
+def preload_models(names):
+    """BiRefNet/BEN2 사전 로드 + 워밍업 (컴파일 캐시 로드/저장 포함)"""
+    if not names:
+        print("⏭️ 모델 사전 로드 생략 (PRELOAD_MODELS 비어 있음) — 첫 요청 시 로드")
+        return
+    print(f"📂 모든 배경 제거 모델 사전 로딩 중... ({', '.join(names)})")
+    preload_start = time.time()
+    birefnet_names = [m for m in names if m in BIREFNET_MODELS]
+    compile_key = compile_cache_key([m for m in birefnet_names if Path(BIREFNET_MODELS[m]).exists()])
+    compile_warm = load_compile_cache(compile_key)
+
+    for name in birefnet_names:
+        try:
+            for dev in birefnet_devices(name):
+                # 요청과 같은 실행기 스레드에서 워밍업 (메인 임포트 스레드 아님)
+                inference_executor.submit(warmup_birefnet, get_birefnet_model(name, dev), name).result()
+        except OSError:
+            if name == "portrait":
+                print("❌ 오류: portrait 모델 폴더가 없습니다.")
+                exit()
+            print(f"⚠️ {name} 사전 로드 실패: 모델 폴더 없음")
+        except Exception as e:
+            print(f"⚠️ {name} 사전 로드 실패: {e}")
 
-# BEN2 모델
-if BEN2_AVAILABLE:
-    try:
-        ben2 = get_ben2_model()
-        # BEN2 워밍업: 더미 이미지로 inference 한 번
-        print(f"🔥 BEN2 워밍업 중 ({device})...")
-        dummy_img = Image.new("RGB", (512, 512), (128, 128, 128))
-        with torch.no_grad():
-            ben2.inference(dummy_img)
-        del dummy_img
-        clear_gpu_memory()
-        print(f"   ✅ BEN2 워밍업 완료")
-    except Exception as e:
-        print(f"⚠️ BEN2 사전 로드 실패: {e}")
+    # BEN2 모델
+    if "ben2" in names and BEN2_AVAILABLE:
+        try:
+            ben2 = get_ben2_model()
+            # BEN2 워밍업: 더미 이미지로 inference 한 번
+            print(f"🔥 BEN2 워밍업 중 ({device})...")
+            dummy_img = Image.new("RGB", (512, 512), (128, 128, 128))
+            with torch.no_grad():
+                ben2.inference(dummy_img)
+            del dummy_img
+            clear_gpu_memory()
+            print("   ✅ BEN2 워밍업 완료")
+        except Exception as e:
+            print(f"⚠️ BEN2 사전 로드 실패: {e}")
+
+    import_profile["model preload"] = time.time() - preload_start
+    save_compile_cache(compile_key, compile_warm, time.time() - preload_start)
+    print("✅ 모든 모델 준비 완료!")
 
-print("✅ 모든 모델 준비 완료!")
+if SERVER_ROLE == "api":
+    print(f"🏭 API 모드: 모델은 추론 워커 {INFERENCE_PROCS}개에서 로드 (이 프로세스는 업로드/인코딩 전담)")
+else:
+    preload_models(PRELOAD_MODELS)
+
+# 정규화 설정 (torchvision 지연 임포트)
+_transform_normalize = None
 
-# 정규화 설정
-transform_normalize = transforms.Compose([
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+def transform_normalize(image: Image.Image):
+    """ToTensor + ImageNet 정규화"""
+    global _transform_normalize
+    if _transform_normalize is None:
+        transforms = load_stack("torchvision").transforms
+        _transform_normalize = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+    return _transform_normalize(image)
 
-def process_image_fast(image: Image.Image, max_size: int = 1440, model_type: str = "portrait") -> Image.Image:
+def process_image_fast(image: Image.Image, max_size: int = 1440, model_type: str = "portrait", roi=None, backend: str = "torch") -> Image.Image:
     """
     이미지 배경 제거 처리
     max_size: 처리 해상도 (720=빠름, 1024=중간, 1440=권장, 2048=최고품질, 9999=원본)
     model_type: BiRefNet 모델 종류 (portrait, hr, hr-matting, dynamic)
+    roi: (x1, y1, x2, y2) — 지정 시 ROI만 max_size 예산으로 처리 후 전체 프레임 마스크로 복원
+    backend: torch | onnx (ONNX Runtime CPU, resolve_backend로 확인된 값)
     """
+    if roi is not None:
+        mask_roi = process_image_fast(image.crop(roi), max_size, model_type, backend=backend)
+        return paste_roi_mask(mask_roi, roi, image.size)
+
     w, h = image.size
 
     # 원본 화질 모드 (9999 이상이면 리사이즈 안함)
@@ -593,43 +1999,88 @@ def process_image_fast(image: Image.Image, max_size: int = 1440, model_type: str
         new_w = (new_w // 32) * 32
         new_h = (new_h // 32) * 32
 
-    # MPS는 고해상도 convolution 미지원 → 안전한 최대 해상도로 클램핑
-    # Portrait on CPU면 이 제한 적용 안 함
-    MPS_MAX_SIDE = 2560
-    model_on_mps = not (PORTRAIT_ON_CPU and model_type == "portrait") and device == "mps"
-    if model_on_mps and max(new_w, new_h) > MPS_MAX_SIDE:
-        scale_down = MPS_MAX_SIDE / max(new_w, new_h)
-        new_w = (int(new_w * scale_down) // 32) * 32
-        new_h = (int(new_h * scale_down) // 32) * 32
-        print(f"⚠️ MPS 한계 → 처리 해상도 축소: {new_w}x{new_h}")
-
-    # 리사이징
-    image_resized = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-    # 모델 가져오기 (Lazy Loading)
-    model = get_birefnet_model(model_type)
-
-    # 모델 디바이스 자동 감지 (portrait=CPU, 나머지=GPU)
-    model_device = next(model.parameters()).device
+    # 복제본 선택 (디바이스별 대기열 × 버킷별 지연 EMA 기준)
+    bucket = select_birefnet_bucket(new_w, new_h)
+    bucket_key = f"{bucket[0]}x{bucket[1]}" if bucket else f"{new_w}x{new_h}"
+    # ONNX 백엔드는 별도 복제본("onnx")으로 지연 통계 기록 → /health에서 torch와 A/B 비교
+    devices = ["onnx"] if backend == "onnx" else birefnet_devices(model_type)
+    target_device = replica_scheduler.acquire(model_type, devices, bucket_key)
+    if target_device == "onnx":
+        warm = model_type in onnx_models
+    else:
+        warm = birefnet_replica_key(model_type, target_device) in loaded_models
+    infer_start = time.time()
+    elapsed = None
+    try:
+        # MPS는 고해상도 convolution 미지원 → 안전한 최대 해상도로 클램핑 (CPU 복제본은 제한 없음)
+        MPS_MAX_SIDE = 2560
+        if target_device == "mps" and max(new_w, new_h) > MPS_MAX_SIDE:
+            scale_down = MPS_MAX_SIDE / max(new_w, new_h)
+            new_w = (int(new_w * scale_down) // 32) * 32
+            new_h = (int(new_h * scale_down) // 32) * 32
+            print(f"⚠️ MPS 한계 → 처리 해상도 축소: {new_w}x{new_h}")
+
+        # 리사이징
+        image_resized = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+        # 모델 가져오기 (Lazy Loading)
+        if target_device == "onnx":
+            model = get_onnx_model(model_type)
+            model_device = torch.device("cpu")
+        else:
+            model = get_birefnet_model(model_type, target_device)
+            # 모델 디바이스 자동 감지 (CPU 복제본=float32, GPU 복제본=float16)
+            model_device = next(model.parameters()).device
 
-    # 텐서 변환 — 모델 디바이스에 맞춤
-    input_tensor = transform_normalize(image_resized).unsqueeze(0).to(model_device)
+        # 텐서 변환 — 모델 디바이스에 맞춤
+        input_tensor = transform_normalize(image_resized).unsqueeze(0).to(model_device)
 
-    # GPU(float16) / CPU(float32) 자동 판별
-    if model_device.type != "cpu":
-        input_tensor = input_tensor.half()
+        # GPU(float16) / CPU(float32) 자동 판별
+        if model_device.type != "cpu":
+            input_tensor = input_tensor.half()
 
-    # 추론
-    with torch.no_grad():
-        preds = model(input_tensor)[-1].sigmoid().cpu()
+        # 추론 (shape 버킷 패딩/언패딩 포함)
+        preds = run_birefnet(model, input_tensor)
+        elapsed = time.time() - infer_start
+    finally:
+        # 첫 호출(모델 로드 포함)은 지연 통계에서 제외
+        replica_scheduler.release(model_type, target_device, bucket_key, elapsed if warm else None)
 
     # 마스크 복원
     pred = preds[0].squeeze().float() # 다시 float32로 변환 (이미지 저장용)
-    pred_pil = transforms.ToPILImage()(pred)
+    pred_pil = load_stack("torchvision").transforms.ToPILImage()(pred)
     mask = pred_pil.resize((w, h), Image.Resampling.LANCZOS)
 
     return mask
 
+def segment_mask(image: Image.Image, model: str, max_size: int = 1440, roi=None, backend: str = "torch") -> Image.Image:
+    """배경 제거 마스크 (BEN2 / BiRefNet) — 로컬 실행 및 추론 워커 공용, 원본 크기 L 마스크 반환"""
+    if model == "ben2":
+        ben2 = get_ben2_model()
+        with torch.no_grad():
+            result_rgba = ben2.inference(image.crop(roi) if roi else image)
+        # RGBA 결과에서 알파 채널을 마스크로 추출
+        mask = result_rgba.split()[-1]
+        return paste_roi_mask(mask, roi, image.size) if roi else mask
+    return process_image_fast(image, max_size, model, roi, backend)
+
+# 추론 워커 풀 (API 모드에서만 생성)
+inference_pool = None
+
+@app.on_event("startup")
+def start_inference_pool():
+    global inference_pool
+    if SERVER_ROLE != "api":
+        return
+    from inference_pool import InferencePool
+    inference_pool = InferencePool(INFERENCE_PROCS)
+    inference_pool.start()
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    if inference_pool is not None:
+        inference_pool.shutdown()
+
 # ========== 마스크 리파인 함수들 ==========
 def refine_guided_filter(image: Image.Image, mask: Image.Image, r: int = 8, eps: float = 1e-3) -> Image.Image:
     """Guided Filter: 원본 이미지 엣지를 참조하여 마스크 경계 정제"""
@@ -713,10 +2164,16 @@ async def remove_background(
     removebg_size: str = Query(default="preview", pattern="^(preview|full)$", description="remove.bg 크기: preview(저해상도) 또는 full(원본)"),
     case_type: str = Query(default="auto", description="피사체 유형: auto, KID_PERSON, ADULT_PERSON, TOY_OBJECT"),
     has_face: bool = Query(default=True, description="얼굴 감지 여부 (Face API 결과)"),
-    refine: str = Query(default="none", pattern="^(none|guided|pymatting|fg_estimate)$", description="마스크 리파인 방법")
+    refine: str = Query(default="none", pattern="^(none|guided|pymatting|fg_estimate)$", description="마스크 리파인 방법"),
+    crop_box: str = Query(default="", description="ROI 박스 JSON: [x1,y1,x2,y2] — 이 영역만 고해상도로 처리"),
+    roi_id: str = Query(default="", description="/smart-crop 또는 /detect-child 응답의 roi_id"),
+    roi_index: int = Query(default=-1, ge=-1, description="roi_id의 박스 인덱스 (-1=모든 박스의 합집합)"),
+    roi_padding: float = Query(default=0.1, ge=0.0, le=1.0, description="ROI 패딩 비율"),
+    backend: str = Query(default=None, pattern="^(torch|onnx)$", description="추론 백엔드 (기본: MODEL_BACKENDS 설정)"),
 ):
     print("-" * 40)
-    print(f"📸 요청: {file.filename} (품질: {max_size}px, 모델: {model}, 리파인: {refine})")
+    backend = resolve_backend(model, backend) if model in BIREFNET_MODELS else "torch"
+    print(f"📸 요청: {file.filename} (품질: {max_size}px, 모델: {model}, 리파인: {refine}, 백엔드: {backend})")
     start_time = time.time()
 
     # 1. 파일 타입 검증
@@ -743,12 +2200,50 @@ async def remove_background(
         return img.convert("RGB")
     try:
         image = await asyncio.to_thread(_load_image, image_data)
-    except Exception as e:
+    except Exception:
         raise HTTPException(
             status_code=400,
             detail="손상된 이미지 파일이거나 올바른 이미지 형식이 아닙니다."
         )
 
+    # remove.bg 외부 API는 전체 프레임만 처리 — ROI 요청을 조용히 무시하지 않고 거부
+    if model == "removebg" and (crop_box or roi_id):
+        raise HTTPException(status_code=400, detail="removebg 모델은 crop_box/roi_id를 지원하지 않습니다.")
+
+    # ROI 결정: crop_box 직접 지정 > roi_id 참조 (roi_id 실패 시 전체 프레임으로 fallback, 잘못된 crop_box는 400)
+    roi = None
+    roi_box = None
+    if crop_box:
+        try:
+            parsed_box = json.loads(crop_box)
+            if not (isinstance(parsed_box, list) and len(parsed_box) == 4):
+                raise ValueError("[x1,y1,x2,y2] 4개 값이 필요합니다")
+            roi_box = [float(v) for v in parsed_box]
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"crop_box 형식 오류: {e}")
+        x1, y1, x2, y2 = roi_box
+        if min(x2, image.width) <= max(x1, 0) or min(y2, image.height) <= max(y1, 0):
+            raise HTTPException(status_code=400, detail=f"crop_box가 이미지({image.width}x{image.height}) 안에 있지 않습니다.")
+    elif roi_id:
+        entry = roi_results.get(roi_id)
+        if entry is None:
+            print(f"   ⚠️ roi_id 만료/없음: {roi_id}, 전체 이미지 처리")
+        elif entry["image_size"] != image.size or entry["image_hash"] != image_hash(image_data):
+            print(f"   ⚠️ roi_id 이미지 불일치 ({entry['source']}), 전체 이미지 처리")
+        elif entry["boxes"]:
+            boxes_ref = entry["boxes"]
+            if 0 <= roi_index < len(boxes_ref):
+                roi_box = boxes_ref[roi_index]
+            else:
+                roi_box = [min(b[0] for b in boxes_ref), min(b[1] for b in boxes_ref),
+                           max(b[2] for b in boxes_ref), max(b[3] for b in boxes_ref)]
+    if roi_box is not None:
+        roi = pad_roi(roi_box, image.size, roi_padding)
+        if roi is None:
+            print("   ↳ ROI가 원본과 거의 같아 전체 처리")
+        else:
+            print(f"   🎯 ROI 처리: ({roi[0]},{roi[1]})→({roi[2]},{roi[3]}) [{(roi[2]-roi[0])*(roi[3]-roi[1]) / (image.width*image.height) * 100:.0f}%]")
+
     try:
         # 원본 크기 저장 (크롭 정보 헤더용)
         original_w, original_h = image.size
@@ -765,20 +2260,17 @@ async def remove_background(
             if result_rgba.size != (original_w, original_h):
                 result_rgba = result_rgba.resize((original_w, original_h), Image.Resampling.LANCZOS)
             mask = result_rgba.split()[-1]
-        elif model == "ben2":
-            # BEN2는 자체 inference API 사용 (GPU에서 실행)
-            # asyncio.to_thread로 이벤트 루프 블로킹 방지 → portrait(CPU)와 병렬 가능
-            ben2 = get_ben2_model()
-            def _run_ben2():
-                with torch.no_grad():
-                    return ben2.inference(image)
-            result_rgba = await asyncio.to_thread(_run_ben2)
-            # RGBA 결과에서 알파 채널을 마스크로 추출
-            mask = result_rgba.split()[-1]
+        elif inference_pool is not None:
+            # API 모드: 디코드된 픽셀을 공유 메모리로 추론 워커에 전달 (BEN2 / BiRefNet)
+            # 워커 사망/시간 초과만 503, 워커 내부 처리 예외(JobError)는 단일 프로세스와 같이 아래 500 처리
+            try:
+                mask = await asyncio.to_thread(inference_pool.segment, image, model, max_size, roi, backend)
+            except RuntimeError as e:
+                raise HTTPException(status_code=503, detail=f"추론 워커 오류: {e}")
         else:
-            # portrait 등 BiRefNet 모델 (CPU 또는 GPU)
-            # asyncio.to_thread로 이벤트 루프 블로킹 방지 → ben2(GPU)와 병렬 가능
-            mask = await asyncio.to_thread(process_image_fast, image, max_size, model)
+            # BEN2(자체 inference API) / portrait 등 BiRefNet 모델 (CPU 또는 GPU)
+            # asyncio.to_thread로 이벤트 루프 블로킹 방지 → portrait(CPU)와 ben2(GPU) 병렬 가능
+            mask = await asyncio.to_thread(segment_mask, image, model, max_size, roi, backend)
 
         # 마스크 리파인 적용
         if refine != "none":
@@ -853,9 +2345,15 @@ async def remove_background(
             "X-BGQA-Issues": ",".join(bgqa_issues) if bgqa_issues else "",
             "X-BGQA-CaseType": bgqa_case_type,
         }
+        if roi:
+            headers["X-ROI"] = ",".join(str(v) for v in roi)
+        if model in BIREFNET_MODELS:
+            headers["X-Backend"] = backend
 
         clear_gpu_memory()
         return Response(content=img_byte_arr.getvalue(), media_type="image/webp", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         clear_gpu_memory()
         print(f"❌ 처리 오류: {str(e)}")
@@ -873,25 +2371,38 @@ VITPOSE_MODELS = {
     "vitpose-huge": "usyd-community/vitpose-plus-huge",   # 657M, 81.1 AP
 }
 
-def load_vitpose_model(model_type="vitpose"):
-    """ViTPose 모델 로드 (처음 요청 시에만)"""
+def load_vitpose_model(model_type="vitpose", backend: str = None):
+    """ViTPose 모델 로드 (처음 요청 시에만) — backend 미지정 시 MODEL_BACKENDS 설정, onnx면 ONNX Runtime 세션"""
     global _vitpose_cache
 
-    if model_type in _vitpose_cache:
-        return _vitpose_cache[model_type]
+    backend = resolve_backend(model_type, backend)
+    cache_key = f"{model_type}@onnx" if backend == "onnx" else model_type
+    if cache_key in _vitpose_cache:
+        return _vitpose_cache[cache_key]
 
     try:
-        from transformers import AutoProcessor, VitPoseForPoseEstimation
+        vp = load_stack("vitpose")
 
         model_name = VITPOSE_MODELS.get(model_type)
         if not model_name:
             raise ValueError(f"알 수 없는 ViTPose 모델: {model_type}")
 
-        print(f"📂 ViTPose 모델 로딩 중... ({model_name})")
-        processor = AutoProcessor.from_pretrained(model_name)
-        model = VitPoseForPoseEstimation.from_pretrained(model_name)
+        print(f"📂 ViTPose 모델 로딩 중... ({model_name}, {backend})")
+        processor = vp.AutoProcessor.from_pretrained(model_name)
+        if backend == "onnx":
+            _vitpose_cache[cache_key] = (get_onnx_model(model_type), processor)
+            return _vitpose_cache[cache_key]
+
+        def _empty_vitpose():
+            return vp.VitPoseForPoseEstimation(vp.AutoConfig.from_pretrained(model_name))
+
+        model = load_prepared_model(f"vitpose:{model_type}", _empty_vitpose, device, precision_load_dtype(model_type))
+        if model is None:
+            model = vp.VitPoseForPoseEstimation.from_pretrained(model_name)
         model.to(device)
         model.eval()
+        if apply_model_precision(model, model_type) == "fp32":
+            cpu_profile_vitpose(model)
         print(f"✅ ViTPose 모델 로드 완료 ({model_type})")
 
         _vitpose_cache[model_type] = (model, processor)
@@ -911,6 +2422,242 @@ def load_vitpose_model(model_type="vitpose"):
             detail=f"ViTPose 모델 로드 실패: {str(e)}"
         )
 
+# ========== 배치 포즈 파이프라인 ==========
+# processor의 person별 CPU affine warp(scipy) 대신 모델 디바이스에서 affine_grid + grid_sample로 전체 박스를 한 번에 크롭,
+# 동시 요청의 크롭을 micro-batch로 모아 한 번의 forward, heatmap 디코딩도 텐서 연산 (키포인트 루프 없음)
+# VITPOSE_PIPELINE=processor 이면 기존 transformers processor 경로
+VITPOSE_PIPELINE = os.environ.get("VITPOSE_PIPELINE", "batched")
+VITPOSE_BOX_PADDING = 1.25  # processor와 동일 (box_to_center_and_scale padding_factor)
+VITPOSE_BATCH_WINDOW = float(os.environ.get("VITPOSE_BATCH_WINDOW_MS", 5)) / 1000  # 다른 요청 합류 대기
+VITPOSE_MAX_BATCH = int(os.environ.get("VITPOSE_MAX_BATCH", 32))  # forward 1회 최대 크롭 수
+# 크롭 전 평균 풀링 축소 — processor(원본 해상도에서 바로 warp)에는 없는 단계라 parity 비교 시 0으로 끔
+VITPOSE_PRESHRINK = os.environ.get("VITPOSE_PRESHRINK", "1") == "1"
+# DARK-UDP 보정: processor(post_dark_unbiased_data_processing)와 동일한 가우시안 (sigma 0.8, 11×11)
+VITPOSE_DARK_SIGMA = 0.8
+VITPOSE_DARK_KERNEL = 11
+
+def person_box_geometry(boxes: torch.Tensor, aspect: float):
+    """xyxy 박스 [N,4] → 중심 [N,2], 크롭 영역 크기 [N,2] (모델 입력 비율로 확장 + 패딩)"""
+    x1, y1, x2, y2 = boxes.unbind(-1)
+    w = (x2 - x1).clamp(min=1)
+    h = (y2 - y1).clamp(min=1)
+    crop_w = torch.maximum(w, h * aspect) * VITPOSE_BOX_PADDING
+    centers = torch.stack([(x1 + x2) / 2, (y1 + y2) / 2], dim=-1)
+    return centers, torch.stack([crop_w, crop_w / aspect], dim=-1)
+
+def crop_person_batch(image: Image.Image, boxes, processor, target_device, target_dtype):
+    """
+    이미지 1장의 person 박스 전체를 모델 디바이스에서 한 번에 affine 크롭 + 정규화
+    → (pixel_values [N,3,H,W], 중심 [N,2], 크기 [N,2]). 좌표 규약은 UDP (모서리 픽셀 중심 정렬)
+    """
+    F = torch.nn.functional
+    out_h, out_w = processor.size["height"], processor.size["width"]
+    boxes_t = torch.as_tensor(boxes, dtype=torch.float32, device=target_device).reshape(-1, 4)
+    centers, sizes = person_box_geometry(boxes_t, out_w / out_h)
+
+    # uint8로 업로드 후 디바이스에서 변환 (전송량 1/4)
+    img = torch.from_numpy(np.asarray(image.convert("RGB"))).to(target_device).permute(2, 0, 1)[None].float().div_(255)
+    # 크롭이 입력보다 2배 이상 크면 먼저 평균 풀링으로 축소 (bilinear 샘플링 aliasing 방지)
+    # processor 경로에는 없는 단계 → 키포인트가 processor와 약간 달라질 수 있음 (VITPOSE_PRESHRINK=0으로 끔)
+    k = int((sizes / torch.tensor([out_w, out_h], device=target_device)).min().item()) if VITPOSE_PRESHRINK else 1
+    c, sz = centers, sizes
+    if k >= 2:
+        img = F.avg_pool2d(img, k, ceil_mode=True)
+        c, sz = (centers + 0.5) / k - 0.5, sizes / k
+    H, W = img.shape[-2:]
+
+    n = boxes_t.shape[0]
+    theta = torch.zeros(n, 2, 3, device=target_device)
+    theta[:, 0, 0] = sz[:, 0] / max(W - 1, 1)
+    theta[:, 0, 2] = 2 * c[:, 0] / max(W - 1, 1) - 1
+    theta[:, 1, 1] = sz[:, 1] / max(H - 1, 1)
+    theta[:, 1, 2] = 2 * c[:, 1] / max(H - 1, 1) - 1
+    grid = F.affine_grid(theta, (n, 3, out_h, out_w), align_corners=True)
+    crops = F.grid_sample(img.expand(n, -1, -1, -1), grid, mode="bilinear", padding_mode="zeros", align_corners=True)
+
+    mean = torch.tensor(processor.image_mean, device=target_device).view(1, 3, 1, 1)
+    std = torch.tensor(processor.image_std, device=target_device).view(1, 3, 1, 1)
+    return ((crops - mean) / std).to(target_dtype), centers, sizes
+
+def _blur_heatmaps(heatmaps: torch.Tensor) -> torch.Tensor:
+    """[N,K,h,w] 분리형 가우시안 블러 — scipy gaussian_filter(mode="reflect", 가장자리 포함 대칭 패딩)와 동일"""
+    F = torch.nn.functional
+    n, k, h, w = heatmaps.shape
+    r = VITPOSE_DARK_KERNEL // 2
+    x = torch.arange(-r, r + 1, dtype=heatmaps.dtype, device=heatmaps.device)
+    g = torch.exp(-0.5 * (x / VITPOSE_DARK_SIGMA) ** 2)
+    g = g / g.sum()
+    t = heatmaps.reshape(n * k, 1, h, w)
+    t = torch.cat([t[..., :r].flip(-1), t, t[..., -r:].flip(-1)], dim=-1)
+    t = F.conv2d(t, g.view(1, 1, 1, -1))
+    t = torch.cat([t[..., :r, :].flip(-2), t, t[..., -r:, :].flip(-2)], dim=-2)
+    t = F.conv2d(t, g.view(1, 1, -1, 1))
+    return t.reshape(n, k, h, w)
+
+def decode_heatmaps(heatmaps: torch.Tensor, centers: torch.Tensor, sizes: torch.Tensor):
+    """
+    heatmaps [N,K,h,w] → 이미지 좌표 keypoints [N,K,2], scores [N,K] (numpy).
+    argmax + DARK-UDP 보정 (블러 → log → argmax 위치 2차 테일러 전개: x -= H⁻¹·∇) — processor와 같은 계산을 텐서로
+    """
+    n, k, h, w = heatmaps.shape
+    hm = heatmaps.float()
+    scores, idx = hm.reshape(n, k, h * w).max(dim=-1)
+    xi, yi = idx % w, idx // w
+
+    logm = _blur_heatmaps(hm).clamp_(0.001, 50).log_().reshape(n, k, h * w)
+
+    def _at(dy, dx):
+        # 범위 밖 이웃은 가장자리 값 (processor의 edge 패딩과 동일)
+        yy, xx = (yi + dy).clamp(0, h - 1), (xi + dx).clamp(0, w - 1)
+        return logm.gather(-1, (yy * w + xx).unsqueeze(-1)).squeeze(-1)
+
+    i0 = _at(0, 0)
+    ix1, ix1_, iy1, iy1_ = _at(0, 1), _at(0, -1), _at(1, 0), _at(-1, 0)
+    dx = 0.5 * (ix1 - ix1_)
+    dy = 0.5 * (iy1 - iy1_)
+    eps = torch.finfo(torch.float32).eps
+    dxx = ix1 - 2 * i0 + ix1_ + eps
+    dyy = iy1 - 2 * i0 + iy1_ + eps
+    dxy = 0.5 * (_at(1, 1) - ix1 - iy1 + 2 * i0 - ix1_ - iy1_ + _at(-1, -1))
+    # 2×2 Hessian 역행렬 닫힌 형태 (특이 행렬이면 보정 없음)
+    det = dxx * dyy - dxy * dxy
+    ok = det.abs() > 0
+    det = torch.where(ok, det, torch.ones_like(det))
+    off_x = torch.where(ok, (dyy * dx - dxy * dy) / det, torch.zeros_like(det))
+    off_y = torch.where(ok, (dxx * dy - dxy * dx) / det, torch.zeros_like(det))
+    x = xi.float() - off_x
+    y = yi.float() - off_y
+    rel = torch.stack([x / max(w - 1, 1), y / max(h - 1, 1)], dim=-1) - 0.5
+    coords = rel * sizes.to(rel.device)[:, None, :] + centers.to(rel.device)[:, None, :]
+    return coords.cpu().numpy(), scores.cpu().numpy()
+
+class PoseBatcher:
+    """
+    동시 요청의 person 크롭을 모아 한 번의 forward로 처리 (스레드에서 호출).
+    첫 요청(리더)이 VITPOSE_BATCH_WINDOW 동안 합류를 기다린 뒤 실행 락을 잡고 대기열 전체를 실행,
+    실행 중 도착한 요청은 다음 리더가 묶음. 진행 중인 다른 요청이 없으면 (단독 요청) 대기 없이 바로 실행
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._pending = []
+        self._leader = False
+        self._inflight = 0  # 대기 + 실행 중인 submit 수
+        self.batches = 0
+        self.crops = 0
+
+    def submit(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        item = SimpleNamespace(x=pixel_values, done=threading.Event(), out=None, err=None)
+        with self._lock:
+            self._pending.append(item)
+            self._inflight += 1
+            leader = not self._leader
+            self._leader = True
+            wait = self._inflight > 1
+        try:
+            if leader:
+                if wait:
+                    time.sleep(VITPOSE_BATCH_WINDOW)
+                with self._run_lock:
+                    with self._lock:
+                        batch, self._pending = self._pending, []
+                        self._leader = False
+                    self._run(batch)
+            item.done.wait()
+        finally:
+            with self._lock:
+                self._inflight -= 1
+        if item.err is not None:
+            raise item.err
+        return item.out
+
+    def _run(self, batch):
+        try:
+            x = torch.cat([b.x for b in batch]) if len(batch) > 1 else batch[0].x
+            outs = []
+            with torch.no_grad():
+                for chunk in torch.split(x, VITPOSE_MAX_BATCH):
+                    dataset_index = torch.zeros(chunk.shape[0], dtype=torch.long, device=chunk.device)
+                    outs.append(self.model(pixel_values=chunk, dataset_index=dataset_index).heatmaps)
+            heatmaps = torch.cat(outs) if len(outs) > 1 else outs[0]
+            self.batches += 1
+            self.crops += x.shape[0]
+            offset = 0
+            for b in batch:
+                b.out = heatmaps[offset:offset + b.x.shape[0]]
+                offset += b.x.shape[0]
+        except Exception as e:
+            for b in batch:
+                b.err = e
+        finally:
+            for b in batch:
+                b.done.set()
+
+_pose_batchers = {}
+_pose_batchers_lock = threading.Lock()
+
+def get_pose_batcher(model) -> PoseBatcher:
+    with _pose_batchers_lock:
+        batcher = _pose_batchers.get(id(model))
+        if batcher is None:
+            batcher = _pose_batchers[id(model)] = PoseBatcher(model)
+        return batcher
+
+def estimate_poses(model, processor, image: Image.Image, boxes):
+    """
+    person 박스별 COCO 17 키포인트 → (keypoints [N,17,2], scores [N,17]) numpy. 블로킹 — 스레드에서 호출
+    boxes: xyxy 목록 (전체 프레임 단일 인물이면 [[0, 0, W, H]])
+    """
+    return estimate_poses_many(model, processor, [(image, boxes)])[0]
+
+def estimate_poses_many(model, processor, items):
+    """
+    여러 이미지의 (image, boxes) → 이미지별 (keypoints, scores) 목록.
+    batched 파이프라인은 모든 이미지의 크롭을 이어 붙여 한 번에 submit (forward 1회)
+    """
+    if VITPOSE_PIPELINE == "processor":
+        return [_estimate_poses_processor(model, processor, image, boxes) for image, boxes in items]
+
+    if isinstance(model, OnnxModel):
+        target_device, target_dtype = torch.device("cpu"), torch.float32
+    else:
+        param = next(model.parameters())
+        target_device, target_dtype = param.device, param.dtype
+    crops = [crop_person_batch(image, boxes, processor, target_device, target_dtype) for image, boxes in items]
+    heatmaps = get_pose_batcher(model).submit(torch.cat([c[0] for c in crops]))
+    results, offset = [], 0
+    for pixel_values, centers, sizes in crops:
+        n = pixel_values.shape[0]
+        results.append(decode_heatmaps(heatmaps[offset:offset + n], centers, sizes))
+        offset += n
+    return results
+
+def _estimate_poses_processor(model, processor, image: Image.Image, boxes):
+    """기존 transformers processor 경로 (VITPOSE_PIPELINE=processor)"""
+    batch_boxes = [[list(map(float, b)) for b in boxes]]
+    inputs = processor(images=image, boxes=batch_boxes, return_tensors="pt")
+    target_device = "cpu" if isinstance(model, OnnxModel) else device
+    inputs = {k: v.to(target_device) for k, v in inputs.items()}
+    if 'dataset_index' not in inputs:
+        inputs['dataset_index'] = torch.zeros(inputs['pixel_values'].shape[0], dtype=torch.long, device=target_device)
+    with torch.no_grad():
+        outputs = model(**inputs)
+    results = processor.post_process_pose_estimation(outputs, boxes=batch_boxes)[0]
+    return (np.stack([r['keypoints'].cpu().numpy() for r in results]),
+            np.stack([r['scores'].cpu().numpy() for r in results]))
+
+def pose_batch_report() -> dict:
+    """micro-batch 통계 (/health): 평균 배치 크기 = crops / batches"""
+    return {
+        "pipeline": VITPOSE_PIPELINE,
+        "window_ms": VITPOSE_BATCH_WINDOW * 1000,
+        "preshrink": VITPOSE_PRESHRINK,
+        "batches": sum(b.batches for b in _pose_batchers.values()),
+        "crops": sum(b.crops for b in _pose_batchers.values()),
+    }
+
 # COCO 17개 키포인트를 BlazePose 33개에 매핑 (호환성)
 COCO_TO_BLAZEPOSE = {
     0: 0,    # nose
@@ -932,6 +2679,24 @@ COCO_TO_BLAZEPOSE = {
     16: 28,  # right_ankle
 }
 
+# BlazePose 인덱스별 COCO 인덱스 (-1 = 대응 없음 → 0 행) — 모듈 로드 시 1회 계산
+BLAZEPOSE_FROM_COCO = np.full(33, -1, dtype=np.int64)
+for _coco_i, _blaze_i in COCO_TO_BLAZEPOSE.items():
+    BLAZEPOSE_FROM_COCO[_blaze_i] = _coco_i
+BLAZEPOSE_NAMES = [f"keypoint_{i}" for i in range(33)]
+
+def coco_to_blazepose(keypoints_xy: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """COCO 17 (keypoints [K,2], scores [K]) → BlazePose 33 [33,3] (x, y, score) — numpy gather 1회, 없는 점은 0"""
+    kps = np.concatenate([np.asarray(keypoints_xy, dtype=np.float32).reshape(-1, 2),
+                          np.asarray(scores, dtype=np.float32).reshape(-1, 1)], axis=1)
+    kps = np.vstack([kps, np.zeros((1, 3), dtype=np.float32)])  # 마지막 행 = 대응 없음
+    idx = np.where(BLAZEPOSE_FROM_COCO < len(kps) - 1, BLAZEPOSE_FROM_COCO, -1)
+    return kps[idx]
+
+def blazepose_objects(blaze: np.ndarray) -> list:
+    """[33,3] → 기존 JSON 형식 [{"x", "y", "score", "name"}, ...]"""
+    return [{"x": x, "y": y, "score": score, "name": name} for (x, y, score), name in zip(blaze.tolist(), BLAZEPOSE_NAMES)]
+
 # COCO 손목 키포인트 인덱스
 COCO_LEFT_WRIST = 9
 COCO_RIGHT_WRIST = 10
@@ -956,20 +2721,8 @@ def extract_wrist_keypoints(image: Image.Image, min_score: float = 0.3) -> list:
         pose_model, processor = load_vitpose_model("vitpose")
 
         # 전체 이미지를 하나의 person bbox로 처리
-        boxes = [[[0, 0, image.width, image.height]]]
-        inputs = processor(images=image, boxes=boxes, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        if 'dataset_index' not in inputs:
-            inputs['dataset_index'] = torch.zeros(inputs['pixel_values'].shape[0], dtype=torch.long, device=device)
-
-        # 추론
-        with torch.no_grad():
-            outputs = pose_model(**inputs)
-
-        # 결과 처리
-        results = processor.post_process_pose_estimation(outputs, boxes=boxes)[0][0]
-        keypoints_xy = results['keypoints'].cpu().numpy()
-        scores = results['scores'].cpu().numpy()
+        keypoints_all, scores_all = estimate_poses(pose_model, processor, image, [[0, 0, image.width, image.height]])
+        keypoints_xy, scores = keypoints_all[0], scores_all[0]
 
         # 손목 키포인트 추출
         wrist_keypoints = []
@@ -992,14 +2745,18 @@ def extract_wrist_keypoints(image: Image.Image, min_score: float = 0.3) -> list:
 
 @app.post("/detect-pose")
 async def detect_pose(
+    request: Request,
     file: UploadFile = File(...),
     model: str = Query(default="vitpose", pattern="^(vitpose|vitpose-huge)$", description="모델 선택"),
-    boxes: str = Query(default="", description="DINO bboxes JSON: [[x1,y1,x2,y2], ...] (xyxy format)")
+    boxes: str = Query(default="", description="DINO bboxes JSON: [[x1,y1,x2,y2], ...] (xyxy format)"),
+    backend: str = Query(default=None, pattern="^(torch|onnx)$", description="추론 백엔드 (기본: MODEL_BACKENDS 설정, vitpose만 onnx 지원)"),
+    format: str = Query(default="objects", pattern="^(objects|array)$", description="단일 person 응답: objects(점별 dict) / array(33×3 [x, y, score])"),
 ):
-    """ViTPose를 사용한 포즈 감지 (멀티 person 지원)"""
+    """ViTPose를 사용한 포즈 감지 (멀티 person 지원). Accept 헤더로 바이너리 응답 선택 가능 (negotiated_response)"""
     print("-" * 40)
     print(f"🦴 포즈 감지 요청: {file.filename} (모델: {model})")
     start_time = time.time()
+    fmt = response_format(request)
 
     # 파일 검증
     if not is_allowed_image(file):
@@ -1034,102 +2791,74 @@ async def detect_pose(
 
     try:
         # 모델 로드 (Lazy)
-        pose_model, processor = load_vitpose_model(model)
+        pose_model, processor = load_vitpose_model(model, backend)
 
         if use_multi_person:
             # ===== 멀티 person 모드 (DINO boxes → per-person keypoints) =====
-            # boxes: [batch, num_persons, 4] format for processor
-            boxes_for_processor = [person_boxes]  # batch of 1
-            inputs = processor(images=image, boxes=boxes_for_processor, return_tensors="pt")
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            # vitpose-plus 모델은 dataset_index 필요 (COCO = 0)
-            if 'dataset_index' not in inputs:
-                inputs['dataset_index'] = torch.zeros(inputs['pixel_values'].shape[0], dtype=torch.long, device=device)
+            # 전체 박스를 한 번의 배치 크롭 + forward (동시 요청과 micro-batch)
+            kps_all, scs_all = await asyncio.to_thread(estimate_poses, pose_model, processor, image, person_boxes)
 
-            with torch.no_grad():
-                outputs = pose_model(**inputs)
-
-            # post_process returns list[list[dict]] — [batch][person]
-            all_results = processor.post_process_pose_estimation(outputs, boxes=boxes_for_processor)[0]
-
-            persons = []
-            for idx, res in enumerate(all_results):
-                kps = res['keypoints'].cpu().numpy()
-                scs = res['scores'].cpu().numpy()
-                persons.append({
-                    "keypoints": [[float(kps[i][0]), float(kps[i][1])] for i in range(len(kps))],
-                    "scores": [float(scs[i]) for i in range(len(scs))],
-                    "bbox": person_boxes[idx],
-                })
-                valid_count = int((scs > 0.3).sum())
-                print(f"   Person {idx}: {valid_count}/17 valid keypoints (bbox: [{person_boxes[idx][0]:.0f},{person_boxes[idx][1]:.0f},{person_boxes[idx][2]:.0f},{person_boxes[idx][3]:.0f}])")
+            persons = [
+                {"keypoints": kps.tolist(), "scores": scs.tolist(), "bbox": box}
+                for kps, scs, box in zip(kps_all, scs_all, person_boxes)
+            ]
+            for idx, (scs, box) in enumerate(zip(scs_all, person_boxes)):
+                print(f"   Person {idx}: {int((scs > 0.3).sum())}/17 valid keypoints (bbox: [{box[0]:.0f},{box[1]:.0f},{box[2]:.0f},{box[3]:.0f}])")
 
             print(f"⚡ 완료! {len(persons)}명 포즈 감지, 소요시간: {time.time() - start_time:.2f}초")
             print("-" * 40)
 
             clear_gpu_memory()
-            return JSONResponse(content={
+            content = {
                 "success": True,
                 "model": model,
                 "persons": persons,
                 "image_width": image.width,
                 "image_height": image.height,
+            }
+            if fmt == "json":
+                return negotiated_response(fmt, content)
+            # 바이너리: keypoints [P,17,2], scores [P,17], boxes [P,4]
+            return negotiated_response(fmt, content, meta={
+                "success": True, "model": model, "persons": len(persons), "keypoint_layout": "coco17",
+                "image_width": image.width, "image_height": image.height,
+            }, arrays={
+                "keypoints": np.array([p["keypoints"] for p in persons], dtype=np.float32).reshape(-1, 17, 2),
+                "scores": np.array([p["scores"] for p in persons], dtype=np.float32).reshape(-1, 17),
+                "boxes": np.array(person_boxes, dtype=np.float32).reshape(-1, 4),
             })
 
         else:
             # ===== 단일 person 모드 (기존 호환) =====
-            boxes_single = [[[0, 0, image.width, image.height]]]
-            inputs = processor(images=image, boxes=boxes_single, return_tensors="pt")
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            if 'dataset_index' not in inputs:
-                inputs['dataset_index'] = torch.zeros(inputs['pixel_values'].shape[0], dtype=torch.long, device=device)
-
-            with torch.no_grad():
-                outputs = pose_model(**inputs)
-
-            results = processor.post_process_pose_estimation(outputs, boxes=boxes_single)[0][0]
-            keypoints_xy = results['keypoints'].cpu().numpy()
-            scores = results['scores'].cpu().numpy()
+            kps_all, scs_all = await asyncio.to_thread(
+                estimate_poses, pose_model, processor, image, [[0, 0, image.width, image.height]])
+            keypoints_xy, scores = kps_all[0], scs_all[0]
 
             print(f"🦴 감지된 키포인트: {len(keypoints_xy)}개")
 
             # BlazePose 형식으로 변환 (33개 키포인트, 없는 건 0으로)
-            blazepose_keypoints = []
-            for i in range(33):
-                coco_idx = None
-                for coco_i, blaze_i in COCO_TO_BLAZEPOSE.items():
-                    if blaze_i == i:
-                        coco_idx = coco_i
-                        break
-
-                if coco_idx is not None and coco_idx < len(keypoints_xy):
-                    kp = keypoints_xy[coco_idx]
-                    score = float(scores[coco_idx])
-                    blazepose_keypoints.append({
-                        "x": float(kp[0]),
-                        "y": float(kp[1]),
-                        "score": score,
-                        "name": f"keypoint_{i}"
-                    })
-                else:
-                    blazepose_keypoints.append({
-                        "x": 0, "y": 0, "score": 0, "name": f"keypoint_{i}"
-                    })
-
-            ankle_left = blazepose_keypoints[27]
-            ankle_right = blazepose_keypoints[28]
-            print(f"🦶 발목 키포인트 - 왼쪽(27): score={ankle_left['score']:.3f}, 오른쪽(28): score={ankle_right['score']:.3f}")
+            blaze = coco_to_blazepose(keypoints_xy, scores)
+            print(f"🦶 발목 키포인트 - 왼쪽(27): score={blaze[27, 2]:.3f}, 오른쪽(28): score={blaze[28, 2]:.3f}")
             print(f"⚡ 완료! 소요시간: {time.time() - start_time:.2f}초")
             print("-" * 40)
 
             clear_gpu_memory()
-            return JSONResponse(content={
+            if fmt != "json":
+                # 바이너리: keypoints [33,3] (x, y, score) — 이름은 인덱스 순서 고정이라 생략
+                return negotiated_response(fmt, None, arrays={"keypoints": blaze}, meta={
+                    "success": True, "model": model, "keypoint_layout": "blazepose33",
+                    "image_width": image.width, "image_height": image.height,
+                })
+            content = {
                 "success": True,
                 "model": model,
-                "keypoints": blazepose_keypoints,
+                "keypoints": blaze.tolist() if format == "array" else blazepose_objects(blaze),
                 "image_width": image.width,
                 "image_height": image.height
-            })
+            }
+            if format == "array":
+                content["format"] = format  # 기본(objects) 응답은 기존과 동일한 필드 유지
+            return negotiated_response(fmt, content)
 
     except HTTPException:
         raise
@@ -1142,6 +2871,93 @@ async def detect_pose(
             detail=f"포즈 감지 중 오류가 발생했습니다: {str(e)}"
         )
 
+POSE_BATCH_MAX_FILES = 16
+
+@app.post("/detect-pose-batch")
+async def detect_pose_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    model: str = Query(default="vitpose", pattern="^(vitpose|vitpose-huge)$", description="모델 선택"),
+    backend: str = Query(default=None, pattern="^(torch|onnx)$", description="추론 백엔드 (기본: MODEL_BACKENDS 설정)"),
+    format: str = Query(default="array", pattern="^(objects|array)$", description="objects(점별 dict) / array(33×3 [x, y, score])"),
+):
+    """
+    여러 이미지(가족 구성원 사진 등)의 단일 person 포즈를 한 번에 감지 — 전체 크롭을 forward 1회로 처리.
+    결과는 업로드 순서, 디코딩 실패 이미지는 항목별 error.
+    """
+    print("-" * 40)
+    print(f"🦴 배치 포즈 감지 요청: {len(files)}장 (모델: {model}, format: {format})")
+    start_time = time.time()
+    fmt = response_format(request)
+
+    if len(files) > POSE_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"한 번에 최대 {POSE_BATCH_MAX_FILES}장까지 처리할 수 있습니다.")
+
+    def _decode(data: bytes) -> Image.Image:
+        return ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+
+    results = []
+    images = []
+    for f in files:
+        entry = {"filename": f.filename}
+        results.append(entry)
+        if not is_allowed_image(f):
+            entry["error"] = "지원하지 않는 파일 형식입니다."
+            continue
+        data = await f.read()
+        if len(data) > MAX_FILE_SIZE:
+            entry["error"] = "파일이 너무 큽니다."
+            continue
+        try:
+            image = await asyncio.to_thread(_decode, data)
+        except Exception:
+            entry["error"] = "올바른 이미지 형식이 아닙니다."
+            continue
+        entry["image_width"], entry["image_height"] = image.size
+        images.append((entry, image))
+
+    try:
+        blaze_all = []
+        if images:
+            pose_model, processor = load_vitpose_model(model, backend)
+            poses = await asyncio.to_thread(
+                estimate_poses_many, pose_model, processor,
+                [(image, [[0, 0, image.width, image.height]]) for _, image in images])
+            for (entry, _), (kps, scs) in zip(images, poses):
+                blaze = coco_to_blazepose(kps[0], scs[0])
+                blaze_all.append(blaze)
+                entry["keypoints"] = blaze.tolist() if format == "array" else blazepose_objects(blaze)
+
+        print(f"⚡ 완료! {len(images)}/{len(files)}장 포즈 감지, 소요시간: {time.time() - start_time:.2f}초")
+        print("-" * 40)
+        clear_gpu_memory()
+
+        content = {"success": True, "model": model, "results": results}
+        if format == "array":
+            content["format"] = format
+        if fmt == "json":
+            return negotiated_response(fmt, content)
+        # 바이너리: keypoints [M,33,3] (성공한 이미지 순서), 항목별 메타데이터의 index로 대응
+        meta_results = []
+        ok = 0
+        for entry in results:
+            item = {k: v for k, v in entry.items() if k != "keypoints"}
+            if "keypoints" in entry:
+                item["index"] = ok
+                ok += 1
+            meta_results.append(item)
+        return negotiated_response(fmt, None, meta={
+            "success": True, "model": model, "keypoint_layout": "blazepose33", "results": meta_results,
+        }, arrays={"keypoints": np.array(blaze_all, dtype=np.float32).reshape(-1, 33, 3)})
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        clear_gpu_memory()
+        print(f"❌ 배치 포즈 감지 오류: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"배치 포즈 감지 중 오류가 발생했습니다: {str(e)}")
+
 # ========== HEIC 변환 API ==========
 
 @app.post("/convert-heic")
@@ -1169,6 +2985,7 @@ async def convert_heic(file: UploadFile = File(...)):
 
 @app.post("/smart-crop")
 async def smart_crop(
+    request: Request,
     file: UploadFile = File(...),
     padding_ratio: float = Query(default=0.25, ge=0.0, le=1.0, description="크롭 패딩 비율"),
     min_score: float = Query(default=0.3, ge=0.0, le=1.0, description="키포인트 최소 신뢰도"),
@@ -1180,6 +2997,7 @@ async def smart_crop(
     mode_label = "인물" if crop_mode == "person" else "물건"
     print(f"✂️ 스마트 크롭 요청: {file.filename} (모드: {mode_label}, seg_size: {seg_size})")
     start_time = time.time()
+    fmt = response_format(request)
 
     # 파일 검증
     if not is_allowed_image(file):
@@ -1197,6 +3015,7 @@ async def smart_crop(
         image = image.convert("RGB")
     except Exception:
         raise HTTPException(status_code=400, detail="올바른 이미지 형식이 아닙니다.")
+    image_key = image_hash(image_data)
 
     # === 물건 모드: 마스크만으로 크롭 ===
     if crop_mode == "object":
@@ -1213,8 +3032,7 @@ async def smart_crop(
             if seg_dev.type != "cpu":
                 seg_tensor = seg_tensor.half()
 
-            with torch.no_grad():
-                seg_pred = seg_model(seg_tensor)[-1].sigmoid().cpu()
+            seg_pred = run_birefnet(seg_model, seg_tensor)
 
             seg_mask = seg_pred[0].squeeze().float().numpy()
             mask_binary = seg_mask > 0.5
@@ -1224,7 +3042,7 @@ async def smart_crop(
             if not rows.any() or not cols.any():
                 print(f"⚠️ 마스크에서 대상 미감지")
                 clear_gpu_memory()
-                return JSONResponse(content={"cropped": False, "reason": "대상 미감지"})
+                return negotiated_response(fmt, {"cropped": False, "reason": "대상 미감지"})
 
             r_min, r_max = np.where(rows)[0][[0, -1]]
             c_min, c_max = np.where(cols)[0][[0, -1]]
@@ -1266,13 +3084,14 @@ async def smart_crop(
             print("-" * 40)
 
             clear_gpu_memory()
-            return JSONResponse(content={
+            return negotiated_response(fmt, {
                 "cropped": is_cropped,
                 "reason": None if is_cropped else "크롭 불필요 (90% 이상)",
                 "crop": {"x": crop_x, "y": crop_y, "width": crop_w, "height": crop_h},
                 "image_width": image.width,
                 "image_height": image.height,
                 "mask_bbox": mask_bbox,
+                "roi_id": register_roi(image_key, image.size, [[crop_x, crop_y, crop_x2, crop_y2]], "smart-crop"),
             })
         except Exception as e:
             clear_gpu_memory()
@@ -1284,18 +3103,9 @@ async def smart_crop(
         # ViTPose 모델 로드 및 추론 (인물 모드)
         pose_model, processor = load_vitpose_model("vitpose")
 
-        boxes = [[[0, 0, image.width, image.height]]]
-        inputs = processor(images=image, boxes=boxes, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        if 'dataset_index' not in inputs:
-            inputs['dataset_index'] = torch.zeros(inputs['pixel_values'].shape[0], dtype=torch.long, device=device)
-
-        with torch.no_grad():
-            outputs = pose_model(**inputs)
-
-        results = processor.post_process_pose_estimation(outputs, boxes=boxes)[0][0]
-        keypoints_xy = results['keypoints'].cpu().numpy()
-        scores = results['scores'].cpu().numpy()
+        kps_all, scs_all = await asyncio.to_thread(
+            estimate_poses, pose_model, processor, image, [[0, 0, image.width, image.height]])
+        keypoints_xy, scores = kps_all[0], scs_all[0]
 
         # score > min_score인 키포인트만 사용
         valid_mask = scores > min_score
@@ -1304,7 +3114,7 @@ async def smart_crop(
         if valid_count < 3:
             print(f"⚠️ 유효 키포인트 부족: {valid_count}개 (최소 3개 필요)")
             clear_gpu_memory()
-            return JSONResponse(content={"cropped": False, "reason": "유효 키포인트 부족"})
+            return negotiated_response(fmt, {"cropped": False, "reason": "유효 키포인트 부족"})
 
         valid_kps = keypoints_xy[valid_mask]
 
@@ -1430,8 +3240,7 @@ async def smart_crop(
             if seg_dev.type != "cpu":
                 seg_tensor = seg_tensor.half()
 
-            with torch.no_grad():
-                seg_pred = seg_model(seg_tensor)[-1].sigmoid().cpu()
+            seg_pred = run_birefnet(seg_model, seg_tensor)
 
             seg_mask = seg_pred[0].squeeze().float().numpy()
             # 임계값 0.5로 이진화
@@ -1517,10 +3326,14 @@ async def smart_crop(
                 "valid_keypoints": valid_count,
                 "keypoints": keypoints_list,
                 "kp_bbox": kp_bbox,
+                "roi_id": register_roi(image_key, image.size, [[crop_x, crop_y, crop_x2, crop_y2]], "smart-crop"),
             }
             if mask_bbox:
                 response["mask_bbox"] = mask_bbox
-            return JSONResponse(content=response)
+            if fmt == "json":
+                return negotiated_response(fmt, response)
+            meta, arrays = keypoints_compact(response)
+            return negotiated_response(fmt, response, arrays=arrays, meta=meta)
 
         print(f"✂️ 크롭 좌표: ({crop_x}, {crop_y}) {crop_w}x{crop_h} (유효 키포인트: {valid_count}개)")
         print(f"⚡ 완료! 소요시간: {time.time() - start_time:.2f}초")
@@ -1540,10 +3353,14 @@ async def smart_crop(
             "valid_keypoints": valid_count,
             "keypoints": keypoints_list,
             "kp_bbox": kp_bbox,
+            "roi_id": register_roi(image_key, image.size, [[crop_x, crop_y, crop_x2, crop_y2]], "smart-crop"),
         }
         if mask_bbox:
             response["mask_bbox"] = mask_bbox
-        return JSONResponse(content=response)
+        if fmt == "json":
+            return negotiated_response(fmt, response)
+        meta, arrays = keypoints_compact(response)
+        return negotiated_response(fmt, response, arrays=arrays, meta=meta)
 
     except HTTPException:
         raise
@@ -1554,159 +3371,8 @@ async def smart_crop(
         raise HTTPException(status_code=500, detail=f"스마트 크롭 중 오류: {str(e)}")
 
 # ========== Ryan Book Automation API ==========
-
-class ChildData(BaseModel):
-    firstName: str
-    lastName: str = ""
-    fullName: str = ""
-    gender: str = "boy"
-    birthday: Optional[str] = None
-    photo: Optional[str] = None
-    photoNoBg: Optional[str] = None
-
-class FavoriteObject(BaseModel):
-    name: str
-    photo: Optional[str] = None
-    photoNoBg: Optional[str] = None
-    emoji: str = "❓"
-    josaMode: str = "friend"
-
-class FamilyMember(BaseModel):
-    id: str
-    relation: str
-    emoji: str
-    photo: Optional[str] = None
-    customName: Optional[str] = None
-
-class BookRequest(BaseModel):
-    child: ChildData
-    objects: List[FavoriteObject] = []
-    familyMembers: List[FamilyMember] = []
-
-@app.get("/josa-preview")
-async def josa_preview(name: str = Query(..., min_length=1, description="조사를 적용할 이름")):
-    """
-    한글 조사 미리보기 API
-
-    이름을 입력하면 9가지 조사 형태의 예시를 반환합니다.
-    프론트엔드에서 실시간 조사 미리보기에 사용됩니다.
-    """
-    if not RYAN_ENGINE_AVAILABLE:
-        raise HTTPException(status_code=500, detail="Ryan Engine을 사용할 수 없습니다.")
-
-    josa = JosaUtils()
-    demo = josa.generate_josa_demo(name)
-
-    return JSONResponse(content={
-        "success": True,
-        "name": demo['name'],
-        "hasBatchim": demo['has_batchim'],
-        "examples": demo['examples']
-    })
-
-@app.post("/generate-book")
-async def generate_book(request: BookRequest):
-    """
-    Ryan Book 자동 생성 API
-
-    사용자 데이터를 받아 완전한 책 스펙(final_book_spec.json)을 생성합니다.
-
-    요청 예시:
-    {
-        "child": {
-            "firstName": "도현",
-            "lastName": "김",
-            "gender": "boy"
-        },
-        "objects": [
-            {"name": "토끼", "emoji": "🐰", "josaMode": "friend"},
-            {"name": "토마토", "emoji": "🍅", "josaMode": "object"}
-        ],
-        "familyMembers": [
-            {"id": "mom", "relation": "엄마", "emoji": "👩"}
-        ]
-    }
-    """
-    if not RYAN_ENGINE_AVAILABLE:
-        raise HTTPException(status_code=500, detail="Ryan Engine을 사용할 수 없습니다.")
-
-    print("-" * 40)
-    print(f"📚 책 생성 요청: {request.child.firstName}")
-    start_time = time.time()
-
-    try:
-        # 테마 파일 경로
-        theme_path = Path(__file__).parent / "ryan_engine" / "themes" / "theme_ryan.json"
-
-        if not theme_path.exists():
-            raise HTTPException(status_code=500, detail="테마 파일을 찾을 수 없습니다.")
-
-        # BookGenerator 생성
-        generator = BookGenerator(str(theme_path))
-
-        # 요청 데이터를 딕셔너리로 변환
-        user_data = {
-            'child': request.child.model_dump(),
-            'objects': [obj.model_dump() for obj in request.objects],
-            'familyMembers': [fam.model_dump() for fam in request.familyMembers],
-        }
-
-        # 책 생성
-        book_spec = generator.generate_from_dict(user_data)
-
-        # JSON 변환
-        book_json = generator.to_json(book_spec)
-
-        # 파일로 저장 (선택적)
-        output_dir = Path(__file__).parent / "output"
-        output_dir.mkdir(exist_ok=True)
-        safe_name = re.sub(r'[^a-zA-Z0-9가-힣_\-]', '_', request.child.firstName)
-        output_path = output_dir / f"book_{safe_name}_{int(time.time())}.json"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(book_json)
-
-        print(f"✅ 책 생성 완료! 파일: {output_path}")
-        print(f"⚡ 소요시간: {time.time() - start_time:.2f}초")
-        print("-" * 40)
-
-        return JSONResponse(content={
-            "success": True,
-            "bookSpec": json.loads(book_json),
-            "savedTo": str(output_path)
-        })
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"❌ 책 생성 오류: {str(e)}")
-        traceback.print_exc()
-        raise HTTPException(
-            status_code=500,
-            detail=f"책 생성 중 오류가 발생했습니다: {str(e)}"
-        )
-
-# ========== 인쇄 요청 API ==========
-
-class PrintRequest(BaseModel):
-    firstName: str
-    parentNames: str = ""
-    version: str = "A"
-    bookId: str = ""
-    timestamp: str = ""
-
-@app.post("/request-print")
-async def request_print(request: PrintRequest):
-    """인쇄 요청 접수 (북토리 연동은 추후)"""
-    print("-" * 40)
-    print(f"🖨️ 인쇄 요청 접수: {request.firstName} (버전: {request.version}, bookId: {request.bookId})")
-    print(f"   시각: {request.timestamp}")
-    print("-" * 40)
-
-    return JSONResponse(content={
-        "success": True,
-        "message": "인쇄 요청이 접수되었습니다.",
-        "bookId": request.bookId,
-    })
+# /josa-preview, /generate-book, /request-print — torch 없는 book_api.py 라우터 (SERVER_PROFILE=book 단독 실행 가능)
+app.include_router(book_router)
 
 # ========== SAM2 아이 세그멘테이션 API ==========
 
@@ -1810,9 +3476,11 @@ async def segment_child(
 
         # SAM2 추론 (GPU 작업이므로 to_thread 사용)
         def _run_sam2():
-            img_np = np.array(image)
+            # 공용 입력으로 임베딩 (캐시 공유) → 프롬프트 좌표/마스크는 원본 해상도 기준
+            img_np = sam2_input_image(image)
             with sam2_lock, torch.inference_mode():
                 predictor.set_image(img_np)
+                predictor._orig_hw = [(image.height, image.width)]
                 masks, scores, logits = predictor.predict(
                     point_coords=point_coords_arr,
                     point_labels=point_labels_arr,
@@ -1887,19 +3555,71 @@ async def segment_child(
 
 # ========== SAM2 전체 오브젝트 세그멘테이션 API ==========
 
+SAM2_COARSE_SIDE = 16  # coarse-to-fine 1차 격자 (16×16)
+
+def sam2_point_grids(generator, points_per_side: int):
+    """AMG 크롭 레이어별 정규화 점 격자 (sam2.utils.amg)"""
+    amg = importlib.import_module("sam2.utils.amg")
+    return amg.build_all_layer_point_grids(
+        points_per_side, generator.crop_n_layers, getattr(generator, "crop_n_points_downscale_factor", 1))
+
+def sam2_generate(generator, img_np: np.ndarray, points_per_side: int, points_per_batch: int, adaptive: bool):
+    """
+    AMG 실행 (sam2_amg_lock 안에서 호출).
+    adaptive: 16×16 격자로 먼저 실행 → 어떤 마스크에도 덮이지 않은 영역의 points_per_side 격자 점만 2차 실행
+    (2차 set_image는 임베딩 캐시 적중 → 디코더만 추가 실행)
+    """
+    generator.points_per_batch = points_per_batch
+    if not adaptive or points_per_side <= SAM2_COARSE_SIDE:
+        generator.point_grids = sam2_point_grids(generator, points_per_side)
+        return generator.generate(img_np)
+
+    grids = sam2_point_grids(generator, SAM2_COARSE_SIDE)
+    generator.point_grids = grids
+    coarse = generator.generate(img_np)
+    h, w = img_np.shape[:2]
+    covered = np.zeros((h, w), dtype=bool)
+    for m in coarse:
+        covered |= m["segmentation"]
+
+    fine = sam2_point_grids(generator, points_per_side)
+    px = np.clip((fine[0][:, 0] * w).astype(int), 0, w - 1)
+    py = np.clip((fine[0][:, 1] * h).astype(int), 0, h - 1)
+    todo = fine[0][~covered[py, px]]
+    print(f"   🔍 coarse-to-fine: 1차 {SAM2_COARSE_SIDE}² → {len(coarse)}개, 미커버 점 {len(todo)}/{len(fine[0])}개 2차 실행")
+    if len(todo) == 0:
+        return coarse
+    generator.point_grids = [todo] + fine[1:]
+    extra = generator.generate(img_np)
+    # 1차 마스크와 절반 이상 겹치는 2차 마스크는 중복으로 제거
+    extra = [m for m in extra if np.count_nonzero(m["segmentation"] & covered) < 0.5 * max(m["area"], 1)]
+    return coarse + extra
+
+
 @app.post("/segment-all")
 async def segment_all(
+    request: Request,
     file: UploadFile = File(...),
     max_masks: int = Query(default=30, ge=1, le=100, description="최대 마스크 수"),
     min_area_pct: float = Query(default=0.5, ge=0.0, le=50.0, description="최소 면적 비율 (%)"),
+    points_per_side: int = Query(default=32, ge=4, le=64, description="점 격자 밀도 (한 변 점 수)"),
+    points_per_batch: int = Query(default=64, ge=8, le=512, description="디코더 1회 배치 점 수 (클수록 빠르나 VRAM 증가)"),
+    adaptive: bool = Query(default=False, description="coarse-to-fine: 16×16 결과에 덮이지 않은 영역만 세밀 격자로 추가 실행"),
+    format: str = Query(default="png", pattern="^(png|rle)$", description="png: 원본 크기 label map PNG(base64) / rle: 세그먼트별 COCO RLE (처리 해상도, 업스케일 생략)"),
 ):
     """
     SAM2 AutomaticMaskGenerator로 이미지 내 모든 오브젝트 자동 세그멘테이션.
     label map (grayscale PNG, pixel=segment index, 0=background)과 메타데이터를 반환.
+    format=rle이면 label map 대신 세그먼트별 COCO RLE (mask_width × mask_height 기준)를 반환.
+    바이너리 응답(Accept: msgpack / x-monvie-f32)은 항상 RLE + 박스 [N,4] / 점수 [N] 배열.
     """
     print("-" * 40)
-    print(f"🎯 SAM2 전체 세그멘테이션 요청: {file.filename} (max_masks={max_masks}, min_area_pct={min_area_pct}%)")
+    print(f"🎯 SAM2 전체 세그멘테이션 요청: {file.filename} (max_masks={max_masks}, min_area_pct={min_area_pct}%, "
+          f"grid={points_per_side}², batch={points_per_batch}, adaptive={adaptive}, format={format})")
     start_time = time.time()
+    fmt = response_format(request)
+    if fmt != "json":
+        format = "rle"
 
     if not SAM2_AVAILABLE:
         raise HTTPException(status_code=500, detail="SAM2 모듈이 설치되지 않았습니다.")
@@ -1921,25 +3641,20 @@ async def segment_all(
     try:
         orig_w, orig_h = image.size
 
-        # 성능 최적화: max 1024px로 리사이즈 후 처리
-        MAX_SIDE = 1024
-        scale = 1.0
-        if max(orig_w, orig_h) > MAX_SIDE:
-            scale = MAX_SIDE / max(orig_w, orig_h)
-            new_w = int(orig_w * scale)
-            new_h = int(orig_h * scale)
-            image_small = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        # 성능 최적화: max 1024px로 리사이즈 후 처리 (/segment-child와 같은 입력 → 임베딩 캐시 공유)
+        img_np = sam2_input_image(image)
+        new_h, new_w = img_np.shape[:2]
+        scale = new_w / orig_w
+        if (new_w, new_h) != (orig_w, orig_h):
             print(f"   📐 리사이즈: {orig_w}x{orig_h} → {new_w}x{new_h}")
         else:
-            image_small = image
-            new_w, new_h = orig_w, orig_h
+            scale = 1.0
 
         generator = get_sam2_mask_generator()
 
         def _run_auto_mask():
-            img_np = np.array(image_small)
-            with sam2_lock, torch.inference_mode():
-                masks = generator.generate(img_np)
+            with sam2_amg_lock, torch.inference_mode():
+                masks = sam2_generate(generator, img_np, points_per_side, points_per_batch, adaptive)
             return masks
 
         raw_masks = await asyncio.to_thread(_run_auto_mask)
@@ -1953,14 +3668,8 @@ async def segment_all(
         filtered = filtered[:max_masks]
         print(f"   필터링 후 {len(filtered)}개 (min_area={min_area:.0f}px)")
 
-        # label map 구성 (작은 해상도 기준)
-        label_map_small = np.zeros((new_h, new_w), dtype=np.uint8)
         segments = []
         for i, m in enumerate(filtered):
-            idx = i + 1  # 1-based (0=background)
-            mask = m['segmentation']  # bool array (new_h, new_w)
-            label_map_small[mask] = idx
-
             # bbox를 원본 해상도로 변환
             bx, by, bw, bh = m['bbox']  # XYWH format
             if scale != 1.0:
@@ -1971,33 +3680,52 @@ async def segment_all(
             orig_area = int(m['area'] / (scale * scale))
 
             segments.append({
-                "index": idx,
+                "index": i + 1,  # 1-based (0=background)
                 "bbox": [bx, by, bx + bw, by + bh],
                 "area": orig_area,
                 "area_pct": round(orig_area / (orig_w * orig_h) * 100, 2),
                 "score": round(float(m.get('predicted_iou', m.get('stability_score', 0))), 3),
             })
 
-        # label map을 원본 크기로 복원 (NEAREST 보간으로 경계 유지)
-        label_map_pil = Image.fromarray(label_map_small, mode='L')
-        if scale != 1.0:
-            label_map_pil = label_map_pil.resize((orig_w, orig_h), Image.Resampling.NEAREST)
+        def _encode_masks() -> dict:
+            if format == "rle":
+                # 처리 해상도 마스크 그대로 RLE (겹침 유지, 원본 업스케일 생략)
+                for seg, m in zip(segments, filtered):
+                    seg["rle"] = mask_to_rle(m['segmentation'])
+                return {"mask_width": new_w, "mask_height": new_h}
 
-        # PNG로 인코딩 → base64
-        buf = io.BytesIO()
-        label_map_pil.save(buf, format='PNG')
-        label_map_b64 = base64.b64encode(buf.getvalue()).decode('ascii')
+            # label map 구성 (작은 해상도 기준, 면적 큰 순 → 작은 세그먼트가 위)
+            label_map_small = label_map_from_masks([m['segmentation'] for m in filtered], (new_h, new_w))
+
+            # label map을 원본 크기로 복원 (NEAREST 보간으로 경계 유지)
+            label_map_pil = Image.fromarray(label_map_small, mode='L')
+            if scale != 1.0:
+                label_map_pil = label_map_pil.resize((orig_w, orig_h), Image.Resampling.NEAREST)
+
+            # PNG로 인코딩 → base64
+            buf = io.BytesIO()
+            label_map_pil.save(buf, format='PNG')
+            return {"label_map": base64.b64encode(buf.getvalue()).decode('ascii')}
+
+        encoded = await asyncio.to_thread(_encode_masks)
 
         elapsed = time.time() - start_time
         print(f"⚡ SAM2 전체 세그멘테이션 완료! {len(segments)}개 세그먼트, {elapsed:.2f}초")
         print("-" * 40)
 
         clear_gpu_memory()
-        return JSONResponse(content={
+        content = {
             "segments": segments,
-            "label_map": label_map_b64,
+            **encoded,
             "image_width": orig_w,
             "image_height": orig_h,
+        }
+        if fmt == "json":
+            return negotiated_response(fmt, content)
+        meta = {**content, "segments": [{k: v for k, v in seg.items() if k not in ("bbox", "score")} for seg in segments]}
+        return negotiated_response(fmt, content, meta=meta, arrays={
+            "boxes": np.array([seg["bbox"] for seg in segments], dtype=np.float32).reshape(-1, 4),
+            "scores": np.array([seg["score"] for seg in segments], dtype=np.float32),
         })
 
     except Exception as e:
@@ -2009,6 +3737,42 @@ async def segment_all(
 # ========== 아이 감지 API (DINO / MM-DINO / DINO-Base / Florence-2) ==========
 # ⚠️ VRAM 참고: 4개 모델 전부 로드 시 ~2.7GB. RTX 4070S(12GB)에서 다른 모델과 합산 시 주의.
 
+DINO_MODELS = ("gdino", "mmdino", "gdino-base")
+DETECT_MODEL_LABELS = {"gdino": "DINO-Tiny", "mmdino": "MM-DINO", "gdino-base": "DINO-Base", "florence2": "Florence-2"}
+# /detect-child threshold 하한 (Query ge와 동일) — 이 값 이하 쿼리는 어떤 임계값에서도 버려지므로 캐시에서 제외
+DETECT_MIN_THRESHOLD = 0.05
+_PERSON_KEYWORDS = {"person", "child", "human", "man", "woman", "boy", "girl", "baby", "kid", "toddler", "infant"}
+
+# Florence-2 디코딩 프로파일 (<OD>, <CAPTION_TO_PHRASE_GROUNDING>) — 지연/정확도 트레이드오프
+# quality: 기존 동작 (beam 3), balanced: greedy, fast: greedy + 박스 N개 완성 시 조기 종료
+FLORENCE2_DECODE_PROFILES = {
+    "quality": {"num_beams": 3, "max_new_tokens": 1024, "max_boxes": None},
+    "balanced": {"num_beams": 1, "max_new_tokens": 512, "max_boxes": None},
+    "fast": {"num_beams": 1, "max_new_tokens": 256, "max_boxes": 8},  # max_boxes: grounding 태스크에만 적용
+}
+# <OD>는 프로파일과 무관하게 기존 상한 유지 — 사람 필터가 생성 후에 적용되므로 박스 목록이 잘리면 사람을 놓침
+# (박스 1개 ≈ 라벨 1~3 + 위치 4 토큰 → 1024 토큰이면 100개 이상)
+FLORENCE2_OD_MAX_NEW_TOKENS = 1024
+
+def florence2_box_stopper(tokenizer, max_boxes: int):
+    """박스 max_boxes개의 위치 토큰(<loc_*> ×4)이 완성되면 생성 중단하는 StoppingCriteria"""
+    from transformers import StoppingCriteria
+    loc_first = tokenizer.convert_tokens_to_ids("<loc_0>")
+    loc_last = tokenizer.convert_tokens_to_ids("<loc_999>")
+
+    class _BoxCompleteStop(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            is_loc = (input_ids >= loc_first) & (input_ids <= loc_last)
+            loc_count = is_loc.sum(dim=-1)
+            # 마지막 토큰이 위치 토큰이고 4의 배수 → 박스 경계에서만 중단
+            return is_loc[:, -1] & (loc_count % 4 == 0) & (loc_count >= 4 * max_boxes)
+
+    return _BoxCompleteStop()
+
+# 임계값 적용 전 원시 감지 결과 캐시 — (이미지 해시, 모델, 프롬프트, 태스크) → CPU 텐서
+# UI에서 threshold만 바꿔 재호출하면 모델 추론 없이 후처리만 수행
+detection_cache = LRUCache(maxsize=int(os.environ.get("DETECTION_CACHE_SIZE", 64)))
+
 def _build_detections(boxes_list, scores_list, labels_list):
     """감지 결과를 통일된 형식으로 변환"""
     detections = []
@@ -2029,13 +3793,213 @@ def _build_detections(boxes_list, scores_list, labels_list):
     detections.sort(key=lambda d: d["area"], reverse=True)
     return detections
 
+def get_detector(model: str):
+    """감지 모델 이름 → (model, processor)"""
+    if model == "gdino":
+        return get_gdino_model()
+    if model == "mmdino":
+        return get_mmdino_model()
+    if model == "gdino-base":
+        return get_gdino_base_model()
+    if model == "florence2":
+        return get_florence2_model()
+    raise ValueError(f"지원하지 않는 모델: {model}")
+
+def detection_cache_key(image_key: str, model: str, prompt: str, task: str, decode: str = "quality") -> tuple:
+    """원시 감지 결과 캐시 키 (DINO는 task/decode 무관, Florence-2 OD는 prompt 무관)"""
+    if model in DINO_MODELS:
+        return (image_key, model, normalize_dino_prompt(prompt), "", "")
+    if task == "grounding":
+        return (image_key, model, prompt.strip(), task, decode)
+    return (image_key, model, "", task, decode)
+
+def run_detection_raw(model: str, image: Image.Image, prompt: str, task: str, decode: str = "quality") -> dict:
+    """임계값 적용 전 원시 감지 결과 (동기 — 스레드에서 실행)"""
+    m, proc = get_detector(model)
+
+    # ---- DINO-like 모델 (gdino, mmdino, gdino-base) ----
+    if model in DINO_MODELS:
+        # 텍스트 입력은 모델별 캐시 재사용, 이미지만 매번 전처리
+        text_inputs, text_key = get_dino_text_inputs(model, proc, prompt)
+        image_inputs = proc.image_processor(images=image, return_tensors="pt")
+        inputs = {k: v.to(device) for k, v in {**image_inputs, **text_inputs}.items()}
+        with torch.no_grad(), dino_text_key(m, text_key):
+            outputs = m(**inputs)
+        logits = outputs.logits[0].float().cpu()
+        pred_boxes = outputs.pred_boxes[0].float().cpu()
+        # 최저 임계값도 넘지 못하는 쿼리는 제거 (후처리 결과 동일, 캐시 메모리 절약)
+        keep = logits.sigmoid().max(dim=-1).values > DETECT_MIN_THRESHOLD
+        return {
+            "kind": "dino",
+            "logits": logits[keep].unsqueeze(0),
+            "pred_boxes": pred_boxes[keep].unsqueeze(0),
+            "input_ids": inputs["input_ids"].cpu(),
+            "image_size": image.size,
+        }
+
+    # ---- Florence-2 ----
+    if task == "grounding":
+        task_prompt = "<CAPTION_TO_PHRASE_GROUNDING>"
+        text_input = prompt.strip()
+    else:
+        task_prompt = "<OD>"
+        text_input = task_prompt
+
+    inputs = proc(text=text_input, images=image, return_tensors="pt")
+    inputs = {k: v.to(device) if hasattr(v, 'to') else v for k, v in inputs.items()}
+    # FP16 변환
+    if inputs.get("pixel_values") is not None:
+        inputs["pixel_values"] = inputs["pixel_values"].to(torch.float16)
+
+    profile = FLORENCE2_DECODE_PROFILES[decode]
+    gen_kwargs = {
+        "max_new_tokens": profile["max_new_tokens"] if task == "grounding" else FLORENCE2_OD_MAX_NEW_TOKENS,
+        "num_beams": profile["num_beams"],
+        "do_sample": False,
+        "use_cache": True,
+    }
+    # 토큰/박스 수 상한은 grounding에서만 — <OD>는 사람 필터가 생성 후에 적용되므로
+    # 사람 외 물체가 먼저 나열되면 사람을 놓침 → EOS(또는 FLORENCE2_OD_MAX_NEW_TOKENS)까지 생성
+    if profile["max_boxes"] and task == "grounding":
+        from transformers import StoppingCriteriaList
+        gen_kwargs["stopping_criteria"] = StoppingCriteriaList([florence2_box_stopper(proc.tokenizer, profile["max_boxes"])])
+
+    with torch.no_grad():
+        generated_ids = m.generate(
+            input_ids=inputs["input_ids"],
+            pixel_values=inputs["pixel_values"],
+            **gen_kwargs,
+        )
+    generated_tokens = int(generated_ids.shape[-1])
+    generated_text = proc.batch_decode(generated_ids, skip_special_tokens=False)[0]
+    parsed = proc.post_process_generation(
+        generated_text,
+        task=task_prompt,
+        image_size=(image.width, image.height),
+    )
+
+    f2_boxes = []
+    f2_labels = []
+    if task == "grounding" and "<CAPTION_TO_PHRASE_GROUNDING>" in parsed:
+        result = parsed["<CAPTION_TO_PHRASE_GROUNDING>"]
+        for bbox, lbl in zip(result.get("bboxes", []), result.get("labels", [])):
+            f2_boxes.append(bbox)
+            f2_labels.append(lbl)
+    elif "<OD>" in parsed:
+        result = parsed["<OD>"]
+        for bbox, lbl in zip(result.get("bboxes", []), result.get("labels", [])):
+            # OD 모드: 인물 관련 라벨만 필터 (단어 단위 매칭)
+            if set(lbl.lower().split()) & _PERSON_KEYWORDS:
+                f2_boxes.append(bbox)
+                f2_labels.append(lbl)
+    return {"kind": "florence2", "boxes": f2_boxes, "labels": f2_labels,
+            "decode_profile": decode, "generated_tokens": generated_tokens}
+
+def detections_from_raw(model: str, raw: dict, threshold: float) -> list:
+    """캐시된 원시 결과에 임계값 적용 + 정렬 (모델 추론 없음)"""
+    if raw["kind"] == "dino":
+        _, proc = get_detector(model)
+        outputs = SimpleNamespace(logits=raw["logits"], pred_boxes=raw["pred_boxes"], input_ids=raw["input_ids"])
+        results = proc.post_process_grounded_object_detection(
+            outputs,
+            raw["input_ids"],
+            threshold=threshold,
+            text_threshold=threshold,
+            target_sizes=[raw["image_size"][::-1]],
+        )[0]
+        boxes = results["boxes"].cpu().numpy().tolist()
+        scores = results["scores"].cpu().numpy().tolist()
+        return _build_detections(boxes, scores, results["labels"])
+    # Florence-2는 confidence score 없음 → 1.0 고정
+    return _build_detections(raw["boxes"], [1.0] * len(raw["boxes"]), raw["labels"])
+
+def run_on_own_stream(fn, *args):
+    """CUDA면 별도 스트림에서 실행 (동시 실행 모델 간 커널 겹침), 그 외는 그대로 실행"""
+    if device != "cuda":
+        return fn(*args)
+    stream = torch.cuda.Stream()
+    with torch.cuda.stream(stream):
+        result = fn(*args)
+    stream.synchronize()
+    return result
+
+async def detect_with_cache(model: str, image: Image.Image, image_key: str, prompt: str, task: str, decode: str):
+    """원시 감지 결과 (캐시 우선) → (raw, cached, elapsed)"""
+    t0 = time.time()
+    cache_key = detection_cache_key(image_key, model, prompt, task, decode)
+    raw = detection_cache.get(cache_key)
+    if raw is not None:
+        return raw, True, time.time() - t0
+    raw = await asyncio.to_thread(run_on_own_stream, run_detection_raw, model, image, prompt, task, decode)
+    detection_cache.put(cache_key, raw)
+    return raw, False, time.time() - t0
+
+def _box_iou(box, boxes: np.ndarray) -> np.ndarray:
+    """box 1개 vs boxes (N,4) IoU"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+def fuse_detections(per_model: dict, method: str = "wbf", iou_thr: float = 0.55) -> list:
+    """모델별 감지 결과 융합 — nms: 점수순 억제, wbf: 점수 가중 평균 박스 (Weighted Boxes Fusion)"""
+    pooled = [(d, name) for name, dets in per_model.items() for d in dets]
+    if not pooled:
+        return []
+    pooled.sort(key=lambda p: p[0]["score"], reverse=True)
+    boxes = np.array([p[0]["box"] for p in pooled], dtype=np.float32)
+    scores = np.array([p[0]["score"] for p in pooled], dtype=np.float32)
+
+    clusters = []  # 각 클러스터: pooled 인덱스 리스트
+    fused_boxes = np.zeros((0, 4), dtype=np.float32)
+    for i in range(len(pooled)):
+        if len(clusters):
+            ious = _box_iou(boxes[i], fused_boxes)
+            j = int(np.argmax(ious))
+            if ious[j] > iou_thr:
+                clusters[j].append(i)
+                if method == "wbf":
+                    w = scores[clusters[j]]
+                    fused_boxes[j] = (boxes[clusters[j]] * w[:, None]).sum(axis=0) / w.sum()
+                continue
+        clusters.append([i])
+        fused_boxes = np.vstack([fused_boxes, boxes[i:i + 1]])
+
+    n_models = max(1, len(per_model))
+    fused_scores, fused_labels, fused_sources = [], [], []
+    for members in clusters:
+        sources = sorted({pooled[k][1] for k in members})
+        if method == "wbf":
+            # 일부 모델만 감지한 박스는 점수 감쇠
+            fused_scores.append(float(scores[members].mean()) * min(len(sources), n_models) / n_models)
+        else:
+            fused_scores.append(float(scores[members[0]]))
+        fused_labels.append(pooled[members[0]][0]["label"])
+        fused_sources.append(sources)
+
+    detections = _build_detections(fused_boxes.tolist(), fused_scores, fused_labels)
+    # _build_detections가 면적순 재정렬하므로 박스 좌표로 sources 매칭
+    source_by_box = {tuple(float(v) for v in b): src for b, src in zip(fused_boxes.tolist(), fused_sources)}
+    for d in detections:
+        d["models"] = source_by_box.get(tuple(d["box"]), [])
+    return detections
+
 @app.post("/detect-child")
 async def detect_child(
+    request: Request,
     file: UploadFile = File(...),
     prompt: str = Query(default="child . person", description="감지할 텍스트 프롬프트 (마침표로 구분)"),
-    threshold: float = Query(default=0.25, ge=0.05, le=0.9, description="감지 임계값"),
+    threshold: float = Query(default=0.25, ge=DETECT_MIN_THRESHOLD, le=0.9, description="감지 임계값"),
     model: Literal["gdino", "mmdino", "gdino-base", "florence2"] = Query(default="gdino", description="감지 모델"),
     task: Literal["od", "grounding"] = Query(default="od", description="Florence-2 태스크"),
+    decode: Literal["quality", "balanced", "fast"] = Query(default="quality", description="Florence-2 디코딩 프로파일"),
+    models: str = Query(default="", description="여러 모델 동시 실행 (콤마 구분, 예: gdino,mmdino,florence2) — 지정 시 model 무시"),
+    fuse: Literal["none", "nms", "wbf"] = Query(default="none", description="models 사용 시 결과 융합 방식"),
+    fuse_iou: float = Query(default=0.55, ge=0.1, le=0.95, description="융합 IoU 임계값"),
 ):
     """
     이미지에서 아이/인물 감지 (다중 모델 지원)
@@ -2043,20 +4007,38 @@ async def detect_child(
     - mmdino: MM-DINO Tiny (50.6 AP)
     - gdino-base: Grounding DINO Base (52.5 AP)
     - florence2: Florence-2-large-ft (멀티태스크)
+
+    같은 이미지/모델/프롬프트 재호출 시 원시 결과 캐시를 사용해 임계값만 다시 적용.
+    models 지정 시 이미지를 한 번만 디코딩하고 선택 모델을 동시에 실행 (GPU: 모델별 CUDA 스트림).
+    Accept 헤더로 바이너리 응답 선택 가능 (박스 [N,4] / 점수 [N] 배열).
     """
-    MODEL_LABELS = {"gdino": "DINO-Tiny", "mmdino": "MM-DINO", "gdino-base": "DINO-Base", "florence2": "Florence-2"}
-    model_label = MODEL_LABELS.get(model, model)
+    fmt = response_format(request)
+    model_list = []
+    if models:
+        for name in models.split(","):
+            name = name.strip()
+            if not name:
+                continue
+            if name not in DETECT_MODEL_LABELS:
+                raise HTTPException(status_code=400, detail=f"지원하지 않는 모델: {name}. gdino|mmdino|gdino-base|florence2 중 선택")
+            if name not in model_list:
+                model_list.append(name)
+    if model_list:
+        model = model_list[0]
+    else:
+        model_list = [model]
+    model_label = DETECT_MODEL_LABELS.get(model, model) if len(model_list) == 1 else "+".join(DETECT_MODEL_LABELS[n] for n in model_list)
 
     print("-" * 40)
     if model == "florence2":
-        print(f"🔍 {model_label} 감지 요청: {file.filename} (model: {model}, task: {task}, prompt: '{prompt}')")
+        print(f"🔍 {model_label} 감지 요청: {file.filename} (model: {model}, task: {task}, decode: {decode}, prompt: '{prompt}')")
     else:
         print(f"🔍 {model_label} 감지 요청: {file.filename} (model: {model}, prompt: '{prompt}', threshold: {threshold})")
     start_time = time.time()
 
-    if model in ("gdino", "mmdino", "gdino-base") and not GDINO_AVAILABLE:
+    if any(n in DINO_MODELS for n in model_list) and not GDINO_AVAILABLE:
         raise HTTPException(status_code=500, detail="Grounding DINO가 설치되지 않았습니다.")
-    if model == "florence2" and not FLORENCE2_AVAILABLE:
+    if "florence2" in model_list and not FLORENCE2_AVAILABLE:
         raise HTTPException(status_code=500, detail="Florence-2가 설치되지 않았습니다.")
 
     if not is_allowed_image(file):
@@ -2072,118 +4054,98 @@ async def detect_child(
         image = image.convert("RGB")
     except Exception:
         raise HTTPException(status_code=400, detail="올바른 이미지 형식이 아닙니다.")
+    image_key = image_hash(image_data)
 
     try:
-        # ---- DINO-like 모델 (gdino, mmdino, gdino-base) ----
-        if model in ("gdino", "mmdino", "gdino-base"):
-            if model == "mmdino":
-                m, proc = get_mmdino_model()
-            elif model == "gdino-base":
-                m, proc = get_gdino_base_model()
-            else:
-                m, proc = get_gdino_model()
-
-            def _run_dino_like():
-                gdino_prompt = prompt.strip()
-                if not gdino_prompt.endswith('.'):
-                    gdino_prompt += '.'
-                inputs = proc(images=image, text=gdino_prompt, return_tensors="pt").to(device)
-                with torch.no_grad():
-                    outputs = m(**inputs)
-                results = proc.post_process_grounded_object_detection(
-                    outputs,
-                    inputs.input_ids,
-                    threshold=threshold,
-                    text_threshold=threshold,
-                    target_sizes=[image.size[::-1]],
-                )[0]
-                return results
-
-            results = await asyncio.to_thread(_run_dino_like)
-            boxes = results["boxes"].cpu().numpy().tolist()
-            scores = results["scores"].cpu().numpy().tolist()
-            labels = results["labels"]
-            detections = _build_detections(boxes, scores, labels)
-
-        # ---- Florence-2 ----
-        elif model == "florence2":
-            f2_model, f2_proc = get_florence2_model()
-
-            def _run_florence2():
-                if task == "grounding":
-                    task_prompt = "<CAPTION_TO_PHRASE_GROUNDING>"
-                    text_input = prompt.strip()
-                else:
-                    task_prompt = "<OD>"
-                    text_input = task_prompt
-
-                inputs = f2_proc(text=text_input, images=image, return_tensors="pt")
-                inputs = {k: v.to(device) if hasattr(v, 'to') else v for k, v in inputs.items()}
-                # FP16 변환
-                if inputs.get("pixel_values") is not None:
-                    inputs["pixel_values"] = inputs["pixel_values"].to(torch.float16)
-
-                with torch.no_grad():
-                    generated_ids = f2_model.generate(
-                        input_ids=inputs["input_ids"],
-                        pixel_values=inputs["pixel_values"],
-                        max_new_tokens=1024,
-                        num_beams=3,
-                    )
-                generated_text = f2_proc.batch_decode(generated_ids, skip_special_tokens=False)[0]
-                parsed = f2_proc.post_process_generation(
-                    generated_text,
-                    task=task_prompt,
-                    image_size=(image.width, image.height),
-                )
-                return parsed, task_prompt
-
-            parsed, task_prompt = await asyncio.to_thread(_run_florence2)
-
-            f2_boxes = []
-            f2_labels = []
-
-            if task == "grounding" and "<CAPTION_TO_PHRASE_GROUNDING>" in parsed:
-                result = parsed["<CAPTION_TO_PHRASE_GROUNDING>"]
-                raw_boxes = result.get("bboxes", [])
-                raw_labels = result.get("labels", [])
-                for bbox, lbl in zip(raw_boxes, raw_labels):
-                    f2_boxes.append(bbox)
-                    f2_labels.append(lbl)
-            elif "<OD>" in parsed:
-                result = parsed["<OD>"]
-                raw_boxes = result.get("bboxes", [])
-                raw_labels = result.get("labels", [])
-                _PERSON_KEYWORDS = {"person", "child", "human", "man", "woman", "boy", "girl", "baby", "kid", "toddler", "infant"}
-                for bbox, lbl in zip(raw_boxes, raw_labels):
-                    # OD 모드: 인물 관련 라벨만 필터 (단어 단위 매칭)
-                    lbl_words = set(lbl.lower().split())
-                    if lbl_words & _PERSON_KEYWORDS:
-                        f2_boxes.append(bbox)
-                        f2_labels.append(lbl)
-
-            # Florence-2는 confidence score 없음 → 1.0 고정
-            f2_scores = [1.0] * len(f2_boxes)
-            detections = _build_detections(f2_boxes, f2_scores, f2_labels)
+        # ---- 멀티 모델 앙상블 ----
+        if len(model_list) > 1:
+            outcomes = await asyncio.gather(*[
+                detect_with_cache(name, image, image_key, prompt, task, decode) for name in model_list
+            ])
+            results = {}
+            per_model = {}
+            for name, (raw, cached, model_elapsed) in zip(model_list, outcomes):
+                dets = detections_from_raw(name, raw, threshold)
+                per_model[name] = dets
+                results[name] = {"detections": dets, "cached": cached, "elapsed": round(model_elapsed, 3)}
+                if raw["kind"] == "florence2":
+                    results[name]["decode_profile"] = raw["decode_profile"]
+                    results[name]["generated_tokens"] = raw["generated_tokens"]
+                print(f"   [{DETECT_MODEL_LABELS[name]}] {len(dets)}개 ({'캐시' if cached else f'{model_elapsed:.2f}초'})")
+
+            fused = fuse_detections(per_model, fuse, fuse_iou) if fuse != "none" else None
+            if fused is not None:
+                print(f"   융합({fuse}): {len(fused)}개")
+            roi_boxes = [d["box"] for d in fused] if fused else [d["box"] for dets in per_model.values() for d in dets]
+            roi_id = register_roi(image_key, image.size, roi_boxes, "detect-child") if roi_boxes else None
 
-        else:
-            raise HTTPException(status_code=400, detail=f"지원하지 않는 모델: {model}. gdino|mmdino|gdino-base|florence2 중 선택")
+            print(f"⚡ 완료! 소요시간: {time.time() - start_time:.2f}초")
+            print("-" * 40)
+            clear_gpu_memory()
+            content = {
+                "success": True,
+                "models": model_list,
+                "results": results,
+                "fused": fused,
+                "fuse": fuse,
+                "image_width": image.width,
+                "image_height": image.height,
+                "roi_id": roi_id,
+            }
+            if fmt == "json":
+                return negotiated_response(fmt, content)
+            # 바이너리: 모델별 "<모델>.boxes" / "<모델>.scores", 융합 결과 "fused.boxes" / "fused.scores"
+            meta = {k: v for k, v in content.items() if k not in ("results", "fused")}
+            meta["results"] = {}
+            arrays = {}
+            for name, res in results.items():
+                det_meta, det_arrays = detections_compact(res["detections"], f"{name}.")
+                meta["results"][name] = {**{k: v for k, v in res.items() if k != "detections"}, **det_meta}
+                arrays.update(det_arrays)
+            if fused is not None:
+                det_meta, det_arrays = detections_compact(fused, "fused.")
+                meta.update(det_meta)
+                arrays.update(det_arrays)
+            return negotiated_response(fmt, content, arrays=arrays, meta=meta)
+
+        raw, cached, _ = await detect_with_cache(model, image, image_key, prompt, task, decode)
+        if cached:
+            print("   ♻️ 원시 감지 결과 캐시 사용 — 임계값만 재적용")
+        detections = detections_from_raw(model, raw, threshold)
 
         elapsed = time.time() - start_time
         print(f"   감지 결과: {len(detections)}개 ({model_label})")
+        if raw["kind"] == "florence2":
+            print(f"   디코딩: {raw['decode_profile']} ({raw['generated_tokens']} tokens)")
         for d in detections:
             print(f"   - [{d['label']}] {d['score']:.2f} box=({d['box'][0]:.0f},{d['box'][1]:.0f},{d['box'][2]:.0f},{d['box'][3]:.0f})")
         print(f"⚡ 완료! 소요시간: {elapsed:.2f}초")
         print("-" * 40)
 
-        clear_gpu_memory()
-        return JSONResponse(content={
+        roi_id = None
+        if detections:
+            roi_id = register_roi(image_key, image.size, [d["box"] for d in detections], "detect-child")
+
+        response = {
             "success": True,
             "detections": detections,
             "model": model,
             "image_width": image.width,
             "image_height": image.height,
-        })
+            "roi_id": roi_id,
+            "cached": cached,
+        }
+        if raw["kind"] == "florence2":
+            response["decode_profile"] = raw["decode_profile"]
+            response["generated_tokens"] = raw["generated_tokens"]
+
+        if not cached:
+            clear_gpu_memory()
+        if fmt == "json":
+            return negotiated_response(fmt, response)
+        det_meta, arrays = detections_compact(detections)
+        meta = {**{k: v for k, v in response.items() if k != "detections"}, **det_meta}
+        return negotiated_response(fmt, response, arrays=arrays, meta=meta)
 
     except HTTPException:
         raise
@@ -2201,6 +4163,8 @@ async def run_vitmatte(
     mask: UploadFile = File(...),
     erode_size: int = Query(default=10, ge=1, le=50, description="Trimap foreground erode 크기"),
     dilate_size: int = Query(default=20, ge=1, le=100, description="Trimap unknown 영역 dilate 크기"),
+    trimap_scale: float = Query(default=1.0, ge=0.1, le=1.0, description="Trimap 계산 해상도 비율 (1=원본)"),
+    roi_padding: float = Query(default=0.1, ge=0.0, le=1.0, description="unknown 영역 ROI 패딩 비율"),
 ):
     """
     ViTMatte 알파 매팅
@@ -2238,55 +4202,38 @@ async def run_vitmatte(
         raise HTTPException(status_code=400, detail="올바른 마스크 형식이 아닙니다.")
 
     try:
-        import cv2
-
         vit_model, vit_processor = get_vitmatte_model()
 
-        mask_np = np.array(mask_img)
-
         # Trimap 생성: erode → definite FG, dilate → unknown boundary
-        kernel_e = np.ones((erode_size, erode_size), np.uint8)
-        kernel_d = np.ones((dilate_size, dilate_size), np.uint8)
-        fg = cv2.erode(mask_np, kernel_e, iterations=1)
-        dilated = cv2.dilate(mask_np, kernel_d, iterations=1)
-
-        trimap = np.zeros_like(mask_np, dtype=np.uint8)
-        trimap[fg > 128] = 255           # definite foreground
-        trimap[(dilated > 128) & (fg <= 128)] = 128  # unknown
-        # rest stays 0 = definite background
+        tri = build_trimap(np.array(mask_img), erode_size, dilate_size, trimap_scale)
+        print(f"   Trimap 생성: FG={tri.counts['fg']}, Unknown={tri.counts['unknown']}, BG={tri.counts['bg']}")
 
-        trimap_pil = Image.fromarray(trimap)
-        print(f"   Trimap 생성: FG={np.sum(trimap==255)}, Unknown={np.sum(trimap==128)}, BG={np.sum(trimap==0)}")
-
-        # GPU VRAM 절약: 큰 이미지는 리사이즈 후 처리 → 알파맵만 원본 크기로 복원
+        # GPU VRAM 절약: 큰 입력은 리사이즈 후 처리 → 알파맵만 입력 크기로 복원
         MAX_VITMATTE_DIM = 1024
-        orig_w, orig_h = image.size
-        if max(orig_w, orig_h) > MAX_VITMATTE_DIM:
-            scale = MAX_VITMATTE_DIM / max(orig_w, orig_h)
-            new_w = int(orig_w * scale)
-            new_h = int(orig_h * scale)
-            image_small = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-            trimap_small = trimap_pil.resize((new_w, new_h), Image.Resampling.NEAREST)
-            print(f"   📐 ViTMatte 리사이즈: {orig_w}x{orig_h} → {new_w}x{new_h}")
-        else:
-            image_small = image
-            trimap_small = trimap_pil
 
-        def _run_vitmatte():
-            inputs = vit_processor(images=image_small, trimaps=trimap_small, return_tensors="pt")
+        def _run_vitmatte(image_in: Image.Image, trimap_in: np.ndarray) -> np.ndarray:
+            in_w, in_h = image_in.size
+            trimap_pil = Image.fromarray(trimap_in)
+            if max(in_w, in_h) > MAX_VITMATTE_DIM:
+                scale = MAX_VITMATTE_DIM / max(in_w, in_h)
+                new_w = int(in_w * scale)
+                new_h = int(in_h * scale)
+                image_in = image_in.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                trimap_pil = trimap_pil.resize((new_w, new_h), Image.Resampling.NEAREST)
+                print(f"   📐 ViTMatte 리사이즈: {in_w}x{in_h} → {new_w}x{new_h}")
+            inputs = vit_processor(images=image_in, trimaps=trimap_pil, return_tensors="pt")
             inputs = {k: v.to(device).half() if v.dtype == torch.float32 else v.to(device) for k, v in inputs.items()}
             with torch.no_grad():
                 output = vit_model(**inputs)
             alpha = output.alphas[0, 0].float().cpu().numpy()
-            alpha = np.clip(alpha * 255, 0, 255).astype(np.uint8)
-            return alpha
+            alpha = Image.fromarray(np.clip(alpha * 255, 0, 255).astype(np.uint8))
+            # 리사이즈했으면 알파맵을 입력 크기로 복원 (processor 패딩분 포함)
+            if alpha.size != (in_w, in_h):
+                alpha = alpha.crop((0, 0, image_in.width, image_in.height)).resize((in_w, in_h), Image.Resampling.LANCZOS)
+            return np.array(alpha)
 
-        alpha_np = await asyncio.to_thread(_run_vitmatte)
+        alpha_np = await asyncio.to_thread(matte_with_trimap, image, tri, _run_vitmatte, roi_padding)
         alpha_pil = Image.fromarray(alpha_np)
-        # 리사이즈했으면 알파맵을 원본 크기로 복원
-        if alpha_pil.size != (orig_w, orig_h):
-            alpha_pil = alpha_pil.resize((orig_w, orig_h), Image.Resampling.LANCZOS)
-            print(f"   📐 알파맵 복원: {alpha_np.shape[1]}x{alpha_np.shape[0]} → {orig_w}x{orig_h}")
 
         # 원본에 알파 적용
         result = image.copy()
@@ -2336,6 +4283,20 @@ async def run_vitmatte(
 # ========== MEMatte 알파 매팅 API ==========
 
 mematte_model = None
+mematte_lock = threading.Lock()  # 토큰 예산을 요청마다 바꾸므로 추론은 한 번에 하나
+
+# 해상도 거버너: 긴 변 상한 (ROI 기준) — 초과 시 축소 처리 후 알파만 복원
+MEMATTE_MAX_SIZE = int(os.environ.get("MEMATTE_MAX_SIZE", 2048))
+# global attention 토큰 예산 = unknown 영역 패치 수 × 여유율, [MIN, MAX] 범위 (MAX = 기존 고정값)
+MEMATTE_TOKEN_MIN = int(os.environ.get("MEMATTE_TOKEN_MIN", 2000))
+MEMATTE_TOKEN_MAX = int(os.environ.get("MEMATTE_TOKEN_MAX", 18000))
+MEMATTE_TOKEN_MARGIN = 1.25
+MEMATTE_PATCH = 16
+
+def mematte_token_budget(trimap: np.ndarray) -> int:
+    """unknown(128) 픽셀을 덮는 패치 수 기반 max_number_token"""
+    patches = np.count_nonzero(trimap == 128) / (MEMATTE_PATCH * MEMATTE_PATCH)
+    return int(np.clip(patches * MEMATTE_TOKEN_MARGIN, MEMATTE_TOKEN_MIN, MEMATTE_TOKEN_MAX))
 
 def get_mematte_model():
     """MEMatte 모델 로드 (Lazy Loading)"""
@@ -2354,7 +4315,7 @@ def get_mematte_model():
     print("📂 MEMatte 모델 로딩 중...")
     cfg = LazyConfig.load(os.path.join(mematte_dir, "configs", "MEMatte_S_topk0.25_win_global_long.py"))
     cfg.model.teacher_backbone = None
-    cfg.model.backbone.max_number_token = 18000
+    cfg.model.backbone.max_number_token = MEMATTE_TOKEN_MAX
     model = instantiate(cfg.model)
     model.to(device)
     model.eval()
@@ -2370,14 +4331,18 @@ async def run_mematte(
     mask: UploadFile = File(...),
     erode_size: int = Query(default=10, ge=1, le=50, description="Trimap foreground erode 크기"),
     dilate_size: int = Query(default=20, ge=1, le=100, description="Trimap unknown 영역 dilate 크기"),
+    trimap_scale: float = Query(default=1.0, ge=0.1, le=1.0, description="Trimap 계산 해상도 비율 (1=원본)"),
+    roi_padding: float = Query(default=0.1, ge=0.0, le=1.0, description="unknown 영역 ROI 패딩 비율"),
+    max_size: int = Query(default=MEMATTE_MAX_SIZE, ge=256, le=4096, description="처리 해상도 상한 (매팅 ROI 긴 변 기준)"),
 ):
     """
     MEMatte 알파 매팅 (ViTMatte 대비 메모리 88% 절약, 동일 품질)
 
     ViTMatte와 동일하게 rough mask를 trimap으로 변환하여 정밀 알파 매트 생성.
+    처리 해상도(max_size)와 토큰 예산(unknown 영역 비례)으로 메모리 사용량 상한 고정.
     """
     print("-" * 40)
-    print(f"🧠 MEMatte 요청: {file.filename} (erode={erode_size}, dilate={dilate_size})")
+    print(f"🧠 MEMatte 요청: {file.filename} (erode={erode_size}, dilate={dilate_size}, max_size={max_size})")
     start_time = time.time()
 
     if not is_allowed_image(file):
@@ -2389,71 +4354,77 @@ async def run_mematte(
         raise HTTPException(status_code=400, detail="파일이 너무 큽니다.")
 
     try:
-        image = Image.open(io.BytesIO(image_data))
-        image = ImageOps.exif_transpose(image)
-        image = image.convert("RGB")
-
-        mask_img = Image.open(io.BytesIO(mask_data)).convert("L")
+        def _prepare():
+            # 디코드 + trimap (대형 업로드도 이벤트 루프를 막지 않도록 스레드에서)
+            image = Image.open(io.BytesIO(image_data))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGB")
 
-        orig_w, orig_h = image.size
+            mask_img = Image.open(io.BytesIO(mask_data)).convert("L")
+            if mask_img.size != image.size:
+                mask_img = mask_img.resize(image.size, Image.Resampling.LANCZOS)
 
-        # Trimap 생성 (ViTMatte와 동일 로직)
-        import cv2
-        mask_np = np.array(mask_img)
-        kernel_e = np.ones((erode_size, erode_size), np.uint8)
-        kernel_d = np.ones((dilate_size, dilate_size), np.uint8)
-        fg = cv2.erode(mask_np, kernel_e, iterations=1)
-        dilated = cv2.dilate(mask_np, kernel_d, iterations=1)
+            # Trimap 생성 (ViTMatte와 동일 로직)
+            return image, build_trimap(np.array(mask_img), erode_size, dilate_size, trimap_scale)
 
-        trimap = np.zeros_like(mask_np, dtype=np.uint8)
-        trimap[fg > 128] = 255
-        trimap[(dilated > 128) & (fg <= 128)] = 128
-
-        trimap_pil = Image.fromarray(trimap)
-        print(f"   Trimap 생성: FG={np.sum(trimap==255)}, Unknown={np.sum(trimap==128)}, BG={np.sum(trimap==0)}")
+        image, tri = await asyncio.to_thread(_prepare)
+        print(f"   Trimap 생성: FG={tri.counts['fg']}, Unknown={tri.counts['unknown']}, BG={tri.counts['bg']}")
 
         model = get_mematte_model()
 
         from torchvision.transforms import functional as TF
-        import torch
-
-        # 입력 준비: image(3ch) + trimap(1ch) → 4ch tensor
-        img_tensor = TF.to_tensor(image)  # [3, H, W]
-        tri_tensor = TF.to_tensor(trimap_pil)[0:1, :, :]  # [1, H, W]
-
-        data = {
-            'image': img_tensor.unsqueeze(0).to(device),
-            'trimap': tri_tensor.unsqueeze(0).to(device),
-        }
 
-        def _run_mematte():
-            with torch.no_grad():
+        def _run_mematte(image_in: Image.Image, trimap_in: np.ndarray) -> np.ndarray:
+            in_size = image_in.size
+            # 해상도 거버너: ROI 긴 변이 max_size 초과 시 축소 (trimap은 NEAREST로 3값 유지)
+            scale = min(1.0, max_size / max(in_size))
+            if scale < 1.0:
+                proc_size = (max(1, int(in_size[0] * scale)), max(1, int(in_size[1] * scale)))
+                image_in = image_in.resize(proc_size, Image.Resampling.LANCZOS)
+                trimap_in = np.array(Image.fromarray(trimap_in).resize(proc_size, Image.Resampling.NEAREST))
+                print(f"   📐 MEMatte 리사이즈: {in_size[0]}x{in_size[1]} → {proc_size[0]}x{proc_size[1]}")
+            budget = mematte_token_budget(trimap_in)
+            print(f"   🎟️ 토큰 예산: {budget} (unknown {np.count_nonzero(trimap_in == 128)}px)")
+
+            # 입력 준비: image(3ch) + trimap(1ch) → 4ch tensor
+            img_tensor = TF.to_tensor(image_in)  # [3, H, W]
+            tri_tensor = torch.from_numpy(trimap_in).float().div_(255)[None]  # [1, H, W]
+            data = {
+                'image': img_tensor.unsqueeze(0).to(device),
+                'trimap': tri_tensor.unsqueeze(0).to(device),
+            }
+            with mematte_lock, torch.no_grad():
+                if hasattr(model.backbone, "max_number_token"):
+                    model.backbone.max_number_token = budget
                 output, _, _ = model(data, patch_decoder=True)
                 alpha = output['phas'].flatten(0, 2)  # [H, W]
                 # Trimap enforce
-                tri_flat = tri_tensor.squeeze(0).squeeze(0)
+                tri_flat = data['trimap'][0, 0]
                 alpha[tri_flat == 0] = 0
                 alpha[tri_flat == 1] = 1
-                return alpha.cpu()
+                alpha = (alpha.cpu().numpy() * 255).astype(np.uint8)
+            del data, output
+            return np.array(Image.fromarray(alpha).resize(in_size, Image.Resampling.LANCZOS))
 
-        alpha = await asyncio.to_thread(_run_mematte)
+        alpha_np = await run_inference(matte_with_trimap, image, tri, _run_mematte, roi_padding)
 
-        alpha_np = (alpha.numpy() * 255).astype(np.uint8)
-        alpha_pil = Image.fromarray(alpha_np).resize((orig_w, orig_h), Image.Resampling.LANCZOS)
+        def _encode():
+            # RGBA 결과 생성
+            result = image.copy()
+            result.putalpha(Image.fromarray(alpha_np))
 
-        # RGBA 결과 생성
-        result = image.copy()
-        result.putalpha(alpha_pil)
+            # 크롭 (불투명 영역만)
+            bbox = result.getbbox()
+            if bbox:
+                result = result.crop(bbox)
+                print(f"   ✂️ 크롭: ({bbox[0]},{bbox[1]}) 크기({bbox[2]-bbox[0]}, {bbox[3]-bbox[1]})")
 
-        # 크롭 (불투명 영역만)
-        bbox = result.getbbox()
-        if bbox:
-            result = result.crop(bbox)
-            print(f"   ✂️ 크롭: ({bbox[0]},{bbox[1]}) 크기({bbox[2]-bbox[0]}, {bbox[3]-bbox[1]})")
+            buf = io.BytesIO()
+            result.save(buf, format="WEBP", quality=95)
+            return buf
 
-        buf = io.BytesIO()
-        result.save(buf, format="WEBP", quality=95)
-        buf.seek(0)
+        buf = await asyncio.to_thread(_encode)
+        clear_gpu_memory()
 
         elapsed = time.time() - start_time
         print(f"✅ MEMatte 완료! 소요시간: {elapsed:.2f}초")
@@ -2471,20 +4442,25 @@ async def run_mematte(
 # ============================================================
 
 _birefnet_matting_model = None
+BIREFNET_MATTING_HUB = "ZhengPeng7/BiRefNet_HR-matting"
 
-def get_birefnet_matting():
+def get_birefnet_matting(target_device: str = None):
+    """
+    BiRefNet-HR-matting — 로컬 레지스트리(BIREFNET_MODELS["hr-matting"]) 모델 공유 (/remove-bg?model=hr-matting과 동일 인스턴스)
+    로컬 폴더가 없을 때만 Hub에서 로드
+    """
     global _birefnet_matting_model
+    if Path(BIREFNET_MODELS["hr-matting"]).exists():
+        return get_birefnet_model("hr-matting", target_device)
     if _birefnet_matting_model is not None:
         return _birefnet_matting_model
     from transformers import AutoModelForImageSegmentation
-    print("📦 BiRefNet-HR-matting 모델 로딩...")
-    model = AutoModelForImageSegmentation.from_pretrained(
-        "ZhengPeng7/BiRefNet_HR-matting", trust_remote_code=True
-    )
-    model.to(device, dtype=torch.float16)
+    print(f"📦 BiRefNet-HR-matting 모델 로딩... (로컬 없음 → {BIREFNET_MATTING_HUB})")
+    model = AutoModelForImageSegmentation.from_pretrained(BIREFNET_MATTING_HUB, trust_remote_code=True)
+    model.to(device, dtype=torch.float16 if device != "cpu" else torch.float32)
     model.eval()
     _birefnet_matting_model = model
-    print(f"✅ BiRefNet-HR-matting 로딩 완료 ({sum(p.numel() for p in model.parameters()) / 1e6:.1f}M, FP16)")
+    print(f"✅ BiRefNet-HR-matting 로딩 완료 ({sum(p.numel() for p in model.parameters()) / 1e6:.1f}M)")
     return model
 
 
@@ -2492,67 +4468,70 @@ def get_birefnet_matting():
 async def run_birefnet_matting(
     file: UploadFile = File(...),
     resolution: int = Query(default=2048, ge=512, le=4096, description="처리 해상도 (긴 쪽 기준)"),
+    tile: int = Query(default=0, ge=0, le=2048, description="타일 크기 (0=타일 끔 — 기본, resolution 한 번 추론. 처리 해상도가 더 크면 경계 타일만 재추론)"),
+    tile_overlap: int = Query(default=128, ge=0, le=512, description="타일 겹침 (px)"),
 ):
     """
     BiRefNet-HR-matting — trimap 없이 이미지만으로 고품질 알파 매팅.
     머리카락/반투명 경계를 정밀하게 처리.
     """
     print("-" * 40)
-    print(f"🎨 BiRefNet-HR-matting 요청: {file.filename} (resolution={resolution})")
+    print(f"🎨 BiRefNet-HR-matting 요청: {file.filename} (resolution={resolution}, tile={tile})")
     start_time = time.time()
 
     image_data = await file.read()
     try:
-        image = Image.open(io.BytesIO(image_data))
-        image = ImageOps.exif_transpose(image)
-        image = image.convert("RGB")
+        image = await asyncio.to_thread(
+            lambda: ImageOps.exif_transpose(Image.open(io.BytesIO(image_data))).convert("RGB"))
     except Exception:
         raise HTTPException(status_code=400, detail="올바른 이미지 형식이 아닙니다.")
 
-    try:
-        from torchvision import transforms
-
-        model = get_birefnet_matting()
-        orig_w, orig_h = image.size
-
-        # 해상도 조정
-        scale = min(resolution / max(orig_w, orig_h), 1.0)
-        proc_w = int(orig_w * scale)
-        proc_h = int(orig_h * scale)
-        # 32배수 정렬
-        proc_w = (proc_w + 31) // 32 * 32
-        proc_h = (proc_h + 31) // 32 * 32
-
-        transform = transforms.Compose([
-            transforms.Resize((proc_h, proc_w)),
-            transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-        ])
-        input_tensor = transform(image).unsqueeze(0).to(device, dtype=torch.float16)
-
-        with torch.no_grad():
-            preds = model(input_tensor)[-1].sigmoid()
-
-        alpha = preds[0, 0].cpu().float().numpy()
-        alpha = (alpha * 255).astype(np.uint8)
+    orig_w, orig_h = image.size
+
+    # 해상도 조정 (32배수 정렬)
+    scale = min(resolution / max(orig_w, orig_h), 1.0)
+    proc_w = (int(orig_w * scale) + 31) // 32 * 32
+    proc_h = (int(orig_h * scale) + 31) // 32 * 32
+    tile = (tile + 31) // 32 * 32  # 32배수로 올림 (1~31이 0=타일 끔이 되지 않도록)
+
+    def _infer() -> np.ndarray:
+        # 복제본 선택은 /remove-bg?model=hr-matting 과 같은 스케줄러 공유
+        bucket_key = f"tile{tile}" if tile and tile < max(proc_w, proc_h) else f"{proc_w}x{proc_h}"
+        target_device = replica_scheduler.acquire("hr-matting", birefnet_devices("hr-matting"), bucket_key)
+        warm = birefnet_replica_key("hr-matting", target_device) in loaded_models
+        infer_start = time.time()
+        elapsed = None
+        try:
+            model = get_birefnet_matting(target_device)
+            param = next(model.parameters())
+            input_tensor = transform_normalize(image.resize((proc_w, proc_h), Image.Resampling.LANCZOS))
+            input_tensor = input_tensor.unsqueeze(0).to(param.device, dtype=param.dtype)
+            alpha = birefnet_tiled(model, input_tensor, tile, tile_overlap)
+            elapsed = time.time() - infer_start
+        finally:
+            replica_scheduler.release("hr-matting", target_device, bucket_key, elapsed if warm else None)
+        del input_tensor
+        if param.device.type == "cuda":
+            torch.cuda.empty_cache()
+        return (alpha.numpy() * 255).astype(np.uint8)
 
-        del input_tensor, preds
-        torch.cuda.empty_cache()
+    try:
+        alpha = await run_inference(_infer)
 
-        # 원본 크기로 복원
-        alpha_img = Image.fromarray(alpha).resize((orig_w, orig_h), Image.Resampling.LANCZOS)
+        def _encode():
+            # 원본 크기로 복원 → RGBA 합성
+            alpha_img = Image.fromarray(alpha).resize((orig_w, orig_h), Image.Resampling.LANCZOS)
+            result = image.copy()
+            result.putalpha(alpha_img)
+            buf = io.BytesIO()
+            result.save(buf, format="WEBP", quality=95, lossless=False)
+            return buf.getvalue()
 
-        # RGBA 합성
-        result = image.copy()
-        result.putalpha(alpha_img)
+        content = await asyncio.to_thread(_encode)
 
         elapsed = time.time() - start_time
         print(f"✅ BiRefNet-HR-matting 완료: {orig_w}x{orig_h} → {proc_w}x{proc_h} | {elapsed:.2f}초")
-
-        buf = io.BytesIO()
-        result.save(buf, format="WEBP", quality=95, lossless=False)
-        buf.seek(0)
-        return Response(content=buf.getvalue(), media_type="image/webp")
+        return Response(content=content, media_type="image/webp")
 
     except Exception as e:
         clear_gpu_memory()
@@ -2566,10 +4545,95 @@ async def run_birefnet_matting(
 # ============================================================
 
 _diffmatte_model = None
+_diffmatte_cfg = None
+_diffmatte_schedules = {}  # steps → diffusion 인스턴스 (스케줄만 보유, 가중치 없음)
+diffmatte_lock = threading.Lock()  # 요청마다 스케줄 교체 + 단계 훅 설치 → 추론은 한 번에 하나
 DIFFMATTE_DIR = r"C:\Documents and Settings\connect\automation-prototype\DiffMatte"
+DIFFMATTE_DEFAULT_STEPS = int(os.environ.get("DIFFMATTE_STEPS", 10))
+# 샘플링 루프가 매 단계 호출하는 디노이저 서브모듈 (조기 종료/취소 훅 설치 위치) — DiffMatte 샘플러 구조에 대한 추정, 미검증
+DIFFMATTE_STEP_MODULE = os.environ.get("DIFFMATTE_STEP_MODULE", "model.decoder")
+# 디노이저 출력 값 공간 (스케줄이 알파를 다루는 공간): signed=[-1, 1] (DDIM x0 예측), unit=[0, 1]
+DIFFMATTE_STEP_SPACE = os.environ.get("DIFFMATTE_STEP_SPACE", "signed")
+
+
+class DiffMatteStop(Exception):
+    """샘플링 루프 중단 (조기 수렴 또는 클라이언트 취소) — 마지막 단계 예측 보유"""
+
+    def __init__(self, alpha, step: int, cancelled: bool = False):
+        super().__init__("cancelled" if cancelled else "converged")
+        self.alpha = alpha
+        self.step = step
+        self.cancelled = cancelled
+
+
+def diffmatte_schedule(steps: int):
+    """steps 단계 DDIM 스케줄 (steps별 1회 생성 후 재사용)"""
+    if steps not in _diffmatte_schedules:
+        from detectron2.config import instantiate
+        _diffmatte_cfg.diffusion.steps = steps
+        schedule = instantiate(_diffmatte_cfg.diffusion)
+        # 로드 시 스케줄은 difmatte.to(device)로 옮겨짐 → 새 스케줄도 같은 디바이스로 (버퍼 보유 시 디바이스 혼용 방지)
+        if isinstance(schedule, torch.nn.Module):
+            schedule = schedule.to(device)
+        _diffmatte_schedules[steps] = schedule
+    return _diffmatte_schedules[steps]
+
+
+def _step_alpha(output) -> torch.Tensor:
+    """디노이저 출력 → [H, W] 알파 예측 (0~1, DIFFMATTE_STEP_SPACE 기준 고정 변환 — 단계마다 같은 매핑)"""
+    if isinstance(output, dict):
+        output = output.get("phas", next(iter(output.values())))
+    elif isinstance(output, (tuple, list)):
+        output = output[0]
+    alpha = output.detach().float()
+    while alpha.dim() > 2:
+        alpha = alpha[0]
+    if DIFFMATTE_STEP_SPACE == "signed":
+        alpha = (alpha + 1) / 2
+    return alpha.clamp_(0, 1)
+
+
+def diffmatte_sample(model, input_data: dict, steps: int, tol: float, cancel: threading.Event):
+    """
+    steps 단계 스케줄로 DiffMatte 실행.
+    단계 간 알파 평균 변화량이 tol 미만이거나 cancel 설정 시 DiffMatteStop 발생 (마지막 예측 포함).
+    디노이저 서브모듈이 없으면 조기 종료 없이 전체 단계 실행 (취소는 시작 전에만 확인).
+    디노이저 출력이 trimap보다 작으면 (저해상도 예측) 조기 종료를 끄고 전체 단계 실행.
+    """
+    try:
+        step_module = model.get_submodule(DIFFMATTE_STEP_MODULE)
+    except AttributeError:
+        step_module = None
+    trimap_hw = tuple(input_data["trimap"].shape[-2:])
+    state = {"prev": None, "step": 0, "tol": tol}
+
+    def _hook(_module, _inputs, output):
+        state["step"] += 1
+        alpha = _step_alpha(output)
+        if cancel.is_set():
+            raise DiffMatteStop(alpha, state["step"], cancelled=True)
+        if state["tol"] > 0 and (alpha.shape[0] < trimap_hw[0] or alpha.shape[1] < trimap_hw[1]):
+            print(f"   ⚠️ 디노이저 출력 {tuple(alpha.shape)} < trimap {trimap_hw} — 조기 종료 비활성")
+            state["tol"] = 0
+        prev, state["prev"] = state["prev"], alpha
+        if state["tol"] > 0 and prev is not None and state["step"] < steps and (alpha - prev).abs().mean().item() < state["tol"]:
+            raise DiffMatteStop(alpha, state["step"])
+
+    with diffmatte_lock:
+        if cancel.is_set():
+            raise DiffMatteStop(None, 0, cancelled=True)
+        model.diffusion = diffmatte_schedule(steps)
+        handle = step_module.register_forward_hook(_hook) if step_module is not None else None
+        try:
+            with torch.no_grad():
+                return model(input_data), state["step"]
+        finally:
+            if handle is not None:
+                handle.remove()
+
 
 def get_diffmatte():
-    global _diffmatte_model
+    global _diffmatte_model, _diffmatte_cfg
     if _diffmatte_model is not None:
         return _diffmatte_model
 
@@ -2583,7 +4647,7 @@ def get_diffmatte():
 
     config_path = os.path.join(DIFFMATTE_DIR, "configs", "ViTB.py")
     checkpoint_path = os.path.join(DIFFMATTE_DIR, "checkpoints", "DiffMatte-ViTB.pth")
-    sample_strategy = "ddim10"
+    sample_strategy = f"ddim{DIFFMATTE_DEFAULT_STEPS}"
 
     print(f"📦 DiffMatte-ViTB 모델 로딩... ({checkpoint_path})")
     cfg = LazyConfig.load(config_path)
@@ -2600,6 +4664,12 @@ def get_diffmatte():
     difmatte.eval()
     DetectionCheckpointer(difmatte).load(checkpoint_path)
 
+    _diffmatte_cfg = cfg
+    _diffmatte_schedules[cfg.diffusion.steps] = diffusion
+    try:
+        difmatte.get_submodule(DIFFMATTE_STEP_MODULE)
+    except AttributeError:
+        print(f"   ⚠️ 디노이저 '{DIFFMATTE_STEP_MODULE}' 없음 — 조기 종료 비활성 (DIFFMATTE_STEP_MODULE로 지정)")
     _diffmatte_model = difmatte
     print(f"✅ DiffMatte-ViTB 로딩 완료 (FP32, max_size로 VRAM 관리)")
     return difmatte
@@ -2607,127 +4677,152 @@ def get_diffmatte():
 
 @app.post("/diffmatte")
 async def run_diffmatte(
+    request: Request,
     file: UploadFile = File(...),
     mask: UploadFile = File(...),
     erode_size: int = Query(default=10, ge=1, le=50),
     dilate_size: int = Query(default=20, ge=1, le=100),
     max_size: int = Query(default=1024, ge=256, le=2048, description="처리 해상도 (긴 쪽 기준). ViT 어텐션 특성상 큰 이미지는 OOM 위험"),
+    trimap_scale: float = Query(default=1.0, ge=0.1, le=1.0, description="Trimap 계산 해상도 비율 (1=처리 해상도)"),
+    roi_padding: float = Query(default=0.1, ge=0.0, le=1.0, description="unknown 영역 ROI 패딩 비율"),
+    steps: int = Query(default=DIFFMATTE_DEFAULT_STEPS, ge=1, le=50, description="DDIM 샘플링 단계 수 (최대)"),
+    early_stop_tol: float = Query(default=0.0, ge=0.0, le=0.1, description="단계 간 알파 평균 변화량이 이 값 미만이면 조기 종료 (0=끔, 기본). 실험 기능 — 단계 훅 위치(DIFFMATTE_STEP_MODULE)와 출력 값 공간(DIFFMATTE_STEP_SPACE)은 외부 샘플러 구현에 대한 추정이며 검증되지 않음. 조기 종료 결과는 모델 자체 후처리 대신 패딩 제거 + trimap 확정 영역만 적용"),
 ):
     """
     DiffMatte — Diffusion 기반 매팅 (ECCV 2024, Composition-1k SOTA급).
     trimap이 필요합니다 (mask에서 자동 생성).
+    추론은 공용 실행기에서 실행되며, 클라이언트 연결이 끊기면 다음 단계에서 중단됩니다.
     """
     print("-" * 40)
-    print(f"🎨 DiffMatte 요청: {file.filename} (erode={erode_size}, dilate={dilate_size}, max_size={max_size})")
+    print(f"🎨 DiffMatte 요청: {file.filename} (erode={erode_size}, dilate={dilate_size}, max_size={max_size}, "
+          f"steps={steps}, tol={early_stop_tol})")
     start_time = time.time()
 
     image_data = await file.read()
     mask_data = await mask.read()
 
     try:
-        image = Image.open(io.BytesIO(image_data))
-        image = ImageOps.exif_transpose(image)
-        image = image.convert("RGB")
+        orig_image = await asyncio.to_thread(
+            lambda: ImageOps.exif_transpose(Image.open(io.BytesIO(image_data))).convert("RGB"))
     except Exception:
         raise HTTPException(status_code=400, detail="올바른 이미지 형식이 아닙니다.")
 
-    orig_size = image.size  # (W, H) — 출력은 원본 크기로 복원
+    orig_size = orig_image.size  # (W, H) — 출력은 원본 크기로 복원
 
     try:
         mask_img = Image.open(io.BytesIO(mask_data)).convert("L")
-        if mask_img.size != image.size:
-            mask_img = mask_img.resize(image.size, Image.Resampling.LANCZOS)
+        if mask_img.size != orig_size:
+            mask_img = mask_img.resize(orig_size, Image.Resampling.LANCZOS)
     except Exception:
         raise HTTPException(status_code=400, detail="올바른 마스크 형식이 아닙니다.")
 
-    # 리사이즈 (ViT 어텐션 O(n²) 때문에 VRAM 절약 필수)
-    w, h = image.size
-    if max(w, h) > max_size:
-        scale = max_size / max(w, h)
-        new_w, new_h = int(w * scale), int(h * scale)
-        image = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        mask_img = mask_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        print(f"   리사이즈: {w}x{h} → {new_w}x{new_h}")
-
+    cancel = threading.Event()
+    watcher = asyncio.create_task(watch_disconnect(request, cancel))
     try:
-        import cv2
+        def _prepare():
+            # 리사이즈 (ViT 어텐션 O(n²) 때문에 VRAM 절약 필수) + Trimap 생성 (처리 해상도 기준)
+            image, mask_work = orig_image, mask_img
+            w, h = image.size
+            if max(w, h) > max_size:
+                scale = max_size / max(w, h)
+                new_w, new_h = int(w * scale), int(h * scale)
+                image = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                mask_work = mask_work.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                print(f"   리사이즈: {w}x{h} → {new_w}x{new_h}")
+            return image, build_trimap(np.array(mask_work), erode_size, dilate_size, trimap_scale)
+
+        image, tri = await asyncio.to_thread(_prepare)
+        print(f"   Trimap 생성: FG={tri.counts['fg']}, Unknown={tri.counts['unknown']}, BG={tri.counts['bg']}")
+
         from torchvision.transforms import functional as TF
 
         model = get_diffmatte()
 
-        # Trimap 생성
-        mask_np = np.array(mask_img)
-        kernel_e = np.ones((erode_size, erode_size), np.uint8)
-        kernel_d = np.ones((dilate_size, dilate_size), np.uint8)
-        fg = cv2.erode(mask_np, kernel_e, iterations=1)
-        dilated = cv2.dilate(mask_np, kernel_d, iterations=1)
-
-        trimap_np = np.zeros_like(mask_np, dtype=np.uint8)
-        trimap_np[fg > 128] = 255
-        trimap_np[(dilated > 128) & (fg <= 128)] = 128
+        def _run_diffmatte(image_in: Image.Image, trimap_in: np.ndarray) -> np.ndarray:
+            # 텐서 변환 — trimap은 이미 0 / 128 / 255 세 값 → 0 / 0.5 / 1
+            image_tensor = TF.to_tensor(image_in).unsqueeze(0)
+            trimap_tensor = torch.from_numpy(
+                np.select([trimap_in == 255, trimap_in == 128], [1.0, 0.5], 0.0).astype(np.float32)
+            )[None, None]
 
-        # 텐서 변환
-        image_tensor = TF.to_tensor(image).unsqueeze(0)
-        trimap_tensor = TF.to_tensor(Image.fromarray(trimap_np).convert("L")).unsqueeze(0)
+            input_data = {"image": image_tensor.to(device), "trimap": trimap_tensor.to(device)}
 
-        # trimap을 3단계 값으로 정규화
-        trimap_tensor[trimap_tensor > 0.9] = 1.0
-        trimap_tensor[(trimap_tensor >= 0.1) & (trimap_tensor <= 0.9)] = 0.5
-        trimap_tensor[trimap_tensor < 0.1] = 0.0
-
-        input_data = {"image": image_tensor.to(device), "trimap": trimap_tensor.to(device)}
-
-        print(f"   추론 시작 (입력: {image_tensor.shape})")
-        with torch.no_grad():
-            output = model(input_data)
-
-        # GPU 텐서 정리
-        del input_data, image_tensor, trimap_tensor
-        torch.cuda.empty_cache()
-
-        print(f"   추론 완료, 출력 타입: {type(output)}, shape: {getattr(output, 'shape', 'N/A')}")
+            print(f"   추론 시작 (입력: {image_tensor.shape})")
+            try:
+                output, ran = diffmatte_sample(model, input_data, steps, early_stop_tol, cancel)
+                print(f"   ↳ {ran or steps}/{steps}단계 완료")
+            except DiffMatteStop as stop:
+                if stop.cancelled:
+                    raise
+                # 조기 수렴: 마지막 단계 예측 (패딩 제거 + trimap 확정 영역 적용 — 모델의 최종 후처리는 거치지 않음)
+                print(f"   ⏩ 조기 종료: {stop.step}/{steps}단계 (변화량 < {early_stop_tol})")
+                h, w = trimap_in.shape
+                output = stop.alpha[:h, :w].cpu().numpy()
+                output[trimap_in == 255] = 1.0
+                output[trimap_in == 0] = 0.0
+            finally:
+                # GPU 텐서 정리
+                del input_data, image_tensor, trimap_tensor
+                if device == "cuda":
+                    torch.cuda.empty_cache()
+
+            # output은 numpy array (H, W) values 0-255
+            if isinstance(output, np.ndarray):
+                alpha_out = output
+            elif hasattr(output, 'cpu'):
+                alpha_out = output.cpu().float().numpy()
+            else:
+                alpha_out = np.array(output)
 
-        # output은 numpy array (H, W) values 0-255
-        if isinstance(output, np.ndarray):
-            alpha_np = output
-        elif hasattr(output, 'cpu'):
-            alpha_np = output.cpu().float().numpy()
-        else:
-            alpha_np = np.array(output)
+            if alpha_out.ndim == 3:
+                alpha_out = alpha_out[0] if alpha_out.shape[0] == 1 else alpha_out.squeeze()
 
-        if alpha_np.ndim == 3:
-            alpha_np = alpha_np[0] if alpha_np.shape[0] == 1 else alpha_np.squeeze()
+            if alpha_out.max() <= 1.0:
+                return np.clip(alpha_out * 255, 0, 255).astype(np.uint8)
+            return np.clip(alpha_out, 0, 255).astype(np.uint8)
 
-        if alpha_np.max() <= 1.0:
-            alpha_np = np.clip(alpha_np * 255, 0, 255).astype(np.uint8)
-        else:
-            alpha_np = np.clip(alpha_np, 0, 255).astype(np.uint8)
+        alpha_np = await run_inference(matte_with_trimap, image, tri, _run_diffmatte, roi_padding)
 
-        # 원본 크기로 alpha 복원
-        alpha_img = Image.fromarray(alpha_np)
-        if alpha_img.size != orig_size:
-            alpha_img = alpha_img.resize(orig_size, Image.Resampling.LANCZOS)
+        def _encode():
+            # 원본 크기로 alpha 복원 → 이미 디코드한 원본 이미지에 합성
+            alpha_img = Image.fromarray(alpha_np)
+            if alpha_img.size != orig_size:
+                alpha_img = alpha_img.resize(orig_size, Image.Resampling.LANCZOS)
+            result = orig_image.copy()
+            result.putalpha(alpha_img)
+            buf = io.BytesIO()
+            result.save(buf, format="WEBP", quality=95, lossless=False)
+            return buf.getvalue()
 
-        # RGBA 합성 (원본 크기 이미지 사용)
-        orig_image = Image.open(io.BytesIO(image_data))
-        orig_image = ImageOps.exif_transpose(orig_image).convert("RGB")
-        result = orig_image.copy()
-        result.putalpha(alpha_img)
+        content = await asyncio.to_thread(_encode)
 
         elapsed = time.time() - start_time
         print(f"✅ DiffMatte 완료: {orig_size[0]}x{orig_size[1]} (처리: {image.size[0]}x{image.size[1]}) | {elapsed:.2f}초")
+        return Response(content=content, media_type="image/webp")
 
-        buf = io.BytesIO()
-        result.save(buf, format="WEBP", quality=95, lossless=False)
-        buf.seek(0)
-        return Response(content=buf.getvalue(), media_type="image/webp")
-
+    except DiffMatteStop:
+        clear_gpu_memory()
+        print(f"🚫 DiffMatte 취소: 클라이언트 연결 종료 ({time.time() - start_time:.2f}초)")
+        return Response(status_code=499)
     except Exception as e:
         clear_gpu_memory()
         print(f"❌ DiffMatte 오류: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"DiffMatte 오류: {str(e)}")
+    finally:
+        cancel.set()
+        watcher.cancel()
+
 
+def print_import_profile():
+    """부팅 임포트/로드 비용 요약 출력"""
+    total = time.perf_counter() - _boot_start
+    print(f"⏱️ 부팅 프로파일 (총 {total:.2f}초):")
+    for name, seconds in sorted(import_profile.items(), key=lambda kv: -kv[1]):
+        print(f"   {name:<22} {seconds:6.2f}초")
+
+print_import_profile()
+BOOT_SECONDS = time.perf_counter() - _boot_start
 
 @app.get("/health")
 async def health_check():
@@ -2738,16 +4833,148 @@ async def health_check():
         "dtype": str(dtype),
         "ryan_engine": RYAN_ENGINE_AVAILABLE,
         "loaded_models": list(loaded_models.keys()) + (["ben2"] if ben2_model is not None else []) + (["sam2"] if sam2_predictor is not None else []) + (["sam2_amg"] if sam2_mask_generator is not None else []) + (["mematte"] if mematte_model is not None else []),
+        "warm_detectors": [name for name, m in (("gdino", gdino_model), ("mmdino", mmdino_model), ("gdino-base", gdino_base_model), ("florence2", florence2_model)) if m is not None] + list(_vitpose_cache.keys()),
+        "in_flight": in_flight,
+        "requests_served": requests_served,
         "sam2_available": SAM2_AVAILABLE,
         "gdino_available": GDINO_AVAILABLE,
+        "dino_text_cache": dino_text_cache_stats(),
+        "sam2": sam2_memory_report(),
+        "model_precision": model_precision_applied,
+        "birefnet_buckets": birefnet_bucket_report(),
+        "birefnet_replicas": replica_scheduler.report(),
+        "pose_batching": pose_batch_report(),
+        "boot_seconds": round(BOOT_SECONDS, 3),
+        "process": process_memory(),
+        "role": SERVER_ROLE,
+        "inference_pool": inference_pool.status() if inference_pool is not None else None,
+        "import_profile": {k: round(v, 3) for k, v in import_profile.items()},
         "vitmatte_available": VITMATTE_AVAILABLE
     })
 
+def process_memory(pid="self") -> dict:
+    """프로세스 메모리 (MB): RSS, PSS(공유 페이지 비례 배분), 공유 페이지 — Linux /proc 기준"""
+    info = {"pid": os.getpid() if pid == "self" else pid}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    info[key.lower()] = int(rest.split()[0]) / 1024
+        info["shared"] = info.pop("shared_clean", 0) + info.pop("shared_dirty", 0)
+        return {k: round(v, 1) if isinstance(v, float) else v for k, v in info.items()}
+    except OSError:
+        pass
+    try:
+        import resource
+        # 최대 RSS (Linux: KB, macOS: bytes)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        info["rss_peak"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    return info
+
+def _loaded_torch_modules():
+    """현재 로드된 모든 torch 모델 (fork 전 공유 메모리 이동용)"""
+    mods = list(loaded_models.values())
+    for m in (ben2_model, gdino_model, mmdino_model, gdino_base_model, florence2_model, vitmatte_model):
+        if m is not None:
+            mods.append(m)
+    mods.extend(m for m, _ in _vitpose_cache.values())
+    return [m for m in mods if isinstance(m, torch.nn.Module)]
+
+def run_prefork(host: str, port: int, workers: int, **uvicorn_kwargs):
+    """
+    Pre-fork 모드: 마스터에서 모델 로드/워밍업(모듈 임포트 시 완료) 후 워커를 fork.
+    가중치는 공유 메모리로 옮겨 워커 간 copy-on-write 공유 → 워커 수만큼 RAM이 늘지 않음.
+    CPU 디바이스 + fork 지원 OS(Linux/macOS)에서만 사용 가능.
+    """
+    import socket
+    import signal
+    import uvicorn
+
+    # 워커당 intra-op 스레드 = 코어 / 워커 (과구독 방지)
+    threads = int(os.environ.get("PREFORK_THREADS", max(1, (os.cpu_count() or 1) // workers)))
+    memlog_sec = int(os.environ.get("PREFORK_MEMLOG_SEC", 300))
+
+    shared = 0
+    for m in _loaded_torch_modules():
+        for t in list(m.parameters()) + list(m.buffers()):
+            if t.device.type == "cpu" and not t.is_shared():
+                t.share_memory_()
+                shared += t.numel() * t.element_size()
+    print(f"🧬 Pre-fork: 가중치 {shared / 1e6:.0f}MB 공유 메모리로 이동, 워커 {workers}개 × 스레드 {threads}")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # 이후 생성 객체만 GC 대상 → 워커에서 GC가 공유 페이지(객체 헤더)를 건드리지 않음
+    gc.collect()
+    gc.freeze()
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            torch.set_num_threads(threads)
+            config = uvicorn.Config(app, **uvicorn_kwargs)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        print(f"   ↳ 워커 {slot} 시작 (pid {pid})")
+        return pid
+
+    children = {spawn(i): i for i in range(workers)}
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    last_memlog = 0.0
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            slot = children.pop(pid)
+            if not stopping:
+                print(f"⚠️ 워커 {slot} 종료 (pid {pid}, status {status}) — 재시작")
+                children[spawn(slot)] = slot
+            continue
+        if memlog_sec and time.time() - last_memlog > memlog_sec:
+            last_memlog = time.time()
+            for cpid, slot in sorted(children.items(), key=lambda kv: kv[1]):
+                mem = process_memory(cpid)
+                print(f"🧠 워커 {slot} (pid {cpid}): RSS {mem.get('rss', '?')}MB, PSS {mem.get('pss', '?')}MB, 공유 {mem.get('shared', '?')}MB")
+        time.sleep(1)
+    sock.close()
+    print("👋 Pre-fork 서버 종료")
+
 if __name__ == "__main__":
     import uvicorn
     import os
     port = int(os.environ.get("PORT", 5001))
     workers = int(os.environ.get("WORKERS", 1))
-    uvicorn.run("server:app", host="0.0.0.0", port=port, workers=workers,
-                h11_max_incomplete_event_size=1024*1024,
-                timeout_keep_alive=120)
\ No newline at end of file
+    uvicorn_kwargs = dict(h11_max_incomplete_event_size=1024*1024, timeout_keep_alive=120)
+    if os.environ.get("PREFORK", "0") == "1" and workers > 1:
+        if not hasattr(os, "fork"):
+            print("⚠️ PREFORK: 이 OS는 fork 미지원 (Windows) — 일반 멀티 워커 모드로 실행")
+        elif device != "cpu":
+            print(f"⚠️ PREFORK: {device} 컨텍스트는 fork 후 공유 불가 — 일반 멀티 워커 모드로 실행")
+        else:
+            run_prefork("0.0.0.0", port, workers, **uvicorn_kwargs)
+            sys.exit(0)
+    uvicorn.run("server:app", host="0.0.0.0", port=port, workers=workers, **uvicorn_kwargs)
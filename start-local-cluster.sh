@@ -0,0 +1,58 @@
+#!/bin/bash
+
+# 로컬 멀티 노드 테스트: CPU 전용 server.py 노드 N개 + 라우터 (포트 5001)
+# 사용법: ./start-local-cluster.sh [노드 수=2]
+# 노드 포트: 5101, 5102, ... / 노드별 사전 로드 모델은 NODE_PRELOAD (기본 portrait)
+
+cd "$(dirname "$0")"
+
+N=${1:-2}
+NODE_PRELOAD=${NODE_PRELOAD:-portrait}
+NODES=""
+PIDS=""
+
+echo "🧪 로컬 클러스터 시작 (노드 ${N}개, CPU 전용)"
+echo "================================"
+
+for i in $(seq 1 $N); do
+  PORT=$((5100 + i))
+  echo "🤖 노드 ${i} 시작 중 (포트 ${PORT})..."
+  FORCE_CPU=1 PORT=$PORT PRELOAD_MODELS="$NODE_PRELOAD" SERVER_LOG="./output/node-${PORT}.log" \
+    python3 -c "
+import os, uvicorn
+from server import app
+uvicorn.run(app, host='127.0.0.1', port=int(os.environ['PORT']))
+" &
+  PIDS="$PIDS $!"
+  NODES="${NODES:+$NODES,}http://127.0.0.1:${PORT}"
+done
+
+# 노드 준비 대기 (/health 응답 시까지, 노드당 최대 300초)
+echo ""
+echo "⏳ 노드 모델 로딩 중..."
+for i in $(seq 1 $N); do
+  PORT=$((5100 + i))
+  for t in $(seq 1 300); do
+    if curl -s -o /dev/null "http://127.0.0.1:${PORT}/health"; then
+      echo "   ↳ 노드 ${i} 준비 완료 (${t}초)"
+      break
+    fi
+    sleep 1
+  done
+done
+
+echo "🧭 라우터 시작 중 (포트 5001 → ${NODES})..."
+ROUTER_NODES="$NODES" PORT=5001 python3 router.py &
+PIDS="$PIDS $!"
+
+echo ""
+echo "================================"
+echo "✅ 클러스터 실행 완료!"
+echo "🧭 라우터:     http://localhost:5001"
+echo "📋 노드 상태:  http://localhost:5001/router/status"
+echo "종료하려면 Ctrl+C를 누르세요"
+echo "================================"
+
+trap "echo ''; echo '클러스터 종료 중...'; kill $PIDS 2>/dev/null; echo '👋 종료 완료'; exit 0" SIGINT SIGTERM
+
+wait
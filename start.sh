@@ -33,10 +33,20 @@ echo "📚 라이언북 클라이언트 시작 중 (포트 8081)..."
 python3 -m http.server 8081 &
 WEB2_PID=$!
 
-# 모델 로딩 대기
+# 모델 로딩 대기 (/health 응답 시까지, 최대 300초)
 echo ""
-echo "⏳ AI 모델 로딩 중... (약 10초)"
-sleep 12
+echo "⏳ AI 모델 로딩 중... (/health 응답 대기)"
+for i in $(seq 1 300); do
+  if curl -s -o /dev/null "http://localhost:5001/health"; then
+    echo "   ↳ ${i}초 만에 준비 완료"
+    break
+  fi
+  if ! kill -0 $AI_PID 2>/dev/null; then
+    echo "❌ AI 서버가 종료되었습니다. 로그를 확인하세요."
+    break
+  fi
+  sleep 1
+done
 
 echo ""
 echo "================================"